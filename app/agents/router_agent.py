@@ -1,9 +1,16 @@
 import os
-from langchain_community.llms import Ollama
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from langchain.chains import LLMChain
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from enum import Enum
-from app.utils.prompts import ROUTER_PROMPT
+from app.utils.json_stream import ParseCounter, extract_json
+from app.utils.llm import get_llm
+from app.utils.metrics import span
+from app.tools.summary_tool import SummaryToolOutput
+from app.utils.prompts import ROUTER_PROMPT, ROUTER_EXAMPLES, ROUTE_AND_SUMMARIZE_PROMPT
 
 class ToolType(str, Enum):
     QA = "qa"
@@ -17,16 +24,62 @@ class RouterOutput(BaseModel):
     tool: ToolType = Field(description="The tool to use")
     reasoning: str = Field(description="The reasoning for choosing this tool")
     reformulated_query: str = Field(description="The query reformulated for the chosen tool")
+    summary: Optional[SummaryToolOutput] = Field(
+        default=None, description="Structured summary, when routing and summarizing ran in one pass"
+    )
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize vectors along the last axis."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _reformulated(tool: ToolType, parsed_result: Optional[dict], query: str) -> str:
+    """The query for the chosen tool.
+
+    Issue reports are never echoed back by the LLM: a long report would not
+    fit in the router's ``num_predict`` budget, so the summary tool always
+    gets the user's own text.
+    """
+    if tool == ToolType.SUMMARY:
+        return f"Summarize: {query}"
+    if parsed_result is None:
+        return query
+    return str(parsed_result.get("reformulated_query") or query)
+
+class QueryClassifier:
+    """Nearest-centroid classifier over labelled example queries."""
+
+    def __init__(self, embeddings, examples: Dict[str, list] = ROUTER_EXAMPLES):
+        self.embeddings = embeddings
+        self.labels = [ToolType(label) for label in examples]
+
+        # Embed all examples in a single batch, then average per label
+        texts = [text for label in examples for text in examples[label]]
+        vectors = _normalize(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+
+        centroids = []
+        offset = 0
+        for label in examples:
+            count = len(examples[label])
+            centroids.append(vectors[offset:offset + count].mean(axis=0))
+            offset += count
+        self.centroids = _normalize(np.stack(centroids))
+
+    def classify(self, query: str, vector: Optional[np.ndarray] = None) -> Tuple[ToolType, float]:
+        """Return the closest tool and the margin over the runner-up as confidence."""
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+        vector = _normalize(np.asarray(vector, dtype=np.float32))
+        scores = self.centroids @ vector
+        order = np.argsort(scores)[::-1]
+        confidence = float(scores[order[0]] - scores[order[1]])
+        return self.labels[order[0]], confidence
     
 class RouterAgent:
-    def __init__(self):
-        OLLAMA_API_BASE_URL = os.getenv("OLLAMA_API_BASE_URL", "http://localhost:11434")
-        
-        self.llm = Ollama(
-            base_url=OLLAMA_API_BASE_URL,
-            model="mistral:7b",  
-            temperature=0
-        )
+    def __init__(self, embeddings=None, fast_path_threshold: Optional[float] = None,
+                 combined_summary: Optional[bool] = None):
+        # Shared, pooled Ollama client (see app/utils/llm.py), constrained to JSON output
+        self.llm = get_llm(format="json", num_predict=int(os.getenv("ROUTER_NUM_PREDICT", "256")))
         
         # Initialize the prompt template
         self.router_prompt = ROUTER_PROMPT
@@ -35,30 +88,147 @@ class RouterAgent:
             llm=self.llm,
             prompt=self.router_prompt
         )
+
+        # Optional single-pass mode: one generation routes and summarizes issue reports
+        if combined_summary is None:
+            combined_summary = os.getenv("ROUTER_COMBINED_SUMMARY", "false").lower() in ("1", "true", "yes")
+        self.combined_summary = combined_summary
+        self.combined_chain = LLMChain(
+            llm=get_llm(format="json", num_predict=int(os.getenv("SUMMARY_NUM_PREDICT", "512"))),
+            prompt=ROUTE_AND_SUMMARIZE_PROMPT
+        )
+
+        # Optional local classifier that skips the LLM for obvious queries
+        if fast_path_threshold is None:
+            fast_path_threshold = float(os.getenv("ROUTER_FAST_PATH_THRESHOLD", "0.15"))
+        self.fast_path_threshold = fast_path_threshold
+        self.classifier = QueryClassifier(embeddings) if embeddings is not None else None
+
+        # How often each routing path was taken, and how often LLM output failed to parse
+        self.path_counts = Counter()
+        self.parse_counter = ParseCounter()
         
     def route(self, input_data: RouterInput) -> RouterOutput:
         """Route the query to the appropriate tool."""
         query = input_data.query
-        result = self.router_chain.run(query=query)
-        
-        # Parse the result
-        import json
+        fast_output = self._fast_route(query)
+        if fast_output is not None:
+            return fast_output
+
+        with span("llm", "router"):
+            if self.combined_summary:
+                combined_output = self._parse_combined(self.combined_chain.run(query=query), query)
+                if combined_output is not None:
+                    return combined_output
+
+            self.path_counts["llm"] += 1
+            result = self.router_chain.run(query=query)
+            return self._parse_result(result, query)
+
+    async def aroute(self, input_data: RouterInput) -> RouterOutput:
+        """Route the query without blocking the event loop on the LLM call."""
+        query = input_data.query
+        fast_output = await asyncio.to_thread(self._fast_route, query)
+        if fast_output is not None:
+            return fast_output
+        return await self.aroute_llm(query)
+
+    def route_fast_batch(self, queries: List[str], vectors: np.ndarray) -> List[Optional[RouterOutput]]:
+        """Fast-path route many queries from precomputed embeddings; None entries need the LLM."""
+        return [self._fast_route(query, vector) for query, vector in zip(queries, vectors)]
+
+    async def aroute_llm(self, query: str) -> RouterOutput:
+        """Route the query with the LLM router, skipping the fast path."""
+        with span("llm", "router"):
+            if self.combined_summary:
+                combined_output = self._parse_combined(await self.combined_chain.arun(query=query), query)
+                if combined_output is not None:
+                    return combined_output
+
+            self.path_counts["llm"] += 1
+            result = await self.router_chain.arun(query=query)
+            return self._parse_result(result, query)
+
+    def stats(self) -> dict:
+        """Return counters for the fast path and LLM routing paths."""
+        return {
+            "fast_path_threshold": self.fast_path_threshold,
+            "classifier_enabled": self.classifier is not None,
+            "combined_summary": self.combined_summary,
+            "paths": dict(self.path_counts),
+            "parsing": self.parse_counter.stats(),
+        }
+
+    def _fast_route(self, query: str, vector: Optional[np.ndarray] = None) -> Optional[RouterOutput]:
+        """Route with the local classifier, or return None to defer to the LLM."""
+        if self.classifier is None:
+            return None
+
+        with span("fast_path", "router"):
+            tool, confidence = self.classifier.classify(query, vector)
+        if confidence < self.fast_path_threshold:
+            self.path_counts["fast_path_miss"] += 1
+            return None
+
+        self.path_counts["fast_path"] += 1
+        self.path_counts[f"fast_path_{tool.value}"] += 1
+        return RouterOutput(
+            tool=tool,
+            reasoning=f"Matched {tool.value} example queries (confidence {confidence:.2f})",
+            reformulated_query=_reformulated(tool, None, query)
+        )
+
+    def _parse_combined(self, result: str, query: str) -> Optional[RouterOutput]:
+        """Parse a single-pass route-and-summarize response.
+
+        Returns None when the response is unusable, so the caller falls back
+        to the two-step route-then-summarize path. A summary route whose
+        summary fails validation is returned without one, so only the summary
+        generation runs again.
+        """
+        parsed_result = extract_json(result)
+        self.parse_counter.record(parsed_result is not None)
+        if parsed_result is None or parsed_result.get("tool") not in [t.value for t in ToolType]:
+            self.path_counts["combined_fallback"] += 1
+            return None
+
+        tool = ToolType(parsed_result["tool"])
+        output = RouterOutput(
+            tool=tool,
+            reasoning=parsed_result.get("reasoning", "No reasoning provided"),
+            reformulated_query=_reformulated(tool, parsed_result, query)
+        )
+        if output.tool != ToolType.SUMMARY:
+            self.path_counts["combined"] += 1
+            return output
+
         try:
-            parsed_result = json.loads(result)
-            tool = parsed_result.get("tool", "unknown")
-            # Validate the tool type
-            if tool not in [t.value for t in ToolType]:
-                tool = "unknown"
-                
-            return RouterOutput(
-                tool=tool,
-                reasoning=parsed_result.get("reasoning", "No reasoning provided"),
-                reformulated_query=parsed_result.get("reformulated_query", query)
-            )
-        except json.JSONDecodeError:
+            output.summary = SummaryToolOutput(**parsed_result["summary"])
+            self.path_counts["combined"] += 1
+        except (KeyError, TypeError, ValidationError):
+            self.path_counts["combined_summary_invalid"] += 1
+        return output
+
+    def _parse_result(self, result: str, query: str) -> RouterOutput:
+        """Parse the raw router response into a RouterOutput."""
+        # Tolerates prose before or after the JSON object
+        parsed_result = extract_json(result)
+        self.parse_counter.record(parsed_result is not None)
+        if parsed_result is None:
             # Fallback if JSON parsing fails
             return RouterOutput(
                 tool="unknown",
                 reasoning="Failed to parse router response",
                 reformulated_query=query
-            )
\ No newline at end of file
+            )
+
+        tool = parsed_result.get("tool", "unknown")
+        # Validate the tool type
+        if tool not in [t.value for t in ToolType]:
+            tool = "unknown"
+
+        return RouterOutput(
+            tool=tool,
+            reasoning=parsed_result.get("reasoning", "No reasoning provided"),
+            reformulated_query=_reformulated(ToolType(tool), parsed_result, query)
+        )
@@ -0,0 +1,227 @@
+"""Batch query processing over JSONL.
+
+Usage:
+    python -m app.batch queries.jsonl > results.jsonl
+    cat queries.jsonl | python -m app.batch --url http://localhost:8000
+
+Each input line is a JSON object such as ``{"id": "q1", "query": "What causes ERR-1042?"}``.
+Results are written as JSONL in completion order, each carrying the input ``id``.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import urllib.request
+from typing import Any, AsyncIterator, Dict, Iterable, List, Literal, Optional
+import numpy as np
+from pydantic import BaseModel, Field, ValidationError
+from app.agents.router_agent import RouterOutput, ToolType
+from app.data.filters import MetadataFilter
+from app.tools.qa_tool import QAToolInput
+from app.tools.summary_tool import SummaryToolInput
+from app.utils.cache import is_cacheable
+
+class BatchQuery(BaseModel):
+    id: Any = Field(default=None, description="Caller-supplied ID echoed back with the result")
+    query: str = Field(description="The user query")
+    nprobe: Optional[int] = Field(default=None, description="Inverted lists to visit on IVF indexes")
+    ef_search: Optional[int] = Field(default=None, description="Search breadth on HNSW indexes")
+    retrieval_mode: Optional[Literal["vector", "bm25", "hybrid", "rerank"]] = Field(
+        default=None, description="Retrieval strategy; defaults to RETRIEVAL_MODE"
+    )
+    filters: Optional[MetadataFilter] = Field(default=None, description="Only retrieve chunks whose metadata matches")
+
+def read_queries(lines: Iterable[str]) -> List[BatchQuery]:
+    """Parse JSONL query records; records without an ``id`` get their line number."""
+    queries = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            query = BatchQuery(**record)
+        except (json.JSONDecodeError, TypeError, ValidationError) as e:
+            raise ValueError(f"line {number}: {e}") from e
+        if not query.query.strip():
+            raise ValueError(f"line {number}: query cannot be empty")
+        if query.id is None:
+            query.id = number
+        queries.append(query)
+    return queries
+
+class BatchProcessor:
+    """Runs many queries with batched embedding, routing and retrieval.
+
+    Queries are embedded, checked against the response cache, fast-path
+    routed and searched ``batch_size`` at a time. Everything that needs the
+    LLM (router fallbacks, answers, summaries) fans out with at most
+    ``concurrency`` calls in flight.
+    """
+
+    def __init__(self, embeddings, router_agent, qa_tool, summary_tool, response_cache=None,
+                 unknown_result: Optional[Dict[str, Any]] = None,
+                 batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.embeddings = embeddings
+        self.router_agent = router_agent
+        self.qa_tool = qa_tool
+        self.summary_tool = summary_tool
+        self.response_cache = response_cache
+        self.unknown_result = unknown_result or {}
+        self.batch_size = batch_size or int(os.getenv("BATCH_SIZE", "32"))
+        self.concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+    async def process(self, queries: List[BatchQuery]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result per query, in completion order."""
+        results: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        async def dispatch():
+            for start in range(0, len(queries), self.batch_size):
+                batch = queries[start:start + self.batch_size]
+                try:
+                    # Embedding, classification and FAISS search are CPU-bound
+                    planned = await asyncio.to_thread(self._plan_batch, batch)
+                except Exception as e:
+                    for query in batch:
+                        results.put_nowait(self._error(query, e))
+                    continue
+                for query, vector, route, documents, cached, version in planned:
+                    if cached is not None:
+                        results.put_nowait(cached)
+                        continue
+                    task = asyncio.create_task(self._complete(query, vector, route, documents, version, semaphore))
+                    task.add_done_callback(lambda t, q=query: self._deliver(t, q, results, tasks))
+                    tasks.add(task)
+
+        dispatcher = asyncio.create_task(dispatch())
+        try:
+            for _ in range(len(queries)):
+                yield await results.get()
+        finally:
+            # Stop outstanding work if the client goes away mid-stream
+            dispatcher.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def _plan_batch(self, batch: List[BatchQuery]) -> List[tuple]:
+        """Embed, cache-check, fast-route and retrieve a batch in one pass each."""
+        texts = [query.query for query in batch]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        cached: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+        # Read before retrieving, so answers that finish after an index swap are not cached
+        version = self.response_cache.version if self.response_cache is not None else None
+        if self.response_cache is not None:
+            for i, query in enumerate(batch):
+                # The cache is keyed on the query alone, so queries with retrieval options bypass it
+                if not is_cacheable(query):
+                    continue
+                hit, _ = self.response_cache.lookup(query.query, vectors[i])
+                if hit is not None:
+                    payload, cache_metadata = hit
+                    cached[i] = {"id": query.id, **payload, "metadata": {"cache": cache_metadata}}
+
+        misses = [i for i in range(len(batch)) if cached[i] is None]
+        routes: List[Optional[RouterOutput]] = [None] * len(batch)
+        for i, route in zip(misses, self.router_agent.route_fast_batch([texts[i] for i in misses], vectors[misses])):
+            routes[i] = route
+
+        # Fast-path QA routes keep the original query, so its embedding can be searched directly
+        qa_positions = [i for i in misses if routes[i] is not None and routes[i].tool == ToolType.QA]
+        documents: List[Optional[List]] = [None] * len(batch)
+        if qa_positions:
+            qa_inputs = [self._qa_input(batch[i], routes[i]) for i in qa_positions]
+            for i, docs in zip(qa_positions, self.qa_tool.retrieve_batch(qa_inputs, vectors[qa_positions])):
+                documents[i] = docs
+
+        return [
+            (query, vectors[i], routes[i], documents[i], cached[i], version)
+            for i, query in enumerate(batch)
+        ]
+
+    async def _complete(self, query: BatchQuery, vector: np.ndarray, route: Optional[RouterOutput],
+                        documents: Optional[List], version: Optional[str],
+                        semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        if route is None:
+            async with semaphore:
+                route = await self.router_agent.aroute_llm(query.query)
+
+        if route.tool == ToolType.QA:
+            qa_input = self._qa_input(query, route)
+            if documents is None:
+                # The LLM router rewrote the query, so the batched search does not apply
+                documents = await self.qa_tool.aretrieve(qa_input)
+            async with semaphore:
+                result = (await self.qa_tool.aanswer(qa_input.query, documents)).dict()
+        elif route.tool == ToolType.SUMMARY and route.summary is not None:
+            result = route.summary.dict()
+        elif route.tool == ToolType.SUMMARY:
+            async with semaphore:
+                result = (await self.summary_tool.arun(SummaryToolInput(issue_text=query.query))).dict()
+        else:
+            result = self.unknown_result
+
+        payload = {
+            "result": result,
+            "tool_used": route.tool.value,
+            "reasoning": route.reasoning
+        }
+        if self.response_cache is not None and route.tool != ToolType.UNKNOWN and is_cacheable(query):
+            await asyncio.to_thread(self.response_cache.store, query.query, payload, vector, version=version)
+        return {"id": query.id, **payload, "metadata": {"cache": {"hit": False}}}
+
+    def _deliver(self, task: asyncio.Task, query: BatchQuery, results: asyncio.Queue, tasks: set):
+        tasks.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            results.put_nowait(self._error(query, task.exception()))
+        else:
+            results.put_nowait(task.result())
+
+    def _qa_input(self, query: BatchQuery, route: RouterOutput) -> QAToolInput:
+        return QAToolInput(
+            query=route.reformulated_query,
+            nprobe=query.nprobe,
+            ef_search=query.ef_search,
+            retrieval_mode=query.retrieval_mode,
+            filters=query.filters
+        )
+
+    def _error(self, query: BatchQuery, error: BaseException) -> Dict[str, Any]:
+        return {"id": query.id, "error": f"{type(error).__name__}: {error}"}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", nargs="?", help="JSONL file of queries (default: stdin)")
+    parser.add_argument("--url", default=os.getenv("ASSISTANT_URL", "http://localhost:8000"),
+                        help="Base URL of the assistant API")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            lines = f.read().splitlines()
+    else:
+        lines = sys.stdin.read().splitlines()
+    try:
+        queries = read_queries(lines)
+    except ValueError as e:
+        parser.error(str(e))
+
+    body = "".join(json.dumps(query.dict()) + "\n" for query in queries).encode("utf-8")
+    request = urllib.request.Request(
+        args.url.rstrip("/") + "/query/batch",
+        data=body,
+        headers={"Content-Type": "application/x-ndjson"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request) as response:
+        for line in response:
+            sys.stdout.write(line.decode("utf-8"))
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
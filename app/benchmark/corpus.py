@@ -0,0 +1,74 @@
+"""Synthetic bug reports, release notes and feedback for benchmarks.
+
+Usage:
+    python -m app.benchmark.corpus /tmp/corpus --documents 500 --paragraphs 8
+"""
+import os
+import random
+import argparse
+from typing import List
+
+COMPONENTS = ["Login", "Dashboard", "Export", "Search", "Billing", "Notifications", "Mobile App",
+              "Reports", "Settings", "Onboarding", "Sync", "Admin Console"]
+SYMPTOMS = ["times out", "crashes on submit", "shows stale data", "fails with a 500 error",
+            "loads slowly", "drops the last page", "logs users out", "ignores the saved filter"]
+CAUSES = ["a missing index on the events table", "an expired cache entry", "a race in the session refresh",
+          "an unhandled null field", "the retry loop in the API client", "a timezone conversion bug"]
+PLATFORMS = ["Safari", "Chrome", "Firefox", "Android", "iOS", "Windows"]
+
+def _paragraph(rng: random.Random, doc_id: int) -> str:
+    component, symptom = rng.choice(COMPONENTS), rng.choice(SYMPTOMS)
+    code = f"ERR-{rng.randint(1000, 9999)}"
+    return (
+        f"Ticket BUG-{doc_id}-{rng.randint(100, 999)}: {component} {symptom} on {rng.choice(PLATFORMS)}. "
+        f"Users see error {code} after {rng.randint(2, 60)} seconds. "
+        f"The root cause was {rng.choice(CAUSES)}. "
+        f"Severity was rated {rng.choice(['Low', 'Medium', 'High', 'Critical'])} and the fix shipped in "
+        f"release {rng.randint(1, 9)}.{rng.randint(0, 20)}."
+    )
+
+def generate_corpus(path: str, documents: int = 100, paragraphs: int = 8, seed: int = 0) -> List[str]:
+    """Write ``documents`` text files of ``paragraphs`` paragraphs each and return their paths."""
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    paths = []
+    for doc_id in range(documents):
+        file_path = os.path.join(path, f"report_{doc_id:05d}.txt")
+        with open(file_path, "w") as f:
+            f.write("\n\n".join(_paragraph(rng, doc_id) for _ in range(paragraphs)))
+        paths.append(file_path)
+    return paths
+
+def generate_queries(count: int, seed: int = 0) -> List[dict]:
+    """Return a mix of questions, issue reports and off-topic queries in trace format."""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        component = rng.choice(COMPONENTS)
+        kind = rng.random()
+        if kind < 0.6:
+            query = rng.choice([
+                f"What are the known issues with {component}?",
+                f"Which release fixed the {component} timeout?",
+                f"How was error ERR-{rng.randint(1000, 9999)} resolved?",
+            ])
+        elif kind < 0.9:
+            query = f"Users say {component} {rng.choice(SYMPTOMS)} on {rng.choice(PLATFORMS)}."
+        else:
+            query = rng.choice(["Hello, can you help me?", "Thanks!", "Tell me a joke"])
+        queries.append({"id": i, "query": query})
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="Directory to write the documents to")
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.path, args.documents, args.paragraphs, args.seed)
+    print(f"Wrote {len(paths)} documents to {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import time
+import asyncio
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+import httpx
+import numpy as np
+
+# Fields of a trace record that are sent on to /query
+QUERY_FIELDS = ("query", "nprobe", "ef_search", "retrieval_mode")
+
+def read_trace(lines: Iterable[str]) -> List[dict]:
+    """Parse a JSONL trace of queries.
+
+    Records look like ``/query/batch`` input (``{"id": ..., "query": ...}``);
+    records with ``title``/``body`` instead of ``query`` (e.g. a
+    ``requests.jsonl`` backlog) are sent as title and body joined. An optional
+    ``at`` field, in seconds from the start of the run, replays the record's
+    original arrival time.
+    """
+    records = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {number}: {e}") from e
+        if not isinstance(record, dict):
+            raise ValueError(f"line {number}: expected a JSON object")
+        if not record.get("query"):
+            record["query"] = "\n\n".join(str(record[key]) for key in ("title", "body") if record.get(key))
+        if not record["query"].strip():
+            raise ValueError(f"line {number}: record has no query, title or body")
+        record.setdefault("id", record.get("request_id", number))
+        records.append(record)
+    return records
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """Summarize latencies in milliseconds."""
+    if not latencies:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    values = np.asarray(latencies, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "mean": round(float(values.mean()), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+async def run_load(client: httpx.AsyncClient, trace: List[dict], concurrency: int = 4,
+                   requests: Optional[int] = None, path: str = "/query") -> dict:
+    """Send ``requests`` queries from ``trace`` (cycled) with ``concurrency`` in flight.
+
+    Returns throughput, overall and per-tool latency percentiles, status
+    counts and cache hits.
+    """
+    total = requests or len(trace)
+    next_index = 0
+    latencies: List[float] = []
+    by_tool: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, int] = defaultdict(int)
+    cache_hits = 0
+    start = time.perf_counter()
+
+    async def worker():
+        nonlocal next_index, cache_hits
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            record = trace[i % len(trace)]
+            if "at" in record and i < len(trace):
+                await asyncio.sleep(max(0.0, start + float(record["at"]) - time.perf_counter()))
+
+            sent = time.perf_counter()
+            try:
+                response = await client.post(path, json={k: record[k] for k in QUERY_FIELDS if k in record})
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            elapsed = (time.perf_counter() - sent) * 1000
+            statuses[str(response.status_code)] += 1
+            if response.status_code != 200:
+                continue
+
+            body = response.json()
+            latencies.append(elapsed)
+            by_tool[body.get("tool_used", "unknown")].append(elapsed)
+            if (body.get("metadata") or {}).get("cache", {}).get("hit"):
+                cache_hits += 1
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    duration = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": total - len(latencies),
+        "statuses": dict(statuses),
+        "cache_hits": cache_hits,
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 3) if duration else 0.0,
+        "latency_ms": percentiles(latencies),
+        "by_tool": {
+            tool: {"count": len(values), "latency_ms": percentiles(values)}
+            for tool, values in sorted(by_tool.items())
+        },
+    }
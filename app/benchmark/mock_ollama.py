@@ -0,0 +1,164 @@
+"""Stand-in Ollama server for benchmarks.
+
+Usage:
+    python -m app.benchmark.mock_ollama --port 11434 --latency 0.2 --tokens-per-second 30 --parallel 4
+
+Serves ``POST /api/generate`` (streaming and non-streaming) with a fixed
+time-to-first-token and a steady token rate, so the assistant can be load
+tested without a GPU. Router and summary prompts get valid JSON back, QA
+prompts get filler text of ``--answer-tokens`` words.
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+# Words that mark a query as an issue report rather than a question
+ISSUE_WORDS = ("crash", "fails", "failing", "broken", "error", "bug", "doesn't", "stopped", "slow", "users say")
+GREETING_WORDS = ("hello", "hi ", "thanks", "joke", "weather", "poem")
+
+FILLER = (
+    "Based on the internal documents the issue was traced to the session service and "
+    "a fix is scheduled for the next release while a workaround is described in the report"
+).split()
+
+class MockOllama:
+    """Generates canned responses at a configurable speed."""
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 30.0,
+                 answer_tokens: int = 64, parallel: Optional[int] = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        # Like OLLAMA_NUM_PARALLEL: further requests wait for a free slot
+        self.slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def respond(self, body: dict) -> str:
+        """Return the full response text for a generate request."""
+        prompt = body.get("prompt", "")
+        if "query router" in prompt:
+            return json.dumps(self._route(prompt))
+        if "technical analyst" in prompt:
+            match = re.search(r"ISSUE TEXT:(.*?)INSTRUCTIONS:", prompt, re.DOTALL)
+            return json.dumps(self._summary(match.group(1) if match else prompt))
+        return " ".join(FILLER[i % len(FILLER)] for i in range(self.answer_tokens)) + "."
+
+    def tokens(self, body: dict) -> Iterator[str]:
+        """Yield the response in word-sized tokens, paced like a real model."""
+        with self._lock:
+            self.requests += 1
+        if self.slots is not None:
+            self.slots.acquire()
+        try:
+            time.sleep(self.latency)
+            pieces = re.findall(r"\S+\s*", self.respond(body))
+            limit = (body.get("options") or {}).get("num_predict")
+            if limit is not None and limit >= 0:
+                pieces = pieces[:limit]
+            interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+            for piece in pieces:
+                if interval:
+                    time.sleep(interval)
+                yield piece
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+    def _route(self, prompt: str) -> dict:
+        match = re.search(r"USER QUERY: (.*)", prompt)
+        query = match.group(1).strip() if match else ""
+        lowered = query.lower()
+        if any(word in lowered for word in ISSUE_WORDS):
+            route = {"tool": "summary", "reasoning": "Issue report", "reformulated_query": f"Summarize: {query}"}
+            if "summary:" in prompt:
+                route["summary"] = self._summary(query)
+            return route
+        if any(word in lowered for word in GREETING_WORDS):
+            return {"tool": "unknown", "reasoning": "Not a documentation question", "reformulated_query": query}
+        return {"tool": "qa", "reasoning": "Documentation question", "reformulated_query": query}
+
+    def _summary(self, text: str) -> dict:
+        components = sorted(set(re.findall(r"\b[A-Z][a-z]+(?: [A-Z][a-z]+)?\b", text)))[:3]
+        return {
+            "reported_issues": ["Reported behaviour does not match the expected result"],
+            "affected_components": components or ["Unknown"],
+            "severity": "Medium"
+        }
+
+def make_handler(mock: MockOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "mock")
+
+            if body.get("stream", True):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                count = 0
+                try:
+                    for piece in mock.tokens(body):
+                        count += 1
+                        self._chunk({"model": model, "response": piece, "done": False})
+                    self._chunk({"model": model, "response": "", "done": True,
+                                 "done_reason": "stop", "eval_count": count})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading, e.g. after a complete JSON object
+                    self.close_connection = True
+                return
+
+            pieces = list(mock.tokens(body))
+            payload = json.dumps({"model": model, "response": "".join(pieces), "done": True,
+                                  "done_reason": "stop", "eval_count": len(pieces)}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _chunk(self, data: dict):
+            line = (json.dumps(data) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_server(mock: MockOllama, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve ``mock`` from a background thread; ``port=0`` picks a free port."""
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Length of QA answers in tokens")
+    parser.add_argument("--parallel", type=int, default=None, help="Requests generated at once (default: unlimited)")
+    args = parser.parse_args()
+
+    mock = MockOllama(args.latency, args.tokens_per_second, args.answer_tokens, args.parallel)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    print(f"Mock Ollama listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""End-to-end benchmark against a stand-in Ollama server.
+
+Usage:
+    python -m app.benchmark.run --documents 500 --concurrency 1 4 16 --requests 200 \\
+        --latency 0.2 --tokens-per-second 30 --fake-embeddings > results.json
+    python -m app.benchmark.run --trace queries.jsonl --concurrency 8
+    python -m app.benchmark.run --workers 4 --concurrency 16 --fake-embeddings
+
+Builds an index over a synthetic (or given) corpus, starts the API in a
+subprocess pointed at ``app.benchmark.mock_ollama``, drives ``/query`` at
+each concurrency level and prints ingestion time, index memory, latency
+percentiles and throughput as JSON.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import List, Optional
+import httpx
+from app.benchmark.corpus import generate_corpus, generate_queries
+from app.benchmark.load import read_trace, run_load
+from app.benchmark.mock_ollama import MockOllama, start_server
+
+def _proc_field(path: str, name: str) -> Optional[float]:
+    # Memory fields in /proc are reported in kB
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(name + ":"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Resident memory of a process in MB, read from /proc (Linux only)."""
+    return _proc_field(f"/proc/{pid or 'self'}/status", "VmRSS")
+
+def pss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Proportional set size in MB: pages shared with other processes count
+    as a fraction, so the PSS of all workers adds up to their real footprint."""
+    return _proc_field(f"/proc/{pid or 'self'}/smaps_rollup", "Pss")
+
+def child_pids(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def process_memory(pid: int) -> dict:
+    """RSS and PSS of a server process and, under gunicorn, each of its workers."""
+    processes = [{"pid": pid, "role": "main", "rss_mb": rss_mb(pid), "pss_mb": pss_mb(pid)}]
+    for child in child_pids(pid):
+        processes.append({"pid": child, "role": "worker", "rss_mb": rss_mb(child), "pss_mb": pss_mb(child)})
+    return {
+        "processes": processes,
+        "total_rss_mb": round(sum(p["rss_mb"] or 0 for p in processes), 1),
+        "total_pss_mb": round(sum(p["pss_mb"] or 0 for p in processes), 1),
+    }
+
+def directory_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+def measure_ingestion() -> dict:
+    """Build the index from scratch and report its build time and size."""
+    import faiss
+    from app.data.ingestion import DocumentIngestion
+
+    ingestion = DocumentIngestion()
+    vectorstore, report = ingestion.reload_vectorstore()
+    return {
+        "files": len(report.added),
+        "chunks": report.chunks_added,
+        "duration_seconds": report.duration_seconds,
+        "chunks_per_second": report.chunks_per_second,
+        "vectors": vectorstore.index.ntotal,
+        "index_spec": ingestion.index_spec.factory,
+        "index_bytes": int(faiss.serialize_index(vectorstore.index).nbytes),
+        "on_disk_bytes": directory_bytes(ingestion.index_path),
+    }
+
+def wait_until_ready(url: str, server: subprocess.Popen, timeout: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"API server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"API server not ready after {timeout}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Existing documents directory (default: generate one)")
+    parser.add_argument("--documents", type=int, default=100, help="Synthetic documents to generate")
+    parser.add_argument("--paragraphs", type=int, default=8, help="Paragraphs per synthetic document")
+    parser.add_argument("--trace", help="JSONL trace to replay (default: synthetic queries)")
+    parser.add_argument("--requests", type=int, default=None,
+                        help="Requests per concurrency level (default: trace length, or 100)")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="Generations the mock runs at once")
+    parser.add_argument("--index-spec", help="FAISS_INDEX_SPEC for the benchmark index")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Use hash-based embeddings instead of downloading the model")
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the response cache on; later levels then see a warm cache")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="API worker processes; above 1 the server runs under gunicorn with preloading")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--work-dir", help="Where to put the corpus and index (default: a temp dir)")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="assistant-bench-")
+    corpus_dir = args.corpus or os.path.join(work_dir, "documents")
+    if not args.corpus:
+        generate_corpus(corpus_dir, args.documents, args.paragraphs)
+
+    if args.trace:
+        with open(args.trace) as f:
+            trace = read_trace(f)
+    else:
+        trace = generate_queries(args.requests or 100)
+
+    mock = MockOllama(args.latency, args.tokens_per_second, args.answer_tokens, args.ollama_parallel)
+    mock_server = start_server(mock)
+
+    # Environment shared by the ingestion below and the API subprocess
+    os.environ.update({
+        "DOCUMENTS_DIR": corpus_dir,
+        "FAISS_INDEX_PATH": os.path.join(work_dir, "faiss_index"),
+        "OLLAMA_API_BASE_URL": f"http://127.0.0.1:{mock_server.server_address[1]}",
+    })
+    if args.index_spec:
+        os.environ["FAISS_INDEX_SPEC"] = args.index_spec
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_MAX_BYTES"] = "0"
+
+    if args.fake_embeddings:
+        from app.benchmark.server import use_fake_embeddings
+        use_fake_embeddings()
+    ingestion = measure_ingestion()
+
+    url = f"http://127.0.0.1:{args.port}"
+    command = [sys.executable, "-m", "app.benchmark.server", "--port", str(args.port)]
+    if args.fake_embeddings:
+        command.append("--fake-embeddings")
+    if args.workers > 1:
+        command.extend(["--workers", str(args.workers)])
+    server = subprocess.Popen(command)
+    try:
+        startup_seconds = wait_until_ready(url, server, args.startup_timeout)
+        if args.workers > 1:
+            # /health/ready answers as soon as the first worker is up
+            while len(child_pids(server.pid)) < args.workers:
+                time.sleep(0.2)
+        idle_memory = process_memory(server.pid)
+
+        async def drive(concurrency: int) -> dict:
+            async with httpx.AsyncClient(base_url=url, timeout=None,
+                                         limits=httpx.Limits(max_connections=concurrency)) as client:
+                return await run_load(client, trace, concurrency, args.requests)
+
+        runs = []
+        for concurrency in args.concurrency:
+            runs.append({"concurrency": concurrency, **asyncio.run(drive(concurrency))})
+
+        server_stats = {
+            name: httpx.get(f"{url}/admin/{name}", timeout=10).json()
+            for name in ("router-stats", "llm-stats", "cache-stats")
+        }
+        startup_components = httpx.get(f"{url}/health/ready", timeout=10).json()["components"]
+        loaded_memory = process_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        mock_server.shutdown()
+
+    report = {
+        "config": {
+            "corpus": args.corpus or {"documents": args.documents, "paragraphs": args.paragraphs},
+            "trace": args.trace or "synthetic",
+            "trace_queries": len(trace),
+            "mock_ollama": {
+                "latency": args.latency,
+                "tokens_per_second": args.tokens_per_second,
+                "answer_tokens": args.answer_tokens,
+                "parallel": args.ollama_parallel,
+            },
+            "fake_embeddings": args.fake_embeddings,
+            "response_cache": args.cache,
+            "workers": args.workers,
+            "python": platform.python_version(),
+        },
+        "ingestion": ingestion,
+        "server": {
+            "startup_seconds": round(startup_seconds, 3),
+            "startup_components": startup_components,
+            "rss_mb_idle": idle_memory["total_rss_mb"],
+            "rss_mb_after_load": loaded_memory["total_rss_mb"],
+            "memory_idle": idle_memory,
+            "memory_after_load": loaded_memory,
+            "llm_requests": mock.requests,
+            "stats": server_stats,
+        },
+        "runs": runs,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Run the assistant API for a benchmark.
+
+Usage:
+    python -m app.benchmark.server --port 8000 [--fake-embeddings] [--workers 4]
+
+Same as ``uvicorn app.main:app``, except that ``--fake-embeddings`` swaps the
+sentence-transformers model for deterministic hash-based vectors, so runs
+need no model download and embedding cost does not mask other regressions.
+With ``--workers`` above 1 the API runs under gunicorn with the settings in
+``app/gunicorn_conf.py``, preloaded in this process.
+"""
+import sys
+import argparse
+
+# Dimension of all-MiniLM-L6-v2, so index sizes match the real model
+EMBEDDING_SIZE = 384
+
+def use_fake_embeddings(size: int = EMBEDDING_SIZE):
+    """Make DocumentIngestion use deterministic fake embeddings."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import app.data.ingestion as ingestion
+
+    ingestion.HuggingFaceEmbeddings = lambda **kwargs: DeterministicFakeEmbedding(size=size)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        use_fake_embeddings()
+
+    if args.workers > 1:
+        from gunicorn.app.wsgiapp import WSGIApplication
+
+        # Runs in this process, so the patched embeddings are what gets preloaded
+        sys.argv = [
+            "gunicorn", "-c", "python:app.gunicorn_conf", "--bind", f"{args.host}:{args.port}",
+            "--workers", str(args.workers), "--log-level", "warning", "app.main:app",
+        ]
+        WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+        return
+
+    import uvicorn
+    from app.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.utils.cache_backends import get_cache_backend
+from app.utils.metrics import QUERY_EMBEDDING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingPipeline:
+    """Batched document embedding with optional multi-process workers.
+
+    Produces L2-normalized float32 vectors. With ``workers > 1`` the
+    sentence-transformers model behind ``embeddings`` is fanned out to a
+    pool of CPU processes that stays alive for the whole ingestion run.
+    """
+
+    def __init__(self, embeddings, batch_size: Optional[int] = None, workers: Optional[int] = None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.workers = workers if workers is not None else int(os.getenv("EMBEDDING_WORKERS", "0"))
+        self._pool = None
+
+        self.chunks_embedded = 0
+        self.seconds_embedding = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        start = time.perf_counter()
+        if self.workers > 1 and hasattr(self.embeddings, "_client"):
+            vectors = self._embed_multi_process(texts)
+        else:
+            vectors = self.embeddings.embed_documents(texts)
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        self.seconds_embedding += time.perf_counter() - start
+        self.chunks_embedded += len(texts)
+        logger.info(
+            "Embedded %d chunks (%.1f chunks/s)",
+            self.chunks_embedded, self.chunks_per_second
+        )
+        return vectors
+
+    @property
+    def chunks_per_second(self) -> float:
+        if self.seconds_embedding == 0:
+            return 0.0
+        return self.chunks_embedded / self.seconds_embedding
+
+    def close(self):
+        if self._pool is not None:
+            self.embeddings._client.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def _embed_multi_process(self, texts: List[str]):
+        client = self.embeddings._client
+        if self._pool is None:
+            self._pool = client.start_multi_process_pool(["cpu"] * self.workers)
+        # Match HuggingFaceEmbeddings preprocessing so query and document vectors agree
+        texts = [text.replace("\n", " ") for text in texts]
+        return client.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+
+# Writes to a shared cache backend between trims of its oldest entries
+SHARED_TRIM_EVERY = 256
+
+def _cache_key(text: str) -> str:
+    # Only whitespace is normalized: the tokenizer ignores it, so the vector is unchanged
+    return " ".join(text.split())
+
+def _as_float32(vectors: List[List[float]]) -> List[np.ndarray]:
+    return [np.asarray(vector, dtype=np.float32) for vector in vectors]
+
+class QueryEmbedder(Embeddings):
+    """Shared query embedding with an LRU cache and micro-batching.
+
+    Exposes ``embed_query`` and ``embed_documents`` like the wrapped
+    ``embeddings`` model, so it can be used anywhere a LangChain embeddings
+    object is expected (vectorstore, router, response cache). Vectors are
+    cached by whitespace-normalized text, so the cache lookup, the router and
+    retrieval embed a query once between them. Cache misses from concurrent
+    callers that arrive within ``batch_window_ms`` of each other are embedded
+    in one forward pass on a background thread. With a shared cache backend,
+    local misses are looked up there before being embedded, and new vectors
+    are written back, so worker processes embed each query once between them.
+    """
+
+    def __init__(self, embeddings, cache_size: Optional[int] = None,
+                 batch_window_ms: Optional[float] = None, max_batch_size: Optional[int] = None,
+                 backend=None, namespace: str = "query_embeddings"):
+        self.embeddings = embeddings
+        self.backend = backend if backend is not None else get_cache_backend()
+        self.namespace = namespace
+        self._shared_writes = 0
+        self.cache_size = cache_size if cache_size is not None else int(
+            os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+        self.batch_window = (batch_window_ms if batch_window_ms is not None else float(
+            os.getenv("QUERY_EMBEDDING_BATCH_WINDOW_MS", "2"))) / 1000
+        self.max_batch_size = max_batch_size or int(os.getenv("QUERY_EMBEDDING_MAX_BATCH", "32"))
+
+        # float32 arrays: a 384-dim vector takes 1.5 KB, against about 12 KB as a list of floats
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._queue: "queue.Queue[Tuple[str, str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0, "shared_hits": 0, "misses": 0, "batches": 0, "batched_texts": 0, "max_batch_size": 0,
+        }
+
+    def embed_query(self, text: str) -> List[float]:
+        key = _cache_key(text)
+        with self._lock:
+            vector = self._get(key)
+            if vector is not None:
+                self.counters["hits"] += 1
+                return vector.tolist()
+        shared = self._shared_get([key])
+        with self._lock:
+            if key in shared:
+                self.counters["shared_hits"] += 1
+                self._put(key, shared[key])
+                return shared[key].tolist()
+            self.counters["misses"] += 1
+            # An identical query already waiting for the batcher shares its result
+            future = self._pending.get(key)
+            if future is None:
+                future = Future()
+                self._pending[key] = future
+                self._queue.put((key, text, future))
+                self._ensure_worker()
+        return future.result().tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts in one pass, skipping any that are cached."""
+        keys = [_cache_key(text) for text in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vectors[i] = self._get(key)
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            self.counters["hits"] += len(texts) - len(missing)
+
+        if missing:
+            shared = self._shared_get(list({keys[i] for i in missing}))
+            unique = {keys[i]: texts[i] for i in missing if keys[i] not in shared}
+            embedded = dict(shared)
+            if unique:
+                embedded.update(zip(unique, _as_float32(self.embeddings.embed_documents(list(unique.values())))))
+                self._record_batch(len(unique))
+                self._shared_put({key: embedded[key] for key in unique})
+            with self._lock:
+                self.counters["shared_hits"] += sum(keys[i] in shared for i in missing)
+                self.counters["misses"] += sum(keys[i] not in shared for i in missing)
+                for key, vector in embedded.items():
+                    self._put(key, vector)
+            for i in missing:
+                vectors[i] = embedded[keys[i]]
+        return [vector.tolist() for vector in vectors]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "entries": len(self._cache),
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                "mean_batch_size": round(self.counters["batched_texts"] / self.counters["batches"], 2)
+                if self.counters["batches"] else 0.0,
+            }
+
+    def _ensure_worker(self):
+        # Called with the lock held
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Collect whatever else arrives within the window
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch: List[Tuple[str, str, Future]]):
+        try:
+            vectors = _as_float32(self.embeddings.embed_documents([text for _, text, _ in batch]))
+        except Exception as e:
+            with self._lock:
+                for key, _, _ in batch:
+                    self._pending.pop(key, None)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self._record_batch(len(batch))
+        with self._lock:
+            for (key, _, _), vector in zip(batch, vectors):
+                self._put(key, vector)
+                self._pending.pop(key, None)
+        for (_, _, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+        # Only after the waiting callers are answered, so a slow or failing backend cannot hold them up
+        self._shared_put({key: vector for (key, _, _), vector in zip(batch, vectors)})
+
+    def _record_batch(self, size: int):
+        QUERY_EMBEDDING_BATCH_SIZE.observe(size)
+        with self._lock:
+            self.counters["batches"] += 1
+            self.counters["batched_texts"] += size
+            self.counters["max_batch_size"] = max(self.counters["max_batch_size"], size)
+
+    # The shared backend only saves work: if it fails, queries are embedded locally as before
+
+    def _shared_get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if not self.backend.shared:
+            return {}
+        try:
+            values = self.backend.get_many(self.namespace, keys)
+        except Exception:
+            logger.exception("Reading shared query embeddings failed")
+            return {}
+        return {key: np.frombuffer(value, dtype=np.float32) for key, value in values.items()}
+
+    def _shared_put(self, vectors: Dict[str, np.ndarray]):
+        if not self.backend.shared:
+            return
+        try:
+            for key, vector in vectors.items():
+                self.backend.put(self.namespace, key, vector.tobytes())
+            # Keep the shared table about as large as one worker's cache
+            self._shared_writes += len(vectors)
+            if self._shared_writes >= SHARED_TRIM_EVERY:
+                self._shared_writes = 0
+                self.backend.trim(self.namespace, self.cache_size)
+        except Exception:
+            logger.exception("Writing shared query embeddings failed")
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+        return vector
+
+    def _put(self, key: str, vector: np.ndarray):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
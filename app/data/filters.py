@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+
+class MetadataFilter(BaseModel):
+    """Restricts retrieval to chunks whose metadata matches every given field.
+
+    Dates are ISO ``YYYY-MM-DD`` strings and both bounds are inclusive.
+    """
+    team: Optional[str] = Field(default=None, description="Team, i.e. the top-level documents folder")
+    component: Optional[str] = Field(default=None, description="Component named in the document header")
+    source: Optional[str] = Field(default=None, description="Source file path, or a prefix of it")
+    date_from: Optional[str] = Field(default=None, description="Earliest document date (YYYY-MM-DD)")
+    date_to: Optional[str] = Field(default=None, description="Latest document date (YYYY-MM-DD)")
+
+    def is_empty(self) -> bool:
+        return not any(value is not None for value in self.dict().values())
+
+    def key(self) -> Tuple:
+        """Hashable form, for grouping and caching."""
+        return tuple(sorted((name, value) for name, value in self.dict().items() if value is not None))
+
+    def without(self, field: str) -> Optional["MetadataFilter"]:
+        """Drop one field, e.g. once it has been used to pick a shard; None if nothing is left."""
+        remaining = self.copy(update={field: None})
+        return None if remaining.is_empty() else remaining
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        if self.team is not None and metadata.get("team") != self.team:
+            return False
+        if self.component is not None and str(metadata.get("component") or "").lower() != self.component.lower():
+            return False
+        if self.source is not None and not str(metadata.get("source") or "").startswith(self.source):
+            return False
+        date = metadata.get("date")
+        if self.date_from is not None and (date is None or date < self.date_from):
+            return False
+        if self.date_to is not None and (date is None or date > self.date_to):
+            return False
+        return True
+
+    def sql(self, column: str = "metadata") -> Tuple[str, List[Any]]:
+        """A WHERE clause over the JSON metadata column with the same meaning as ``matches``."""
+        clauses, params = [], []
+        if self.team is not None:
+            clauses.append(f"json_extract({column}, '$.team') = ?")
+            params.append(self.team)
+        if self.component is not None:
+            clauses.append(f"lower(json_extract({column}, '$.component')) = ?")
+            params.append(self.component.lower())
+        if self.source is not None:
+            clauses.append(f"substr(json_extract({column}, '$.source'), 1, ?) = ?")
+            params.extend([len(self.source), self.source])
+        if self.date_from is not None:
+            clauses.append(f"json_extract({column}, '$.date') >= ?")
+            params.append(self.date_from)
+        if self.date_to is not None:
+            clauses.append(f"json_extract({column}, '$.date') <= ?")
+            params.append(self.date_to)
+        return " AND ".join(clauses) or "1", params
@@ -0,0 +1,177 @@
+import os
+import re
+import logging
+from typing import List, Optional
+import numpy as np
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from app.data.store import SQLiteDocstore
+from app.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# IVF training needs roughly this many points per inverted list
+MIN_POINTS_PER_CENTROID = 39
+# 8-bit product quantizers learn 256 centroids per sub-vector
+MIN_PQ_TRAINING_POINTS = 256
+
+class IndexSpec:
+    """A FAISS index factory string such as ``Flat``, ``IVF1024,Flat``,
+    ``IVF1024,PQ32`` or ``HNSW32``, plus the number of vectors to train on."""
+
+    def __init__(self, factory: Optional[str] = None, train_size: Optional[int] = None):
+        self.factory = factory or os.getenv("FAISS_INDEX_SPEC", "Flat")
+        self.train_size = train_size or int(os.getenv("FAISS_TRAIN_SIZE", "50000"))
+
+    @property
+    def needs_training(self) -> bool:
+        return "IVF" in self.factory or "PQ" in self.factory
+
+    @property
+    def supports_remove(self) -> bool:
+        # HNSW graphs cannot delete vectors, and IVF lists keep their ids after a
+        # removal instead of compacting like the vectorstore expects, so changed
+        # or removed files force a rebuild for both
+        return "HNSW" not in self.factory and "IVF" not in self.factory
+
+    def to_dict(self) -> dict:
+        return {"factory": self.factory, "train_size": self.train_size}
+
+    def create(self, training_vectors: np.ndarray) -> faiss.Index:
+        """Create and, if needed, train an index on a sample of the vectors."""
+        dim = training_vectors.shape[1]
+        factory = self.factory
+        if self.needs_training:
+            factory = self._fit_to_sample(len(training_vectors))
+
+        index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+        if not index.is_trained:
+            sample = training_vectors[:self.train_size]
+            index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        return index
+
+    def _fit_to_sample(self, sample_size: int) -> str:
+        # Small corpora cannot train the requested number of lists or PQ codebooks
+        if "PQ" in self.factory and sample_size < MIN_PQ_TRAINING_POINTS:
+            logger.warning("Only %d vectors to train %s, using a Flat index", sample_size, self.factory)
+            return "Flat"
+
+        def clamp(match):
+            nlist = max(1, min(int(match.group(1)), sample_size // MIN_POINTS_PER_CENTROID))
+            return f"IVF{nlist}"
+
+        factory = re.sub(r"IVF(\d+)", clamp, self.factory)
+        if factory != self.factory:
+            logger.warning("Only %d vectors to train %s, using %s", sample_size, self.factory, factory)
+        return factory
+
+class ReservoirSample:
+    """A uniform random sample of up to ``size`` vectors from a stream of batches."""
+
+    def __init__(self, size: int, seed: Optional[int] = None):
+        self.size = size
+        self.seen = 0
+        self._batches: List[np.ndarray] = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, vectors: np.ndarray):
+        # Fill the reservoir first, then let the i-th vector replace a random
+        # slot with probability size / (i + 1)
+        fill = max(0, min(self.size - self.seen, len(vectors)))
+        if fill:
+            self._batches.append(np.array(vectors[:fill], dtype=np.float32))
+        self.seen += fill
+        rest = vectors[fill:]
+        if len(rest):
+            reservoir = self.sample
+            slots = self._rng.integers(0, np.arange(self.seen, self.seen + len(rest)) + 1)
+            kept = slots < self.size
+            for row, slot in zip(rest[kept], slots[kept]):
+                reservoir[slot] = row
+            self.seen += len(rest)
+
+    @property
+    def sample(self) -> np.ndarray:
+        if len(self._batches) > 1:
+            self._batches = [np.vstack(self._batches)]
+        return self._batches[0] if self._batches else np.empty((0, 0), dtype=np.float32)
+
+def create_vectorstore(index: faiss.Index, embeddings) -> FAISS:
+    """Wrap a FAISS index in an empty LangChain vectorstore."""
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+
+def search_parameters(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      selector: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+    """Build per-query FAISS search parameters: nprobe for IVF, efSearch for
+    HNSW, and an ID selector that restricts the search to some vectors."""
+    extra = {"sel": selector} if selector is not None else {}
+    ivf = faiss.try_extract_index_ivf(index)
+    if isinstance(ivf, faiss.IndexIVF) and (nprobe is not None or selector is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe if nprobe is not None else ivf.nprobe, **extra)
+    if isinstance(index, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        return faiss.SearchParametersHNSW(efSearch=ef_search if ef_search is not None else index.hnsw.efSearch, **extra)
+    if selector is not None:
+        return faiss.SearchParameters(**extra)
+    return None
+
+def filter_positions(vectorstore: FAISS, metadata_filter) -> np.ndarray:
+    """FAISS positions of the chunks matching a metadata filter."""
+    docstore = vectorstore.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        return docstore.chunks.positions(metadata_filter)
+    # In-memory vectorstores are small; check each chunk's metadata
+    return np.array([
+        position for position, chunk_id in vectorstore.index_to_docstore_id.items()
+        if metadata_filter.matches(docstore.search(chunk_id).metadata)
+    ], dtype=np.int64)
+
+def similarity_search(vectorstore: FAISS, query: str, k: int, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None, metadata_filter=None) -> List:
+    """Search the vectorstore with optional nprobe/efSearch overrides and metadata filter."""
+    with span("embed_query", "qa"):
+        vector = np.asarray(vectorstore.embedding_function.embed_query(query), dtype=np.float32)
+    return similarity_search_by_vectors(vectorstore, vector[None, :], k, nprobe, ef_search, metadata_filter)[0]
+
+def similarity_search_by_vectors(vectorstore: FAISS, vectors: np.ndarray, k: int,
+                                 nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                                 metadata_filter=None, with_scores: bool = False) -> List[List]:
+    """Search many query vectors in one FAISS call.
+
+    A metadata filter is applied inside the search, through an ID selector,
+    so each query still gets up to ``k`` matching chunks rather than the
+    matching part of the unfiltered top ``k``. With ``with_scores`` each hit
+    is a ``(document, score)`` pair where a higher score is a closer match.
+    """
+    selector = None
+    if metadata_filter is not None:
+        positions = filter_positions(vectorstore, metadata_filter)
+        if len(positions) == 0:
+            return [[] for _ in range(len(vectors))]
+        selector = faiss.IDSelectorBatch(positions)
+    params = search_parameters(vectorstore.index, nprobe, ef_search, selector)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    with span("faiss_search", "qa"):
+        distances, indices = vectorstore.index.search(vectors, k, params=params)
+
+    scores = similarity_scores(vectorstore.index, distances)
+    results = []
+    for score_row, row in zip(scores, indices):
+        hits = [
+            (vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]), float(score))
+            for score, i in zip(score_row, row) if i != -1
+        ]
+        results.append(hits if with_scores else [doc for doc, _ in hits])
+    return results
+
+def similarity_scores(index, distances: np.ndarray) -> np.ndarray:
+    """FAISS distances as scores where higher is closer, whatever the metric."""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return distances
+    # L2 distances grow as vectors move apart
+    return -distances
@@ -0,0 +1,116 @@
+"""Recall@k vs. latency report for FAISS index specs against the flat baseline.
+
+Usage:
+    python -m app.data.index_report --specs "IVF256,Flat" "IVF256,PQ32" HNSW32 \\
+        --nprobe 1 4 16 --ef-search 16 64 --k 3
+"""
+import json
+import time
+import argparse
+from typing import List, Optional
+import numpy as np
+import faiss
+from app.data.embedding import EmbeddingPipeline
+from app.data.index import IndexSpec, search_parameters
+
+def corpus_vectors(vectorstore) -> np.ndarray:
+    """Return the stored vectors, re-embedding the docstore for lossy indexes."""
+    index = vectorstore.index
+    if isinstance(index, faiss.IndexFlat):
+        return index.reconstruct_n(0, index.ntotal)
+
+    texts = [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+        for i in range(index.ntotal)
+    ]
+    with EmbeddingPipeline(vectorstore.embedding_function) as pipeline:
+        return np.vstack([
+            pipeline.embed(texts[start:start + pipeline.batch_size])
+            for start in range(0, len(texts), pipeline.batch_size)
+        ])
+
+def _timed_search(index, queries: np.ndarray, k: int, params=None):
+    latencies = []
+    results = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, indices = index.search(query[None, :], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = indices[0]
+    return results, np.asarray(latencies)
+
+def _recall(results: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row) & set(expected)) for row, expected in zip(results, truth))
+    return hits / truth.size
+
+def evaluate_specs(vectors: np.ndarray, queries: np.ndarray, specs: List[str], k: int = 3,
+                   nprobes: Optional[List[int]] = None, ef_searches: Optional[List[int]] = None) -> List[dict]:
+    """Measure recall@k and per-query latency of each spec against exact search."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    truth, latencies = _timed_search(baseline, queries, k)
+    report = [{
+        "spec": "Flat",
+        "recall_at_k": 1.0,
+        "latency_ms_mean": round(float(latencies.mean()), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+        "index_bytes": int(faiss.serialize_index(baseline).nbytes),
+    }]
+
+    for factory in specs:
+        start = time.perf_counter()
+        index = IndexSpec(factory, train_size=len(vectors)).create(vectors)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+
+        settings = [{}]
+        if faiss.try_extract_index_ivf(index) is not None:
+            settings = [{"nprobe": n} for n in (nprobes or [1])]
+        elif isinstance(index, faiss.IndexHNSW):
+            settings = [{"ef_search": ef} for ef in (ef_searches or [16])]
+
+        for setting in settings:
+            results, latencies = _timed_search(index, queries, k, search_parameters(index, **setting))
+            report.append({
+                "spec": factory,
+                **setting,
+                "recall_at_k": round(_recall(results, truth), 4),
+                "latency_ms_mean": round(float(latencies.mean()), 4),
+                "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+                "build_seconds": round(build_seconds, 3),
+                "index_bytes": int(faiss.serialize_index(index).nbytes),
+            })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--specs", nargs="+", default=["IVF256,Flat", "IVF256,PQ32", "HNSW32"])
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 64])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", help="Text file with one query per line; defaults to sampled chunks")
+    parser.add_argument("--num-queries", type=int, default=200)
+    args = parser.parse_args()
+
+    from app.data.ingestion import DocumentIngestion
+
+    ingestion = DocumentIngestion()
+    vectorstore = ingestion.get_or_create_vectorstore()
+    vectors = corpus_vectors(vectorstore)
+
+    if args.queries:
+        with open(args.queries) as f:
+            texts = [line.strip() for line in f if line.strip()]
+        queries = np.asarray(ingestion.embeddings.embed_documents(texts), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), min(args.num_queries, len(vectors)), replace=False)]
+
+    report = evaluate_specs(vectors, queries, args.specs, args.k, args.nprobe, args.ef_search)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
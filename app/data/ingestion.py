@@ -1,45 +1,466 @@
 import os
+import json
+import time
+import shutil
+import hashlib
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, Field
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import TextLoader
+from app.data.embedding import EmbeddingPipeline, QueryEmbedder
+from app.data.index import IndexSpec, ReservoirSample, create_vectorstore
+from app.data.loaders import SUPPORTED_EXTENSIONS, DocumentLoader, parallel_map
+from app.data.store import load_vectorstore, save_vectorstore, vectorstore_exists
+from app.utils.metrics import span
+
+MANIFEST_FILE = "manifest.json"
+# Bumped when the loader changes the chunk metadata it records, so older
+# indexes are rebuilt instead of mixing chunks with old and new metadata
+METADATA_VERSION = 3
+# Metadata keys an index can be sharded by
+SHARD_KEYS = ("team",)
+# Shard holding the files directly in the documents folder
+ROOT_SHARD = "_root"
+
+class IngestionReport(BaseModel):
+    added: List[str] = Field(default_factory=list, description="Files embedded for the first time")
+    updated: List[str] = Field(default_factory=list, description="Files whose content changed")
+    removed: List[str] = Field(default_factory=list, description="Files no longer present")
+    unchanged: int = Field(default=0, description="Number of files skipped because their hash matched")
+    chunks_added: int = Field(default=0, description="Number of chunks embedded")
+    chunks_removed: int = Field(default=0, description="Number of chunks deleted from the index")
+    full_rebuild: bool = Field(default=False, description="Whether the whole index was rebuilt")
+    chunks_per_second: float = Field(default=0.0, description="Embedding throughput")
+    duration_seconds: float = Field(default=0.0, description="Wall-clock time of the reload")
+
+class ReloadProgress:
+    """Counters a reload updates as it goes, so other threads can report on it."""
+
+    def __init__(self):
+        self.stage = "pending"
+        self.shard = None
+        self.files_total = 0
+        self.files_processed = 0
+        self.chunks_embedded = 0
+
+    def dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "shard": self.shard,
+            "files_total": self.files_total,
+            "files_processed": self.files_processed,
+            "chunks_embedded": self.chunks_embedded,
+        }
 
 class DocumentIngestion:
-    def __init__(self, data_dir="app/data/documents"):
+    def __init__(self, data_dir=None, index_path=None,
+                 batch_size=None, workers=None, loader_workers=None, index_spec=None,
+                 embeddings=None, query_embeddings=None, subdir=None, recursive=True):
+        data_dir = data_dir or os.getenv("DOCUMENTS_DIR", "app/data/documents")
+        index_path = index_path or os.getenv("FAISS_INDEX_PATH", "app/data/faiss_index")
         self.data_dir = data_dir
-        self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        self.index_spec = index_spec or IndexSpec()
+        self.loader = DocumentLoader(data_dir, workers=loader_workers, subdir=subdir, recursive=recursive)
+        self.index_path = index_path
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.workers = workers if workers is not None else int(os.getenv("EMBEDDING_WORKERS", "0"))
+        self.embeddings = embeddings or HuggingFaceEmbeddings(
+            model_name="sentence-transformers/all-MiniLM-L6-v2",
+            encode_kwargs={"batch_size": self.batch_size, "normalize_embeddings": True}
+        )
+        # Served vectorstores embed queries through the shared cached, micro-batched embedder
+        self.query_embeddings = query_embeddings or QueryEmbedder(self.embeddings)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
-            chunk_overlap=100
+            chunk_overlap=100,
+            add_start_index=True  # Lets the QA context builder merge overlapping chunks
         )
-        
+
+    def list_files(self) -> List[str]:
+        return list(self.loader.iter_files())
+
+    def load_file(self, path):
+        return self.loader.load_file(path)
+
+    def iter_documents(self) -> Iterator:
+        return self.loader.lazy_load()
+
     def load_documents(self):
-        documents = []
-        for file in os.listdir(self.data_dir):
-            if file.endswith(".txt"):
-                loader = TextLoader(os.path.join(self.data_dir, file))
-                documents.extend(loader.load())
-        return documents
-    
+        return list(self.iter_documents())
+
     def process_documents(self):
-        documents = self.load_documents()
-        splits = self.text_splitter.split_documents(documents)
-        vectorstore = FAISS.from_documents(
-            documents=splits,
-            embedding=self.embeddings
-        )
+        vectorstore, _ = self.build_vectorstore()
+        return vectorstore
+
+    def build_vectorstore(self) -> Tuple[FAISS, dict]:
+        vectorstore, manifest, _ = self._build_vectorstore()
+        return vectorstore, manifest
+
+    def _build_vectorstore(self, progress: Optional[ReloadProgress] = None) -> Tuple[FAISS, dict, float]:
+        # Stream every file through splitting and embedding, recording which
+        # chunk IDs each file produced
+        manifest = {}
+        paths = self.list_files()
+        if progress is not None:
+            progress.stage = "embedding"
+            progress.files_total += len(paths)
+        chunks = self.iter_chunks(paths, manifest, progress)
+        with EmbeddingPipeline(self.embeddings, self.batch_size, self.workers) as pipeline:
+            vectorstore = self.embed_chunks(None, chunks, pipeline, progress)
+        if vectorstore is None:
+            raise ValueError(f"No documents found in {self.data_dir}")
+        return vectorstore, manifest, pipeline.chunks_per_second
+
+    def iter_chunks(self, paths: Iterable[str], manifest: dict,
+                    progress: Optional[ReloadProgress] = None) -> Iterator[Tuple[object, str]]:
+        # Files are read and hashed on the loader's thread pool while earlier
+        # files are being split and embedded
+        for path, file_hash, documents in parallel_map(self._read_file, paths, self.loader.workers):
+            file_splits, file_ids = self.split_documents(documents, path, file_hash)
+            manifest[path] = {"hash": file_hash, "chunk_ids": file_ids}
+            if progress is not None:
+                progress.files_processed += 1
+            yield from zip(file_splits, file_ids)
+
+    def _read_file(self, path) -> Tuple[str, str, list]:
+        with span("read", "ingestion"):
+            return path, self.hash_file(path), self.load_file(path)
+
+    def embed_chunks(self, vectorstore: Optional[FAISS], chunks: Iterable[Tuple[object, str]],
+                     pipeline: EmbeddingPipeline, progress: Optional[ReloadProgress] = None) -> Optional[FAISS]:
+        # Embed in fixed-size batches, so splitting and embedding hold one batch
+        # at a time. The vectorstore's in-memory docstore still keeps every
+        # chunk's text and metadata until the index is saved to SQLite.
+        # A new index is created from the first batch, or, when the index spec
+        # needs training, once every batch is embedded, trained on a uniform
+        # sample of train_size vectors drawn from the whole corpus.
+        pending = []
+        sample = ReservoirSample(self.index_spec.train_size) if self.index_spec.needs_training else None
+
+        chunks = iter(chunks)
+        while True:
+            batch = list(islice(chunks, pipeline.batch_size))
+            if not batch:
+                break
+
+            texts = [doc.page_content for doc, _ in batch]
+            with span("embed", "ingestion"):
+                vectors = pipeline.embed(texts)
+            if progress is not None:
+                progress.chunks_embedded += len(texts)
+            metadatas = [doc.metadata for doc, _ in batch]
+            ids = [chunk_id for _, chunk_id in batch]
+            if vectorstore is not None:
+                with span("index_add", "ingestion"):
+                    vectorstore.add_embeddings(zip(texts, vectors.tolist()), metadatas=metadatas, ids=ids)
+                continue
+
+            pending.append((texts, vectors, metadatas, ids))
+            if sample is None:
+                vectorstore = self._create_vectorstore(pending, vectors)
+                pending = []
+            else:
+                sample.add(vectors)
+
+        if pending:
+            vectorstore = self._create_vectorstore(pending, sample.sample)
         return vectorstore
-    
+
+    def _create_vectorstore(self, batches: list, training_vectors: np.ndarray) -> FAISS:
+        with span("index_train", "ingestion"):
+            vectorstore = create_vectorstore(self.index_spec.create(training_vectors), self.embeddings)
+        with span("index_add", "ingestion"):
+            while batches:
+                # Drop each batch once added, so its vectors are not held twice
+                texts, vectors, metadatas, ids = batches.pop(0)
+                vectorstore.add_embeddings(zip(texts, vectors.tolist()), metadatas=metadatas, ids=ids)
+        return vectorstore
+
+    def split_documents(self, documents, path, file_hash) -> Tuple[list, List[str]]:
+        with span("split", "ingestion"):
+            splits = self.text_splitter.split_documents(documents)
+        ids = [f"{path}:{file_hash[:16]}:{i}" for i in range(len(splits))]
+        return splits, ids
+
+    def hash_file(self, path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _read_manifest(self) -> Optional[dict]:
+        manifest_path = os.path.join(self.index_path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    def load_manifest(self) -> Optional[Dict[str, dict]]:
+        data = self._read_manifest()
+        return data["files"] if data is not None else None
+
+    def load_index_spec(self) -> Optional[dict]:
+        data = self._read_manifest()
+        return data.get("index_spec") if data is not None else None
+
+    def index_exists(self) -> bool:
+        return vectorstore_exists(self.index_path)
+
+    def signature(self) -> Optional[tuple]:
+        """Identifies the saved index; changes every time a reload saves a new one."""
+        try:
+            stat = os.stat(os.path.join(self.index_path, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load_index(self) -> FAISS:
+        """Load the saved index as is, e.g. after another process reloaded it."""
+        return load_vectorstore(self.index_path, self.query_embeddings)
+
+    def save(self, vectorstore, manifest):
+        with span("save", "ingestion"):
+            save_vectorstore(vectorstore, self.index_path)
+        # The manifest is replaced last, so a new manifest means the index files are in place
+        manifest_path = os.path.join(self.index_path, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({
+                "index_spec": self.index_spec.to_dict(),
+                "metadata_version": METADATA_VERSION,
+                "files": manifest
+            }, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _full_reload(self, start, progress: Optional[ReloadProgress] = None) -> Tuple[FAISS, IngestionReport]:
+        vectorstore, manifest, chunks_per_second = self._build_vectorstore(progress)
+        if progress is not None:
+            progress.stage = "saving"
+        self.save(vectorstore, manifest)
+        report = IngestionReport(
+            added=sorted(manifest),
+            chunks_added=sum(len(entry["chunk_ids"]) for entry in manifest.values()),
+            full_rebuild=True,
+            chunks_per_second=round(chunks_per_second, 1)
+        )
+        report.duration_seconds = round(time.perf_counter() - start, 3)
+        if progress is not None:
+            progress.stage = "loading"
+        return load_vectorstore(self.index_path, self.query_embeddings), report
+
+    def reload_vectorstore(self, progress: Optional[ReloadProgress] = None) -> Tuple[FAISS, IngestionReport]:
+        """Bring the saved index up to date with the documents and load the result.
+
+        The files are replaced atomically, so a vectorstore loaded earlier
+        keeps serving from the previous version until it is dropped.
+        """
+        # Only embed added or changed files; fall back to a full build without a
+        # manifest, when the configured index spec changed or when the saved
+        # chunks predate the current metadata fields
+        start = time.perf_counter()
+        if progress is not None:
+            progress.stage = "scanning"
+        saved = self._read_manifest()
+        manifest = saved["files"] if saved is not None else None
+        saved_spec = (saved or {}).get("index_spec") or {"factory": "Flat"}
+
+        if (manifest is None or not vectorstore_exists(self.index_path)
+                or saved_spec["factory"] != self.index_spec.factory
+                or saved.get("metadata_version", 1) != METADATA_VERSION):
+            return self._full_reload(start, progress)
+
+        report = IngestionReport()
+        current_files = self.list_files()
+
+        # Delete chunks from removed files
+        stale_ids = []
+        for path in sorted(set(manifest) - set(current_files)):
+            stale_ids.extend(manifest.pop(path)["chunk_ids"])
+            report.removed.append(path)
+
+        changed_files = []
+        for path in current_files:
+            previous = manifest.get(path)
+            if previous is not None and previous["hash"] == self.hash_file(path):
+                report.unchanged += 1
+                continue
+
+            if previous is None:
+                report.added.append(path)
+            else:
+                # Replace every chunk the old version of the file produced
+                stale_ids.extend(previous["chunk_ids"])
+                report.updated.append(path)
+            changed_files.append(path)
+
+        if stale_ids and not self.index_spec.supports_remove:
+            return self._full_reload(start, progress)
+
+        if progress is not None:
+            progress.stage = "embedding"
+            progress.files_total += len(changed_files)
+        if stale_ids or changed_files:
+            # Update a writable in-memory copy; queries keep using the memory-mapped one
+            vectorstore = load_vectorstore(self.index_path, self.embeddings, mmap=False)
+            if stale_ids:
+                vectorstore.delete(stale_ids)
+            if changed_files:
+                with EmbeddingPipeline(self.embeddings, self.batch_size, self.workers) as pipeline:
+                    self.embed_chunks(vectorstore, self.iter_chunks(changed_files, manifest, progress),
+                                      pipeline, progress)
+                report.chunks_added = pipeline.chunks_embedded
+                report.chunks_per_second = round(pipeline.chunks_per_second, 1)
+            if progress is not None:
+                progress.stage = "saving"
+            self.save(vectorstore, manifest)
+
+        report.chunks_removed = len(stale_ids)
+        report.duration_seconds = round(time.perf_counter() - start, 3)
+        if progress is not None:
+            progress.stage = "loading"
+        return load_vectorstore(self.index_path, self.query_embeddings), report
+
     def get_or_create_vectorstore(self, force_reload=False):
-        index_path = "app/data/faiss_index"
-        if os.path.exists(index_path) and not force_reload:
-            vectorstore = FAISS.load_local(
-                index_path,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+        if vectorstore_exists(self.index_path) and not force_reload:
+            vectorstore = load_vectorstore(self.index_path, self.query_embeddings)
         else:
-            vectorstore = self.process_documents()
-            os.makedirs(index_path, exist_ok=True)
-            vectorstore.save_local(index_path)
+            vectorstore, _ = self.reload_vectorstore()
         return vectorstore
+
+class ShardedIngestion:
+    """Keeps one index per team: a shard for each top-level folder of the
+    documents directory, plus ``_root`` for files directly in it.
+
+    Shards live under ``index_path/<shard>`` with their own manifest, so a
+    change to one team's documents only re-embeds and rewrites that shard,
+    and a reload can be limited to chosen shards. The embedding model is
+    shared by all of them.
+    """
+
+    def __init__(self, data_dir=None, index_path=None, shard_key: str = "team", **kwargs):
+        if shard_key not in SHARD_KEYS:
+            raise ValueError(f"Cannot shard by {shard_key!r}, expected one of {SHARD_KEYS}")
+        self.shard_key = shard_key
+        self.data_dir = data_dir or os.getenv("DOCUMENTS_DIR", "app/data/documents")
+        self.index_path = index_path or os.getenv("FAISS_INDEX_PATH", "app/data/faiss_index")
+        self._kwargs = kwargs
+        self._shards: Dict[str, DocumentIngestion] = {}
+        root = self.shard(ROOT_SHARD)
+        self.embeddings = root.embeddings
+        self.query_embeddings = root.query_embeddings
+
+    def shard(self, name: str) -> DocumentIngestion:
+        if name not in self._shards:
+            is_root = name == ROOT_SHARD
+            self._shards[name] = DocumentIngestion(
+                self.data_dir,
+                os.path.join(self.index_path, name),
+                embeddings=getattr(self, "embeddings", None),
+                query_embeddings=getattr(self, "query_embeddings", None),
+                subdir=None if is_root else name,
+                recursive=not is_root,
+                **self._kwargs
+            )
+        return self._shards[name]
+
+    def shard_names(self) -> List[str]:
+        """Shards for the documents present now: one per team folder, plus the root.
+
+        Hidden folders and folders without a supported file get no shard, so
+        a team folder whose files were all deleted is dropped on reload.
+        """
+        names = []
+        for entry in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, entry)
+            if os.path.isdir(path):
+                if not entry.startswith(".") and self._has_documents(entry):
+                    names.append(entry)
+            elif entry.endswith(SUPPORTED_EXTENSIONS) and ROOT_SHARD not in names:
+                names.insert(0, ROOT_SHARD)
+        return names
+
+    def _has_documents(self, subdir: str) -> bool:
+        return next(DocumentLoader(self.data_dir, workers=1, subdir=subdir).iter_files(), None) is not None
+
+    def index_exists(self) -> bool:
+        names = self.shard_names()
+        return bool(names) and all(self.shard(name).index_exists() for name in names)
+
+    def indexed_shards(self) -> List[str]:
+        """Shards that have a saved index, whether or not their folder still exists."""
+        if not os.path.isdir(self.index_path):
+            return []
+        return [
+            entry for entry in sorted(os.listdir(self.index_path))
+            if vectorstore_exists(os.path.join(self.index_path, entry))
+        ]
+
+    def signature(self) -> tuple:
+        return tuple((name, self.shard(name).signature()) for name in self.indexed_shards())
+
+    def load_index(self) -> Dict[str, FAISS]:
+        return {name: self.shard(name).load_index() for name in self.indexed_shards()}
+
+    def get_or_create_vectorstore(self, force_reload=False) -> Dict[str, FAISS]:
+        names = self.shard_names()
+        if not names:
+            raise ValueError(f"No documents found in {self.data_dir}")
+        return {name: self.shard(name).get_or_create_vectorstore(force_reload) for name in names}
+
+    def reload_vectorstore(self, progress: Optional[ReloadProgress] = None,
+                           shards: Optional[List[str]] = None) -> Tuple[Dict[str, FAISS], IngestionReport]:
+        """Reload every shard, or only ``shards``, and return all current shards.
+
+        Shards whose folder was removed are dropped along with their index.
+        """
+        start = time.perf_counter()
+        names = self.shard_names()
+        if not names:
+            raise ValueError(f"No documents found in {self.data_dir}")
+        vectorstores, report = {}, IngestionReport()
+        for name in names:
+            shard = self.shard(name)
+            if shards is not None and name not in shards and shard.index_exists():
+                vectorstores[name] = load_vectorstore(shard.index_path, self.query_embeddings)
+                continue
+            if progress is not None:
+                progress.shard = name
+            vectorstores[name], shard_report = shard.reload_vectorstore(progress)
+            self._merge(report, shard_report)
+
+        for name in self._removed_shards(names):
+            shard = self.shard(name)
+            manifest = shard.load_manifest() or {}
+            report.removed.extend(sorted(manifest))
+            report.chunks_removed += sum(len(entry["chunk_ids"]) for entry in manifest.values())
+            shutil.rmtree(shard.index_path)
+            del self._shards[name]
+
+        if progress is not None:
+            progress.shard = None
+        report.duration_seconds = round(time.perf_counter() - start, 3)
+        if report.duration_seconds > 0:
+            report.chunks_per_second = round(report.chunks_added / report.duration_seconds, 1)
+        return vectorstores, report
+
+    def _removed_shards(self, names: List[str]) -> List[str]:
+        return [name for name in self.indexed_shards() if name not in names]
+
+    def _merge(self, report: IngestionReport, shard_report: IngestionReport):
+        report.added.extend(shard_report.added)
+        report.updated.extend(shard_report.updated)
+        report.removed.extend(shard_report.removed)
+        report.unchanged += shard_report.unchanged
+        report.chunks_added += shard_report.chunks_added
+        report.chunks_removed += shard_report.chunks_removed
+        report.full_rebuild = report.full_rebuild or shard_report.full_rebuild
+
+def create_ingestion(**kwargs):
+    """A DocumentIngestion, or a ShardedIngestion when FAISS_SHARD_BY names a key."""
+    shard_key = os.getenv("FAISS_SHARD_BY", "")
+    if shard_key:
+        return ShardedIngestion(shard_key=shard_key, **kwargs)
+    return DocumentIngestion(**kwargs)
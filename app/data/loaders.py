@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import mmap
+import logging
+from collections import deque
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".log", ".jsonl")
+
+# Record fields tried, in order, for the text of a JSONL document
+JSONL_TEXT_FIELDS = ("text", "content", "body", "message", "description")
+
+# Filterable metadata read from "Component: ..." style header lines or JSONL record fields.
+# The team is not among them: it always comes from the folder, which is also what picks the shard
+METADATA_FIELDS = ("component", "date")
+HEADER_LINES = 20
+HEADER_FIELD = re.compile(r"^\s*(component|date)\s*:\s*(.+?)\s*$", re.IGNORECASE)
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def parallel_map(fn: Callable[[T], R], items: Iterable[T], workers: int) -> Iterator[R]:
+    """Apply ``fn`` on a thread pool, yielding results lazily in input order.
+
+    At most ``2 * workers`` calls are in flight, so results are never
+    buffered for the whole input.
+    """
+    items = iter(items)
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def parse_date(value) -> Optional[str]:
+    """Normalise a header or record date to ``YYYY-MM-DD``, or None if it has none."""
+    match = ISO_DATE.search(str(value))
+    return match.group(0) if match else None
+
+def parse_header(text: str) -> Dict[str, str]:
+    """Read ``Component:`` and ``Date:`` lines from the top of a document."""
+    fields = {}
+    for line in text.splitlines()[:HEADER_LINES]:
+        match = HEADER_FIELD.match(line.lstrip("\ufeff"))
+        if match:
+            fields.setdefault(match.group(1).lower(), match.group(2))
+    return fields
+
+class DocumentLoader:
+    """Recursive loader for text, Markdown, log and JSONL files.
+
+    Text files larger than ``mmap_threshold`` bytes are memory-mapped and
+    yielded in ``block_size`` segments cut at line boundaries.
+
+    Every document carries ``team`` (the top-level folder under ``root``),
+    ``component`` and ``date`` metadata for filtered retrieval; header lines
+    or JSONL record fields override the component and date. ``subdir`` limits loading
+    to one folder under ``root``, and ``recursive=False`` to the files
+    directly in it, without changing the metadata.
+    """
+
+    def __init__(self, root: str, workers: Optional[int] = None,
+                 mmap_threshold: int = 8 * 1024 * 1024, block_size: int = 1024 * 1024,
+                 subdir: Optional[str] = None, recursive: bool = True):
+        self.root = root
+        self.workers = workers if workers is not None else int(os.getenv("LOADER_WORKERS", "4"))
+        self.mmap_threshold = mmap_threshold
+        self.block_size = block_size
+        self.subdir = subdir
+        self.recursive = recursive
+
+    def iter_files(self) -> Iterator[str]:
+        base = os.path.join(self.root, self.subdir) if self.subdir else self.root
+        for dirpath, dirnames, filenames in os.walk(base):
+            if not self.recursive:
+                dirnames.clear()
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.join(dirpath, filename)
+
+    def lazy_load(self) -> Iterator[Document]:
+        # Files above the threshold stream block by block here; only small files go through the pool,
+        # whose results are held whole until yielded
+        for large, paths in groupby(self.iter_files(), key=self._is_large):
+            if large:
+                for path in paths:
+                    yield from self.iter_file(path)
+            else:
+                for documents in parallel_map(self.load_file, paths, self.workers):
+                    yield from documents
+
+    def load_file(self, path: str) -> List[Document]:
+        return list(self.iter_file(path))
+
+    def iter_file(self, path: str) -> Iterator[Document]:
+        """Yield the documents of one file, without reading large files whole."""
+        stat = os.stat(path)
+        metadata = {
+            "source": path,
+            "file_type": os.path.splitext(path)[1].lstrip("."),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "team": self.team(path),
+            "component": None,
+            "date": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d"),
+        }
+
+        if path.endswith(".jsonl"):
+            yield from self._load_jsonl(path, metadata)
+        elif stat.st_size > self.mmap_threshold:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                metadata = self._with_fields(metadata, parse_header(f.read(64 * 1024)))
+            yield from self._load_mmap(path, metadata)
+        else:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            yield Document(page_content=text, metadata=self._with_fields(metadata, parse_header(text)))
+
+    def team(self, path: str) -> Optional[str]:
+        """The top-level folder a file sits in, or None for files directly in ``root``."""
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        return parts[0] if len(parts) > 1 else None
+
+    def _is_large(self, path: str) -> bool:
+        return os.path.getsize(path) > self.mmap_threshold
+
+    def _with_fields(self, metadata: dict, fields: dict) -> dict:
+        updated = dict(metadata)
+        for key in METADATA_FIELDS:
+            value = fields.get(key)
+            if value is None or value == "":
+                continue
+            if key == "date":
+                value = parse_date(value) or updated["date"]
+            updated[key] = str(value)
+        return updated
+
+    def _load_jsonl(self, path: str, metadata: dict) -> Iterator[Document]:
+        # One document per record; a malformed line is skipped rather than failing the whole load
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning("Skipping malformed JSONL record at %s:%d: %s", path, line_number, e)
+                    continue
+                text = None
+                record_metadata = metadata
+                if isinstance(record, dict):
+                    text = next((record[key] for key in JSONL_TEXT_FIELDS if isinstance(record.get(key), str)), None)
+                    record_metadata = self._with_fields(metadata, record)
+                if text is None:
+                    text = json.dumps(record)
+                yield Document(page_content=text, metadata={**record_metadata, "line": line_number})
+
+    def _load_mmap(self, path: str, metadata: dict) -> Iterator[Document]:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            offset = 0
+            size = len(mapped)
+            while offset < size:
+                end = min(offset + self.block_size, size)
+                if end < size:
+                    # Cut at the last newline so lines are not split across segments
+                    newline = mapped.rfind(b"\n", offset, end)
+                    if newline > offset:
+                        end = newline + 1
+                text = mapped[offset:end].decode("utf-8", errors="replace")
+                yield Document(page_content=text, metadata={**metadata, "offset": offset})
+                offset = end
@@ -0,0 +1,214 @@
+import os
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+from app.data.ingestion import IngestionReport, ReloadProgress
+
+logger = logging.getLogger(__name__)
+
+class ReloadJob(BaseModel):
+    job_id: str = Field(description="ID to poll the job with")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(default="queued")
+    progress: Dict[str, Any] = Field(default_factory=dict, description="Stage and file/chunk counts")
+    requests: int = Field(default=1, description="Reload requests coalesced into this job")
+    shards: Optional[List[str]] = Field(default=None, description="Shards to reload; all when unset")
+    version: Optional[int] = Field(default=None, description="Index version swapped in by this job")
+    report: Optional[IngestionReport] = Field(default=None, description="What the reload changed")
+    error: Optional[str] = Field(default=None)
+    created_at: float = Field(default_factory=time.time)
+    started_at: Optional[float] = Field(default=None)
+    finished_at: Optional[float] = Field(default=None)
+
+@contextmanager
+def interprocess_lock(path: Optional[str], shared: bool = False):
+    """Hold a file lock across worker processes.
+
+    Reloads take it exclusively, so only one worker reloads at a time;
+    loading the saved index takes it shared, so it never sees half a save.
+    """
+    if path is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class ReloadManager:
+    """Runs document reloads one at a time in a background thread.
+
+    A reload request joins the queued job if there is one; otherwise it
+    queues a new job, which starts once the running one (if any) finishes.
+    So at most one reload runs and one waits, and a request made during a
+    reload still sees every file change made before it. A job limited to
+    some shards grows to cover the shards of every request it absorbs. Each successful
+    reload is handed to ``on_reload(vectorstore, report)``, which swaps it in
+    and returns the new index version. With ``lock_path`` set, reloads in
+    different worker processes wait for each other.
+    """
+
+    def __init__(self, ingestion, on_reload: Callable[[Any, IngestionReport], int], history: int = 20,
+                 lock_path: Optional[str] = None):
+        self.ingestion = ingestion
+        self.on_reload = on_reload
+        self.history = history
+        self.lock_path = lock_path
+        self._jobs: "OrderedDict[str, ReloadJob]" = OrderedDict()
+        self._progress: Dict[str, ReloadProgress] = {}
+        self._done: Dict[str, threading.Event] = {}
+        self._queued: Optional[str] = None
+        self._running: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def request(self, shards: Optional[List[str]] = None) -> ReloadJob:
+        """Queue a reload, or join the one already waiting to start."""
+        with self._lock:
+            if self._queued is not None:
+                job = self._jobs[self._queued]
+                job.requests += 1
+                if job.shards is not None:
+                    job.shards = None if shards is None else sorted(set(job.shards) | set(shards))
+                return self._snapshot(job)
+
+            job = ReloadJob(job_id=uuid.uuid4().hex, shards=sorted(set(shards)) if shards is not None else None)
+            self._jobs[job.job_id] = job
+            self._progress[job.job_id] = ReloadProgress()
+            self._done[job.job_id] = threading.Event()
+            self._queued = job.job_id
+            self._trim()
+            if self._running is None:
+                self._start_next()
+            return self._snapshot(job)
+
+    def get(self, job_id: str) -> Optional[ReloadJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[ReloadJob]:
+        """Block until the job has finished (or ``timeout`` passes) and return it."""
+        done = self._done.get(job_id)
+        if done is not None:
+            done.wait(timeout)
+        return self.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._queued,
+                "jobs": len(self._jobs),
+                "failed": sum(job.status == "failed" for job in self._jobs.values()),
+            }
+
+    def _start_next(self):
+        # Called with the lock held
+        job_id, self._queued = self._queued, None
+        self._running = job_id
+        threading.Thread(target=self._run, args=(job_id,), name=f"reload-{job_id[:8]}", daemon=True).start()
+
+    def _run(self, job_id: str):
+        job, progress = self._jobs[job_id], self._progress[job_id]
+        job.status, job.started_at = "running", time.time()
+        try:
+            with interprocess_lock(self.lock_path):
+                if job.shards is None:
+                    vectorstore, report = self.ingestion.reload_vectorstore(progress)
+                else:
+                    vectorstore, report = self.ingestion.reload_vectorstore(progress, shards=job.shards)
+                progress.stage = "swapping"
+                job.version = self.on_reload(vectorstore, report)
+            job.report = report
+            job.status = "succeeded"
+        except Exception as e:
+            logger.exception("Document reload %s failed", job_id)
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            progress.stage = "done"
+            job.finished_at = time.time()
+            with self._lock:
+                self._running = None
+                if self._queued is not None:
+                    self._start_next()
+            self._done[job_id].set()
+
+    def _snapshot(self, job: ReloadJob) -> ReloadJob:
+        progress = self._progress.get(job.job_id)
+        return job.copy(update={"progress": progress.dict() if progress is not None else job.progress})
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history limit
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("succeeded", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+            self._progress.pop(job_id, None)
+            self._done.pop(job_id, None)
+
+class IndexWatcher:
+    """Picks up indexes saved by other worker processes.
+
+    Every ``interval`` seconds (``INDEX_WATCH_INTERVAL``; 0 disables it) the
+    saved index's signature is compared with the one this process serves.
+    When it differs, ``on_change()`` loads and swaps in the saved index
+    without re-embedding anything; it may return False to be asked again on
+    the next poll, e.g. while this process is running its own reload.
+    """
+
+    def __init__(self, ingestion, on_change: Callable[[], bool], interval: Optional[float] = None):
+        self.ingestion = ingestion
+        self.on_change = on_change
+        self.interval = interval if interval is not None else float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+        self._signature = ingestion.signature()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.counters = {"checks": 0, "reloads": 0, "errors": 0}
+
+    def sync(self):
+        """Record the saved index as served, after this process swapped it in itself."""
+        self._signature = self.ingestion.signature()
+
+    def check(self) -> bool:
+        """Swap in the saved index if it changed; return whether it did."""
+        self.counters["checks"] += 1
+        signature = self.ingestion.signature()
+        if signature == self._signature or not self.on_change():
+            return False
+        self._signature = signature
+        self.counters["reloads"] += 1
+        return True
+
+    def start(self):
+        """Start polling in a daemon thread; safe to call again, e.g. in each forked worker."""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and wait for the thread to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "running": self._thread is not None and self._thread.is_alive(),
+                **self.counters}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Loading the index saved by another worker failed")
+                self.counters["errors"] += 1
@@ -0,0 +1,138 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.data.index import similarity_search, similarity_search_by_vectors
+from app.data.store import SQLiteDocstore
+from app.utils.metrics import span
+
+VECTOR = "vector"
+KEYWORD = "bm25"
+HYBRID = "hybrid"
+RERANK = "rerank"
+RETRIEVAL_MODES = (VECTOR, KEYWORD, HYBRID, RERANK)
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse ranked ID lists; each list contributes 1 / (k + rank) per ID."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def merge_scored(hits: List[List[Tuple[Any, float]]], limit: int) -> List:
+    """Merge several ``(document, score)`` lists into one ranking, highest score first."""
+    ranked = sorted((hit for shard_hits in hits for hit in shard_hits), key=lambda hit: hit[1], reverse=True)
+    return [doc for doc, _ in ranked[:limit]]
+
+class CrossEncoderReranker:
+    """Re-scores (query, chunk) pairs with a small local cross-encoder."""
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self._model = None
+
+    def rerank(self, query: str, documents: List, k: int) -> List:
+        if not documents:
+            return documents
+        if self._model is None:
+            # Loaded on first use so the default modes do not pay for it
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name)
+        scores = self._model.predict([(query, doc.page_content) for doc in documents])
+        ranked = sorted(zip(scores, range(len(documents))), reverse=True)
+        return [documents[i] for _, i in ranked[:k]]
+
+class HybridRetriever:
+    """Fuses BM25 keyword hits with vector hits from the same vectorstore."""
+
+    def __init__(self, vectorstore, k: int = 3, fetch_k: Optional[int] = None, reranker=None):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.fetch_k = fetch_k or int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+        self.reranker = reranker
+
+    @staticmethod
+    def supports(vectorstore) -> bool:
+        docstore = getattr(vectorstore, "docstore", None)
+        return isinstance(docstore, SQLiteDocstore) and docstore.chunks.has_keyword_index
+
+    def retrieve(self, query: str, mode: str = HYBRID, nprobe: Optional[int] = None,
+                 ef_search: Optional[int] = None, metadata_filter=None) -> List:
+        self._check_mode(mode)
+        if mode == VECTOR:
+            return similarity_search(self.vectorstore, query, k=self.k, nprobe=nprobe,
+                                     ef_search=ef_search, metadata_filter=metadata_filter)
+        if mode == KEYWORD:
+            return self._documents(self._keyword_ids(query, metadata_filter)[:self.k])
+
+        vector_docs = similarity_search(self.vectorstore, query, k=self.fetch_k, nprobe=nprobe,
+                                        ef_search=ef_search, metadata_filter=metadata_filter)
+        return self._fuse(query, vector_docs, mode, metadata_filter)
+
+    def retrieve_batch(self, queries: List[str], vectors: np.ndarray, mode: str = HYBRID,
+                       nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                       metadata_filter=None) -> List[List]:
+        """Retrieve for many queries at once, sharing one FAISS search."""
+        self._check_mode(mode)
+        if mode == KEYWORD:
+            return [self._documents(self._keyword_ids(query, metadata_filter)[:self.k]) for query in queries]
+
+        k = self.k if mode == VECTOR else self.fetch_k
+        vector_results = similarity_search_by_vectors(self.vectorstore, vectors, k, nprobe, ef_search, metadata_filter)
+        if mode == VECTOR:
+            return vector_results
+        return [self._fuse(query, docs, mode, metadata_filter) for query, docs in zip(queries, vector_results)]
+
+    def candidates_batch(self, queries: List[str], vectors: np.ndarray, mode: str = HYBRID,
+                         nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                         metadata_filter=None) -> List[Tuple[List, List]]:
+        """Scored vector and keyword hits per query, unfused.
+
+        Used to merge hits across shards before fusing them with ``fuse``.
+        """
+        self._check_mode(mode)
+        if mode == KEYWORD:
+            vector_hits = [[] for _ in queries]
+        else:
+            k = self.k if mode == VECTOR else self.fetch_k
+            vector_hits = similarity_search_by_vectors(
+                self.vectorstore, vectors, k, nprobe, ef_search, metadata_filter, with_scores=True
+            )
+        if mode == VECTOR:
+            keyword_hits = [[] for _ in queries]
+        else:
+            keyword_hits = [self._keyword_hits(query, metadata_filter) for query in queries]
+        return list(zip(vector_hits, keyword_hits))
+
+    def fuse(self, query: str, vector_docs: List, keyword_docs: List, mode: str = HYBRID) -> List:
+        """Fuse ranked vector and keyword documents, re-ranking them in rerank mode."""
+        documents = {doc.id: doc for doc in vector_docs + keyword_docs}
+        fused_ids = reciprocal_rank_fusion([[doc.id for doc in vector_docs], [doc.id for doc in keyword_docs]])
+        if mode == RERANK and self.reranker is not None:
+            with span("rerank", "qa"):
+                return self.reranker.rerank(query, [documents[i] for i in fused_ids[:self.fetch_k]], self.k)
+        return [documents[i] for i in fused_ids[:self.k]]
+
+    def _check_mode(self, mode: str):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+
+    def _keyword_ids(self, query: str, metadata_filter=None) -> List[str]:
+        with span("keyword_search", "qa"):
+            hits = self.vectorstore.docstore.chunks.search_keywords(query, self.fetch_k, metadata_filter)
+            return [chunk_id for chunk_id, _ in hits]
+
+    def _keyword_hits(self, query: str, metadata_filter=None) -> List[Tuple[Any, float]]:
+        with span("keyword_search", "qa"):
+            hits = self.vectorstore.docstore.chunks.search_keywords(query, self.fetch_k, metadata_filter)
+        return [(self.vectorstore.docstore.search(chunk_id), score) for chunk_id, score in hits]
+
+    def _fuse(self, query: str, vector_docs: List, mode: str, metadata_filter=None) -> List:
+        fused_ids = reciprocal_rank_fusion([[doc.id for doc in vector_docs], self._keyword_ids(query, metadata_filter)])
+        if mode == RERANK and self.reranker is not None:
+            with span("rerank", "qa"):
+                return self.reranker.rerank(query, self._documents(fused_ids[:self.fetch_k]), self.k)
+        return self._documents(fused_ids[:self.k])
+
+    def _documents(self, chunk_ids: List[str]) -> List:
+        return [self.vectorstore.docstore.search(chunk_id) for chunk_id in chunk_ids]
@@ -0,0 +1,66 @@
+"""Retrieval quality and latency report for each retrieval mode.
+
+Usage:
+    python -m app.data.retrieval_report --queries eval.jsonl --k 3
+
+Each line of the queries file is a JSON object such as
+``{"query": "What causes ERR-1042?", "expected": ["ERR-1042"]}``; a retrieved
+chunk counts as relevant when it contains any of the expected strings.
+"""
+import json
+import time
+import argparse
+from typing import List
+import numpy as np
+from app.data.retrieval import HybridRetriever, RETRIEVAL_MODES
+
+def evaluate_modes(retriever: HybridRetriever, cases: List[dict], modes=RETRIEVAL_MODES) -> List[dict]:
+    """Measure hit rate, MRR, latency and context size of each mode."""
+    report = []
+    for mode in modes:
+        hits, reciprocal_ranks, latencies, context_chars = [], [], [], []
+        for case in cases:
+            start = time.perf_counter()
+            documents = retriever.retrieve(case["query"], mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            relevant = [
+                any(expected in doc.page_content for expected in case["expected"])
+                for doc in documents
+            ]
+            first_hit = relevant.index(True) + 1 if any(relevant) else None
+            hits.append(first_hit is not None)
+            reciprocal_ranks.append(1.0 / first_hit if first_hit else 0.0)
+            context_chars.append(sum(len(doc.page_content) for doc in documents))
+
+        report.append({
+            "mode": mode,
+            "hit_rate_at_k": round(float(np.mean(hits)), 4),
+            "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+            "latency_ms_mean": round(float(np.mean(latencies)), 3),
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+            "context_chars_mean": round(float(np.mean(context_chars)), 1),
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", required=True, help="JSONL file of queries and expected strings")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(RETRIEVAL_MODES), choices=RETRIEVAL_MODES)
+    args = parser.parse_args()
+
+    from app.data.ingestion import DocumentIngestion
+    from app.data.retrieval import CrossEncoderReranker
+
+    vectorstore = DocumentIngestion().get_or_create_vectorstore()
+    if not HybridRetriever.supports(vectorstore):
+        parser.error("The saved index has no keyword index; reload documents first")
+    retriever = HybridRetriever(vectorstore, k=args.k, reranker=CrossEncoderReranker())
+
+    with open(args.queries) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    print(json.dumps(evaluate_modes(retriever, cases, args.modes), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+# Keep error codes and identifiers such as ERR-1042 or auth_service as single tokens
+KEYWORD_TOKENIZER = "unicode61 tokenchars '-_'"
+KEYWORD_TERM = re.compile(r"[\w\-]+")
+
+# Position lists kept per distinct metadata filter
+FILTER_CACHE_SIZE = 64
+
+# Memory-map flat vector storage (including HNSW storage) so workers share
+# the page cache. IVF inverted lists need IO_FLAG_MMAP instead, which faiss
+# rejects in combination with IO_FLAG_MMAP_IFC.
+MMAP_FLAGS = (
+    getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY,
+    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+)
+
+class SQLiteChunkStore:
+    """Read-only access to chunk text and metadata stored in SQLite.
+
+    The connection is reopened in a forked worker, since SQLite handles must
+    not be shared across processes; the memory-mapped index itself is.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pid = None
+        self._connection = None
+        # Handles inherited from a parent process, kept open so they are never closed here
+        self._inherited = []
+        self._lock = threading.Lock()
+        self.has_keyword_index = self._db().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'"
+        ).fetchone() is not None
+        # The store is a read-only snapshot, so filter results never go stale
+        self._positions: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+
+    def _db(self) -> sqlite3.Connection:
+        # Called with the lock held, or from __init__
+        if self._pid != os.getpid():
+            if self._connection is not None:
+                self._inherited.append(self._connection)
+            self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._connection
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def id_at(self, position: int):
+        with self._lock:
+            row = self._db().execute(
+                "SELECT id FROM chunks WHERE position = ?", (int(position),)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def document(self, chunk_id: str):
+        with self._lock:
+            row = self._db().execute(
+                "SELECT content, metadata FROM chunks WHERE id = ?", (chunk_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Document(page_content=row[0], metadata=json.loads(row[1]), id=chunk_id)
+
+    def rows(self) -> Iterator[tuple]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT position, id, content, metadata FROM chunks ORDER BY position"
+            ).fetchall()
+        return iter(rows)
+
+    def positions(self, metadata_filter) -> np.ndarray:
+        """FAISS positions of the chunks whose metadata matches the filter."""
+        key = metadata_filter.key()
+        with self._lock:
+            positions = self._positions.get(key)
+            if positions is not None:
+                self._positions.move_to_end(key)
+                return positions
+            where, params = metadata_filter.sql()
+            rows = self._db().execute(f"SELECT position FROM chunks WHERE {where}", params).fetchall()
+            positions = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            self._positions[key] = positions
+            if len(self._positions) > FILTER_CACHE_SIZE:
+                self._positions.popitem(last=False)
+        return positions
+
+    def search_keywords(self, query: str, k: int, metadata_filter=None) -> List[Tuple[str, float]]:
+        """BM25 search over chunk text, best match first, optionally within a metadata filter."""
+        terms = KEYWORD_TERM.findall(query.lower())
+        if not terms or not self.has_keyword_index:
+            return []
+        match = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        where, params = metadata_filter.sql("chunks.metadata") if metadata_filter is not None else ("1", [])
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT chunks.id, bm25(chunks_fts) AS score FROM chunks_fts "
+                "JOIN chunks ON chunks.position = chunks_fts.rowid "
+                f"WHERE chunks_fts MATCH ? AND {where} ORDER BY score LIMIT ?",
+                (match, *params, k)
+            ).fetchall()
+        # SQLite reports BM25 as a negative number where lower is better
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection, self._pid = None, None
+
+class SQLiteDocstore(Docstore):
+    """Docstore that loads chunks lazily by ID."""
+
+    def __init__(self, chunks: SQLiteChunkStore):
+        self.chunks = chunks
+
+    def search(self, search: str) -> Union[str, Document]:
+        document = self.chunks.document(search)
+        if document is None:
+            return f"ID {search} not found."
+        return document
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only; reload documents to change it")
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only; reload documents to change it")
+
+class SQLiteIndexMapping(Mapping):
+    """Lazy FAISS position -> chunk ID mapping backed by the chunk store."""
+
+    def __init__(self, chunks: SQLiteChunkStore):
+        self.chunks = chunks
+
+    def __getitem__(self, position: int) -> str:
+        chunk_id = self.chunks.id_at(position)
+        if chunk_id is None:
+            raise KeyError(position)
+        return chunk_id
+
+    def __iter__(self):
+        return iter(range(len(self.chunks)))
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+def save_vectorstore(vectorstore: FAISS, path: str):
+    """Write vectors to a FAISS index file and chunks to SQLite, replacing each file atomically."""
+    os.makedirs(path, exist_ok=True)
+    index_file = os.path.join(path, INDEX_FILE)
+    docstore_file = os.path.join(path, DOCSTORE_FILE)
+
+    faiss.write_index(vectorstore.index, index_file + ".tmp")
+
+    if os.path.exists(docstore_file + ".tmp"):
+        os.remove(docstore_file + ".tmp")
+    connection = sqlite3.connect(docstore_file + ".tmp")
+    connection.execute(
+        "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT UNIQUE, content TEXT, metadata TEXT)"
+    )
+    connection.executemany(
+        "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+        (
+            (position, chunk_id, document.page_content, json.dumps(document.metadata))
+            for position, chunk_id in sorted(vectorstore.index_to_docstore_id.items())
+            for document in [vectorstore.docstore.search(chunk_id)]
+        )
+    )
+    # BM25 inverted index over the same rows, so it always matches the vectors
+    connection.execute(
+        "CREATE VIRTUAL TABLE chunks_fts USING fts5("
+        f"content, content='chunks', content_rowid='position', tokenize=\"{KEYWORD_TOKENIZER}\")"
+    )
+    connection.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+    connection.commit()
+    connection.close()
+
+    os.replace(index_file + ".tmp", index_file)
+    os.replace(docstore_file + ".tmp", docstore_file)
+
+def read_index_mmap(index_file: str) -> faiss.Index:
+    """Read an index read-only, memory-mapping as much of it as faiss allows."""
+    for flags in MMAP_FLAGS[:-1]:
+        try:
+            return faiss.read_index(index_file, flags)
+        except RuntimeError:
+            continue
+    return faiss.read_index(index_file, MMAP_FLAGS[-1])
+
+def vectorstore_exists(path: str) -> bool:
+    return (
+        os.path.exists(os.path.join(path, INDEX_FILE))
+        and os.path.exists(os.path.join(path, DOCSTORE_FILE))
+    )
+
+def load_vectorstore(path: str, embeddings, mmap: bool = True) -> FAISS:
+    """Load a saved vectorstore without unpickling anything.
+
+    With ``mmap=True`` the index is memory-mapped read-only and chunks are
+    fetched from SQLite on demand, which is what query serving needs. With
+    ``mmap=False`` everything is loaded into a writable in-memory vectorstore
+    so it can be updated incrementally.
+    """
+    index_file = os.path.join(path, INDEX_FILE)
+    chunks = SQLiteChunkStore(os.path.join(path, DOCSTORE_FILE))
+
+    if mmap:
+        return FAISS(
+            embedding_function=embeddings,
+            index=read_index_mmap(index_file),
+            docstore=SQLiteDocstore(chunks),
+            index_to_docstore_id=SQLiteIndexMapping(chunks)
+        )
+
+    index_to_docstore_id = {}
+    documents = {}
+    for position, chunk_id, content, metadata in chunks.rows():
+        index_to_docstore_id[position] = chunk_id
+        documents[chunk_id] = Document(page_content=content, metadata=json.loads(metadata), id=chunk_id)
+    chunks.close()
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=faiss.read_index(index_file),
+        docstore=InMemoryDocstore(documents),
+        index_to_docstore_id=index_to_docstore_id
+    )
@@ -0,0 +1,53 @@
+"""Gunicorn settings for running several API workers.
+
+Usage:
+    WEB_CONCURRENCY=4 gunicorn -c python:app.gunicorn_conf app.main:app
+
+The app is imported and its embedding model, index and tools are built in
+the master process before any worker is forked, so the workers share those
+pages copy-on-write instead of each loading its own copy. Workers share the
+response and query embedding caches through SQLite, and a document reload
+in one worker is picked up by the others within ``INDEX_WATCH_INTERVAL``
+seconds.
+"""
+import gc
+import os
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Read by app.main when it is imported below, so set before preloading
+os.environ.setdefault("CACHE_BACKEND", "sqlite")
+os.environ.setdefault("INDEX_WATCH_INTERVAL", "2")
+
+def when_ready(server):
+    """Build every component in the master, before the workers are forked."""
+    if not preload_app:
+        return
+    import app.main
+
+    server.log.info("Loading the embedding model and index before forking %d workers", workers)
+    app.main.startup.run()
+    if app.main.startup.failed:
+        # Workers still start, and report the error on /health
+        server.log.error("Startup failed: %s", app.main.startup.error)
+    if app.main.index_watcher is not None:
+        # Each worker runs its own watcher; the master serves no queries
+        app.main.index_watcher.stop()
+    # Keep the garbage collector from touching, and so copying, the preloaded objects
+    gc.freeze()
+
+def post_fork(server, worker):
+    # OpenMP and torch thread pools do not survive a fork, and N workers each
+    # running a full-size pool would oversubscribe the CPU anyway
+    threads = int(os.getenv("WORKER_THREADS", "1"))
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
@@ -1,17 +1,136 @@
-from fastapi import FastAPI, HTTPException
+import os
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
-from typing import Any, Dict
+from typing import Any, Dict, List, Literal, Optional
 
-from app.data.ingestion import DocumentIngestion
-from app.tools.qa_tool import QATool, QAToolInput
-from app.tools.summary_tool import SummaryTool, SummaryToolInput
-from app.agents.router_agent import RouterAgent, RouterInput, ToolType
+from app.data.filters import MetadataFilter
+from app.startup import Startup
+from app.utils.cache import is_cacheable
+from app.utils.errors import LLMUnavailableError, ServiceUnavailableError
+from app.utils.metrics import collect_timings, observe, register_stats, span
+
+logger = logging.getLogger(__name__)
+
+# Built in the background by _build_components; requests get a 503 until it finishes
+document_ingestion = None
+vectorstore = None
+qa_tool = None
+summary_tool = None
+router_agent = None
+response_cache = None
+batch_processor = None
+reload_manager = None
+index_watcher = None
+
+UNKNOWN_QUERY_RESULT = {"message": "I'm not sure how to process this query. Could you rephrase it?"}
+
+# Header that asks for per-stage timings in the response metadata
+DEBUG_TIMINGS_HEADER = "X-Debug-Timings"
+
+def _build_components(startup: Startup):
+    """Load the models and the index; runs in the startup thread."""
+    global document_ingestion, vectorstore, qa_tool, summary_tool, router_agent, response_cache, batch_processor
+    global reload_manager, index_watcher
+
+    # langchain, FAISS and the tools are imported here so the server answers /health immediately
+    with startup.step("imports"):
+        from app.agents.router_agent import RouterAgent
+        from app.batch import BatchProcessor
+        from app.data.ingestion import create_ingestion
+        from app.data.reload import IndexWatcher, ReloadManager
+        from app.tools.qa_tool import QATool
+        from app.tools.summary_tool import SummaryTool
+        from app.utils.cache import ResponseCache
+
+    with startup.step("embeddings"):
+        ingestion = create_ingestion()
+    with startup.step("load_index" if ingestion.index_exists() else "build_index"):
+        store = ingestion.get_or_create_vectorstore()
+    with startup.step("qa_tool"):
+        qa = QATool(store, shard_key=getattr(ingestion, "shard_key", None))
+    with startup.step("summary_tool"):
+        summary = SummaryTool()
+    with startup.step("router_agent"):
+        router = RouterAgent(embeddings=ingestion.query_embeddings)
+    with startup.step("response_cache"):
+        cache = ResponseCache(embeddings=ingestion.query_embeddings)
+        cache.version = _index_version(ingestion)
+
+    batch = BatchProcessor(
+        embeddings=ingestion.query_embeddings,
+        router_agent=router,
+        qa_tool=qa,
+        summary_tool=summary,
+        response_cache=cache,
+        unknown_result=UNKNOWN_QUERY_RESULT
+    )
+
+    document_ingestion, vectorstore, qa_tool, summary_tool = ingestion, store, qa, summary
+    router_agent, response_cache, batch_processor = router, cache, batch
+    # Worker processes serving the same index take turns reloading it, and
+    # each picks up the index the others saved
+    reload_manager = ReloadManager(ingestion, _swap_vectorstore,
+                                   lock_path=os.path.join(ingestion.index_path, ".reload.lock"))
+    index_watcher = IndexWatcher(ingestion, _load_saved_index)
+    index_watcher.start()
+
+def _swap_vectorstore(new_vectorstore, report) -> int:
+    """Swap a reloaded vectorstore into the QA tool; runs in the reload thread."""
+    global vectorstore
+    index_watcher.sync()
+    if not (report.added or report.updated or report.removed):
+        return qa_tool.version
+    version = qa_tool.swap(new_vectorstore)
+    vectorstore = new_vectorstore
+    # Cached answers may reference documents that changed
+    response_cache.invalidate(version=_index_version(document_ingestion))
+    return version
+
+def _load_saved_index() -> bool:
+    """Swap in an index another worker saved; runs in the watcher thread."""
+    global vectorstore
+    from app.data.reload import interprocess_lock
+
+    if reload_manager.stats()["running"] is not None:
+        # This worker's own reload will swap in what it saves
+        return False
+    # The index and docstore files are replaced one after the other, so wait out any save in progress
+    with interprocess_lock(reload_manager.lock_path, shared=True):
+        new_vectorstore = document_ingestion.load_index()
+    qa_tool.swap(new_vectorstore)
+    vectorstore = new_vectorstore
+    # The reloading worker already cleared the shared cache backend
+    response_cache.invalidate(shared=False, version=_index_version(document_ingestion))
+    return True
+
+def _index_version(ingestion) -> str:
+    """Names the saved index the same way in every worker, unlike ``qa_tool.version``."""
+    return str(ingestion.signature())
+
+startup = Startup(_build_components)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With gunicorn --preload the components were built before this worker was
+    # forked; threads do not survive a fork, so the watcher is restarted here
+    startup.start()
+    if index_watcher is not None:
+        index_watcher.start()
+    yield
 
 app = FastAPI(
     title="Internal AI Assistant",
     description="AI assistant for product and engineering teams",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -22,60 +141,315 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# Initialize components
-document_ingestion = DocumentIngestion()
-vectorstore = document_ingestion.get_or_create_vectorstore()
-qa_tool = QATool(vectorstore)
-summary_tool = SummaryTool()
-router_agent = RouterAgent()
+@app.exception_handler(ServiceUnavailableError)
+async def service_unavailable_handler(request: Request, exc: ServiceUnavailableError):
+    """Shed load quickly while starting up, or when the LLM queue is full or the backend is down."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after or os.getenv("LLM_RETRY_AFTER", "5"))}
+    )
+
+def require_ready():
+    """Dependency for endpoints that need the models and index loaded."""
+    startup.require()
+
+def _llm_stats() -> dict:
+    # Before startup finishes this raises, so the LLM client is not created early
+    startup.require()
+    from app.utils.llm import get_llm_pool
+    return get_llm_pool().stats()
+
+# Scraped from the components' stats() on every /metrics request; sources
+# that are not built yet are skipped
+register_stats({
+    "startup": startup.stats,
+    "cache": lambda: response_cache.stats(),
+    "llm": _llm_stats,
+    "router": lambda: router_agent.stats(),
+    "summary_parsing": lambda: summary_tool.parse_counter.stats(),
+    "vectorstore": lambda: {"vectors": qa_tool.index.ntotal, "version": qa_tool.version, "shards": len(qa_tool.index.shards)},
+    "reload": lambda: reload_manager.stats(),
+    "query_embeddings": lambda: document_ingestion.query_embeddings.stats(),
+    "index_watcher": lambda: index_watcher.stats(),
+})
 
 class QueryRequest(BaseModel):
     query: str
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    retrieval_mode: Optional[Literal["vector", "bm25", "hybrid", "rerank"]] = None
+    filters: Optional[MetadataFilter] = None
 
 class QueryResponse(BaseModel):
     result: Dict[str, Any]
     tool_used: str
     reasoning: str
+    metadata: Dict[str, Any] = {}
+
+def _metadata(cache_metadata: Dict[str, Any], timings: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    metadata = {"cache": cache_metadata}
+    if timings is not None:
+        metadata["timings_ms"] = timings
+    return metadata
+
+@app.post("/query", response_model=QueryResponse, dependencies=[Depends(require_ready)])
+async def process_query(request: QueryRequest,
+                        debug_timings: Optional[str] = Header(default=None, alias=DEBUG_TIMINGS_HEADER)):
+    """Process a user query through the AI assistant.
+
+    Send the ``X-Debug-Timings`` header to get per-stage timings in
+    ``metadata.timings_ms``.
+    """
+    from app.agents.router_agent import RouterInput, ToolType
+    from app.tools.qa_tool import QAToolInput
+    from app.tools.summary_tool import SummaryToolInput
 
-@app.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
-    """Process a user query through the AI assistant."""
     if not request.query:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    timings = collect_timings() if debug_timings else None
+    start = time.perf_counter()
+
+    # Serve repeated or near-identical questions from the response cache
+    cache_version = response_cache.version
+    cached, query_vector = await _cache_lookup(request)
+    if cached is not None:
+        payload, cache_metadata = cached
+        observe("total", "cache", time.perf_counter() - start)
+        return QueryResponse(**payload, metadata=_metadata(cache_metadata, timings))
     
     # Route the query
     router_input = RouterInput(query=request.query)
-    router_output = router_agent.route(router_input)
+    router_output = await router_agent.aroute(router_input)
     
     # Process with the appropriate tool
     result = None
     if router_output.tool == ToolType.QA:
-        qa_input = QAToolInput(query=router_output.reformulated_query)
-        result = qa_tool.run(qa_input)
+        qa_input = QAToolInput(
+            query=router_output.reformulated_query,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            retrieval_mode=request.retrieval_mode,
+            filters=request.filters
+        )
+        result = await qa_tool.arun(qa_input)
+    elif router_output.tool == ToolType.SUMMARY and router_output.summary is not None:
+        # The router already summarized the issue in the same generation
+        result = router_output.summary
     elif router_output.tool == ToolType.SUMMARY:
-        summary_input = SummaryToolInput(issue_text=router_output.reformulated_query)
-        result = summary_tool.run(summary_input)
+        # The report as the user wrote it; the router does not echo it back
+        summary_input = SummaryToolInput(issue_text=request.query)
+        result = await summary_tool.arun(summary_input)
     else:
-        result = {"message": "I'm not sure how to process this query. Could you rephrase it?"}
+        result = UNKNOWN_QUERY_RESULT
     
-    return QueryResponse(
-        result=result.dict() if hasattr(result, "dict") else result,
-        tool_used=router_output.tool,
-        reasoning=router_output.reasoning
+    payload = {
+        "result": result.dict() if hasattr(result, "dict") else result,
+        "tool_used": router_output.tool.value,
+        "reasoning": router_output.reasoning
+    }
+    if router_output.tool != ToolType.UNKNOWN and is_cacheable(request):
+        await asyncio.to_thread(response_cache.store, request.query, payload, query_vector, version=cache_version)
+
+    observe("total", router_output.tool.value, time.perf_counter() - start)
+    return QueryResponse(**payload, metadata=_metadata({"hit": False}, timings))
+
+@app.post("/query/stream", dependencies=[Depends(require_ready)])
+async def stream_query(request: QueryRequest,
+                       debug_timings: Optional[str] = Header(default=None, alias=DEBUG_TIMINGS_HEADER)):
+    """Process a query and stream progress as newline-delimited JSON events.
+
+    Events are emitted in order: ``route``, ``sources`` (QA only), one ``token``
+    per generated chunk, and a ``final`` event shaped like ``QueryResponse``.
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    return StreamingResponse(_stream_query_events(request, bool(debug_timings)), media_type="application/x-ndjson")
+
+async def _cache_lookup(request: QueryRequest):
+    # The cache is keyed on the query alone, so requests with retrieval options bypass it
+    if not is_cacheable(request):
+        return None, None
+    with span("cache_lookup", "api"):
+        return await asyncio.to_thread(response_cache.lookup, request.query)
+
+def _event(event_type: str, **fields) -> str:
+    return json.dumps({"type": event_type, **fields}) + "\n"
+
+async def _stream_query_events(request: QueryRequest, debug_timings: bool = False):
+    # Headers are already sent, so failures are reported in-band as a final error event
+    try:
+        timings = collect_timings() if debug_timings else None
+        cache_version = response_cache.version
+        cached, query_vector = await _cache_lookup(request)
+        if cached is not None:
+            payload, cache_metadata = cached
+            yield _event("final", **payload, metadata=_metadata(cache_metadata, timings))
+            return
+
+        async for line in _stream_answer(request, query_vector, cache_version, timings):
+            yield line
+    except LLMUnavailableError as e:
+        yield _event("error", detail=str(e), status_code=e.status_code)
+    except Exception:
+        logger.exception("Streaming query failed")
+        yield _event("error", detail="Internal server error", status_code=500)
+
+async def _stream_answer(request: QueryRequest, query_vector, cache_version: Optional[str],
+                         timings: Optional[Dict[str, float]]):
+    from app.agents.router_agent import RouterInput, ToolType
+    from app.tools.qa_tool import QAToolInput, QAToolOutput
+    from app.tools.summary_tool import SummaryToolInput
+
+    query = request.query
+    router_output = await router_agent.aroute(RouterInput(query=query))
+    yield _event(
+        "route",
+        tool=router_output.tool.value,
+        reasoning=router_output.reasoning,
+        reformulated_query=router_output.reformulated_query
     )
 
+    tokens = []
+    if router_output.tool == ToolType.QA:
+        qa_input = QAToolInput(
+            query=router_output.reformulated_query,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            retrieval_mode=request.retrieval_mode,
+            filters=request.filters
+        )
+        docs = await qa_tool.aretrieve(qa_input)
+        source_documents = qa_tool.format_sources(docs)
+        yield _event("sources", source_documents=source_documents)
+
+        prepared = qa_tool.prepare(qa_input.query, docs)
+        with span("generate", "qa"):
+            async for token in qa_tool.astream(prepared):
+                tokens.append(token)
+                yield _event("token", content=token)
+        result = QAToolOutput(
+            answer="".join(tokens),
+            source_documents=source_documents,
+            prompt_tokens=prepared.prompt_tokens,
+            context_tokens=prepared.context.context_tokens
+        ).dict()
+    elif router_output.tool == ToolType.SUMMARY and router_output.summary is not None:
+        result = router_output.summary.dict()
+    elif router_output.tool == ToolType.SUMMARY:
+        summary_input = SummaryToolInput(issue_text=query)
+        with span("summarize", "summary"):
+            async for token in summary_tool.astream(summary_input):
+                tokens.append(token)
+                yield _event("token", content=token)
+        result = summary_tool.parse_result("".join(tokens)).dict()
+    else:
+        result = UNKNOWN_QUERY_RESULT
+
+    payload = {
+        "result": result,
+        "tool_used": router_output.tool.value,
+        "reasoning": router_output.reasoning
+    }
+    if router_output.tool != ToolType.UNKNOWN and is_cacheable(request):
+        await asyncio.to_thread(response_cache.store, query, payload, query_vector, version=cache_version)
+
+    yield _event("final", **payload, metadata=_metadata({"hit": False}, timings))
+
+@app.post("/query/batch", dependencies=[Depends(require_ready)])
+async def batch_query(request: Request):
+    """Process a JSONL body of ``{"id", "query"}`` records.
+
+    Results stream back as JSONL in completion order, each tagged with the
+    record's ``id``; a failed query yields ``{"id", "error"}`` instead.
+    """
+    from app.batch import read_queries
+
+    body = await request.body()
+    try:
+        queries = read_queries(body.decode("utf-8").splitlines())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+    if not queries:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+
+    async def results():
+        async for result in batch_processor.process(queries):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latency histograms, token counts, cache, LLM queue and index size."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness: the process is up. Only fails if startup itself failed."""
+    if startup.failed:
+        return JSONResponse(status_code=503, content={"status": "unhealthy", "error": startup.error})
     return {"status": "healthy"}
 
-# Add document reload endpoint for admin use
-@app.post("/admin/reload-documents")
-async def reload_documents():
-    """Force reload of documents into the vector store."""
-    global vectorstore
-    vectorstore = document_ingestion.get_or_create_vectorstore(force_reload=True)
-    return {"status": "Documents reloaded successfully"}
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 200 once the models and index are loaded, with per-component startup times."""
+    if not startup.ready:
+        return JSONResponse(
+            status_code=503,
+            content=startup.stats(),
+            headers={"Retry-After": str(startup.retry_after)}
+        )
+    return startup.stats()
+
+@app.get("/admin/router-stats", dependencies=[Depends(require_ready)])
+async def router_stats():
+    """Report how often the fast-path classifier and the LLM router were used."""
+    return router_agent.stats()
+
+@app.get("/admin/llm-stats", dependencies=[Depends(require_ready)])
+async def llm_stats():
+    """Report LLM load, tokens generated per call and structured-output parse failures."""
+    return {
+        **_llm_stats(),
+        "parsing": {
+            "router": router_agent.parse_counter.stats(),
+            "summary": summary_tool.parse_counter.stats(),
+        },
+    }
+
+@app.get("/admin/cache-stats", dependencies=[Depends(require_ready)])
+async def cache_stats():
+    """Report response cache size and hit rates."""
+    return response_cache.stats()
+
+# Add document reload endpoints for admin use
+@app.post("/admin/reload-documents", status_code=202, dependencies=[Depends(require_ready)])
+async def reload_documents(response: Response, wait: bool = False,
+                           shard: Optional[List[str]] = Query(default=None)):
+    """Start a background reload of changed documents and return its job.
+
+    Requests made while a reload is waiting to start join that job. Queries
+    keep using the current index until the new one is swapped in. Pass
+    ``wait=true`` to block until the job finishes, and ``shard`` (repeatable)
+    to reload only those shards of a sharded index.
+    """
+    if shard and getattr(document_ingestion, "shard_key", None) is None:
+        raise HTTPException(status_code=400, detail="The index is not sharded; set FAISS_SHARD_BY to shard it")
+    job = reload_manager.request(shards=shard or None)
+    if wait:
+        job = await asyncio.to_thread(reload_manager.wait, job.job_id)
+        response.status_code = 200
+    return job
+
+@app.get("/admin/reload-documents/{job_id}", dependencies=[Depends(require_ready)])
+async def reload_status(job_id: str):
+    """Report a reload job's status, progress and, once finished, its report and index version."""
+    job = reload_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown reload job {job_id}")
+    return job
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,102 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from app.utils.errors import NotReadyError
+
+logger = logging.getLogger(__name__)
+
+class Startup:
+    """Builds the service's components in a background thread and tracks readiness.
+
+    ``build`` receives this object and wraps each component in ``step`` so
+    its load time is recorded. Until the build has finished, ``require``
+    raises ``NotReadyError``, which the API turns into a 503 with a
+    ``Retry-After`` hint instead of holding the request.
+    """
+
+    def __init__(self, build: Callable[["Startup"], None], retry_after: Optional[int] = None):
+        self.build = build
+        self.retry_after = retry_after or int(os.getenv("STARTUP_RETRY_AFTER", "5"))
+        self.state = "pending"
+        self.current_step: Optional[str] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.seconds = 0.0
+        self._started: Optional[float] = None
+        self._done = threading.Event()
+
+    def start(self) -> Optional[threading.Thread]:
+        """Run the build in a daemon thread and return immediately.
+
+        Does nothing if the build already ran, e.g. in a gunicorn master
+        before it forked this worker.
+        """
+        if self.state != "pending":
+            return None
+        thread = threading.Thread(target=self.run, name="startup", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        """Run the build in the calling thread."""
+        self.state = "starting"
+        self._started = time.perf_counter()
+        try:
+            self.build(self)
+        except Exception as e:
+            logger.exception("Startup failed while loading %s", self.current_step)
+            self.error = f"{self.current_step}: {type(e).__name__}: {e}"
+            self.state = "failed"
+        else:
+            self.current_step = None
+            self.state = "ready"
+        finally:
+            self.seconds = round(time.perf_counter() - self._started, 3)
+            self._done.set()
+            logger.info("Startup %s after %.1fs: %s", self.state, self.seconds, self.timings)
+
+    @contextmanager
+    def step(self, name: str):
+        """Time one component of the build."""
+        self.current_step = name
+        start = time.perf_counter()
+        yield
+        self.timings[name] = round(time.perf_counter() - start, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def failed(self) -> bool:
+        return self.state == "failed"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the build finishes; return whether it succeeded."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def require(self):
+        """Raise NotReadyError unless every component has loaded."""
+        if self.ready:
+            return
+        if self.failed:
+            raise NotReadyError(f"Startup failed: {self.error}", retry_after=self.retry_after)
+        detail = f" ({self.current_step})" if self.current_step else ""
+        raise NotReadyError(f"Service is starting up{detail}, retry shortly", retry_after=self.retry_after)
+
+    def stats(self) -> dict:
+        seconds = self.seconds
+        if self.state == "starting":
+            seconds = round(time.perf_counter() - self._started, 3)
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "current_step": self.current_step,
+            "error": self.error,
+            "seconds": seconds,
+            "components": dict(self.timings),
+        }
@@ -1,58 +1,343 @@
 import os
-from langchain.chains import RetrievalQA
-from langchain_community.llms import Ollama
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple
+import numpy as np
 from pydantic import BaseModel, Field
+from app.data.index import similarity_search, similarity_search_by_vectors
+from app.data.filters import MetadataFilter
+from app.data.retrieval import KEYWORD, VECTOR, CrossEncoderReranker, HybridRetriever, merge_scored
+from app.utils.context import ContextBuilder, PackedContext
+from app.utils.llm import get_llm
+from app.utils.metrics import PROMPT_TOKENS, span
 from app.utils.prompts import QA_PROMPT
 
 class QAToolInput(BaseModel):
     query: str = Field(description="The question to answer about internal documents")
+    nprobe: Optional[int] = Field(default=None, description="Inverted lists to visit on IVF indexes")
+    ef_search: Optional[int] = Field(default=None, description="Search breadth on HNSW indexes")
+    retrieval_mode: Optional[Literal["vector", "bm25", "hybrid", "rerank"]] = Field(
+        default=None, description="Retrieval strategy; defaults to RETRIEVAL_MODE"
+    )
+    filters: Optional[MetadataFilter] = Field(
+        default=None, description="Only retrieve chunks whose metadata matches"
+    )
 
 class QAToolOutput(BaseModel):
     answer: str = Field(description="The answer to the question")
     source_documents: list = Field(description="The source documents used to answer")
+    prompt_tokens: Optional[int] = Field(default=None, description="Tokens in the prompt sent to the LLM")
+    context_tokens: Optional[int] = Field(default=None, description="Tokens of retrieved context in the prompt")
+
+class PreparedPrompt(BaseModel):
+    prompt: str = Field(description="The full QA prompt")
+    prompt_tokens: int = Field(description="Tokens in the prompt")
+    context: PackedContext = Field(description="The packed retrieval context")
     
-class QATool:
-    def __init__(self, vectorstore):
-        OLLAMA_API_BASE_URL = os.getenv("OLLAMA_API_BASE_URL", "http://localhost:11434")
-        
+class ShardIndex:
+    """A vectorstore together with the retrievers built on it."""
+
+    def __init__(self, vectorstore, k: int, reranker=None):
         self.vectorstore = vectorstore
-        self.llm = Ollama(
-            base_url=OLLAMA_API_BASE_URL,
-            model="mistral:7b",  
-            temperature=0
+        self.retriever = vectorstore.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": k}
         )
+
+        # Keyword + vector retrieval needs the BM25 index stored with the chunks
+        self.hybrid_retriever = None
+        if HybridRetriever.supports(vectorstore):
+            self.hybrid_retriever = HybridRetriever(vectorstore, k=k, reranker=reranker)
+
+class RetrievalIndex:
+    """One version of the index: a single vectorstore, or one per shard when
+    ``vectorstore`` is a dict keyed by the ``shard_key`` metadata value."""
+
+    def __init__(self, vectorstore, version: int, k: int, reranker=None, shard_key: Optional[str] = None):
+        self.version = version
+        self.shard_key = shard_key
+        if isinstance(vectorstore, dict):
+            self.shards = {name: ShardIndex(store, k, reranker) for name, store in vectorstore.items()}
+        else:
+            self.shards = {None: ShardIndex(vectorstore, k, reranker)}
+
+    @property
+    def sharded(self) -> bool:
+        return None not in self.shards
+
+    @property
+    def _single(self) -> Optional[ShardIndex]:
+        return self.shards.get(None)
+
+    @property
+    def vectorstore(self):
+        return self._single.vectorstore if self._single is not None else None
+
+    @property
+    def retriever(self):
+        return self._single.retriever if self._single is not None else None
+
+    @property
+    def hybrid_retriever(self):
+        return self._single.hybrid_retriever if self._single is not None else None
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.vectorstore.index.ntotal for shard in self.shards.values())
+
+    def select(self, metadata_filter: Optional[MetadataFilter]) -> Tuple[List[ShardIndex], Optional[MetadataFilter]]:
+        """Shards worth searching for a filter, and the filter left to apply inside them.
+
+        A filter on the shard key picks its shard outright, so it is not
+        checked again per chunk.
+        """
+        if not self.sharded or metadata_filter is None:
+            return list(self.shards.values()), metadata_filter
+        value = getattr(metadata_filter, self.shard_key)
+        if value is None:
+            return list(self.shards.values()), metadata_filter
+        shard = self.shards.get(value)
+        return ([shard] if shard is not None else []), metadata_filter.without(self.shard_key)
+
+class QATool:
+    def __init__(self, vectorstore, shard_key: Optional[str] = None):
+        # Shared, pooled Ollama client (see app/utils/llm.py)
+        self.llm = get_llm()
         
         # Initialize the prompt template
         self.qa_prompt = QA_PROMPT
+        self.context_builder = ContextBuilder()
         
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 3}  # Retrieve 3 most relevant documents
-        )
-        
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.retriever,
-            chain_type_kwargs={"prompt": self.qa_prompt},
-            return_source_documents=True
-        )
-        
+        self.k = 3  # Retrieve 3 most relevant documents
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+        # Shared across index versions so the cross-encoder is loaded once
+        self.reranker = CrossEncoderReranker()
+        self.shard_key = shard_key
+
+        # Each request reads self.index once, so swapping in a new version
+        # never mixes two indexes within one retrieval
+        self._swap_lock = threading.Lock()
+        self.index = self._index(vectorstore, version=1)
+
+    @property
+    def vectorstore(self):
+        return self.index.vectorstore
+
+    @property
+    def retriever(self):
+        return self.index.retriever
+
+    @property
+    def hybrid_retriever(self):
+        return self.index.hybrid_retriever
+
+    @property
+    def version(self) -> int:
+        return self.index.version
+
+    def swap(self, vectorstore) -> int:
+        """Atomically replace the vectorstore (or shards) and return the new index version.
+
+        Queries already retrieving keep the version they started with.
+        """
+        with self._swap_lock:
+            index = self._index(vectorstore, version=self.index.version + 1)
+            self.index = index
+        return index.version
+
+    def _index(self, vectorstore, version: int) -> RetrievalIndex:
+        return RetrievalIndex(vectorstore, version=version, k=self.k, reranker=self.reranker, shard_key=self.shard_key)
+
     def run(self, input_data: QAToolInput) -> QAToolOutput:
         """Run the QA tool on the given input."""
-        query = input_data.query
-        result = self.qa_chain({"query": query})
-        
-        # Extract source document information
-        source_docs = []
-        if "source_documents" in result:
-            for doc in result["source_documents"]:
-                source_docs.append({
-                    "content": doc.page_content[:200] + "...",  # First 200 chars
-                    "source": doc.metadata.get("source", "Unknown")
-                })
-                
+        docs = self.retrieve(input_data)
+        prepared = self.prepare(input_data.query, docs)
+        with span("generate", "qa"):
+            answer = self.llm.invoke(prepared.prompt)
+        return self._output(answer, docs, prepared)
+
+    async def arun(self, input_data: QAToolInput) -> QAToolOutput:
+        """Run the QA tool without blocking the event loop."""
+        docs = await self.aretrieve(input_data)
+        return await self.aanswer(input_data.query, docs)
+
+    async def aanswer(self, query: str, documents: List) -> QAToolOutput:
+        """Answer the query from already retrieved documents."""
+        prepared = self.prepare(query, documents)
+        with span("generate", "qa"):
+            answer = await self.llm.ainvoke(prepared.prompt)
+        return self._output(answer, documents, prepared)
+
+    def retrieve(self, input_data: QAToolInput) -> List:
+        """Retrieve relevant documents, honouring per-request search parameters."""
+        with span("retrieve", "qa"):
+            return self._retrieve(input_data)
+
+    def _retrieve(self, input_data: QAToolInput) -> List:
+        shards, metadata_filter = self.index.select(input_data.filters)
+        if not shards:
+            return []
+        if len(shards) == 1:
+            return self._retrieve_shard(shards[0], input_data, metadata_filter)
+        with span("embed_query", "qa"):
+            embedding = shards[0].vectorstore.embedding_function.embed_query(input_data.query)
+        vectors = np.asarray(embedding, dtype=np.float32)[None, :]
+        mode = input_data.retrieval_mode or self.retrieval_mode
+        return self._retrieve_shards(
+            shards, [input_data.query], vectors, mode, input_data.nprobe, input_data.ef_search, metadata_filter
+        )[0]
+
+    def _retrieve_shard(self, shard: ShardIndex, input_data: QAToolInput,
+                        metadata_filter: Optional[MetadataFilter]) -> List:
+        if metadata_filter is None and self._uses_default_retriever(input_data, shard):
+            return shard.retriever.invoke(input_data.query)
+        if shard.hybrid_retriever is not None:
+            return shard.hybrid_retriever.retrieve(
+                input_data.query,
+                mode=input_data.retrieval_mode or self.retrieval_mode,
+                nprobe=input_data.nprobe,
+                ef_search=input_data.ef_search,
+                metadata_filter=metadata_filter
+            )
+        return similarity_search(
+            shard.vectorstore,
+            input_data.query,
+            k=self.k,
+            nprobe=input_data.nprobe,
+            ef_search=input_data.ef_search,
+            metadata_filter=metadata_filter
+        )
+
+    def retrieve_batch(self, inputs: List[QAToolInput], vectors: np.ndarray) -> List[List]:
+        """Retrieve for many queries from their precomputed embeddings.
+
+        Queries sharing a retrieval mode, search parameters and filters go
+        through a single FAISS search per shard.
+        """
+        index = self.index
+        groups: Dict[Tuple, List[int]] = {}
+        for i, input_data in enumerate(inputs):
+            filter_key = input_data.filters.key() if input_data.filters is not None else None
+            mode = input_data.retrieval_mode or self.retrieval_mode
+            groups.setdefault((mode, input_data.nprobe, input_data.ef_search, filter_key), []).append(i)
+
+        results: List[List] = [[] for _ in inputs]
+        for (mode, nprobe, ef_search, _), positions in groups.items():
+            shards, metadata_filter = index.select(inputs[positions[0]].filters)
+            queries = [inputs[i].query for i in positions]
+            group_vectors = vectors[positions]
+            if not shards:
+                continue
+            if len(shards) == 1:
+                documents = self._retrieve_shard_batch(
+                    shards[0], queries, group_vectors, mode, nprobe, ef_search, metadata_filter
+                )
+            else:
+                documents = self._retrieve_shards(
+                    shards, queries, group_vectors, mode, nprobe, ef_search, metadata_filter
+                )
+            for i, docs in zip(positions, documents):
+                results[i] = docs
+        return results
+
+    def _retrieve_shards(self, shards: List[ShardIndex], queries: List[str], vectors: np.ndarray, mode: str,
+                         nprobe: Optional[int], ef_search: Optional[int],
+                         metadata_filter: Optional[MetadataFilter]) -> List[List]:
+        """Search several shards with scores and merge their hits by relevance.
+
+        Every shard uses the same embedding model and FAISS metric, so vector
+        scores compare directly across shards. Hybrid modes fuse the merged
+        vector and keyword rankings, as a single index would.
+        """
+        candidates = [
+            self._shard_candidates(shard, queries, vectors, mode, nprobe, ef_search, metadata_filter)
+            for shard in shards
+        ]
+        fuser = next((shard.hybrid_retriever for shard in shards if shard.hybrid_retriever is not None), None)
+        fusing = fuser is not None and mode not in (VECTOR, KEYWORD)
+        limit = fuser.fetch_k if fusing else self.k
+
+        results = []
+        for j, query in enumerate(queries):
+            vector_docs = merge_scored([shard_hits[j][0] for shard_hits in candidates], limit)
+            keyword_docs = merge_scored([shard_hits[j][1] for shard_hits in candidates], limit)
+            if fusing:
+                results.append(fuser.fuse(query, vector_docs, keyword_docs, mode))
+            elif fuser is not None and mode == KEYWORD:
+                results.append(keyword_docs)
+            else:
+                results.append(vector_docs)
+        return results
+
+    def _shard_candidates(self, shard: ShardIndex, queries: List[str], vectors: np.ndarray, mode: str,
+                          nprobe: Optional[int], ef_search: Optional[int],
+                          metadata_filter: Optional[MetadataFilter]) -> List[Tuple[List, List]]:
+        if shard.hybrid_retriever is not None:
+            return shard.hybrid_retriever.candidates_batch(
+                queries, vectors, mode=mode, nprobe=nprobe, ef_search=ef_search, metadata_filter=metadata_filter
+            )
+        vector_hits = similarity_search_by_vectors(
+            shard.vectorstore, vectors, k=self.k, nprobe=nprobe, ef_search=ef_search,
+            metadata_filter=metadata_filter, with_scores=True
+        )
+        return [(hits, []) for hits in vector_hits]
+
+    def _retrieve_shard_batch(self, shard: ShardIndex, queries: List[str], vectors: np.ndarray, mode: str,
+                              nprobe: Optional[int], ef_search: Optional[int],
+                              metadata_filter: Optional[MetadataFilter]) -> List[List]:
+        if shard.hybrid_retriever is not None:
+            return shard.hybrid_retriever.retrieve_batch(
+                queries, vectors, mode=mode, nprobe=nprobe, ef_search=ef_search, metadata_filter=metadata_filter
+            )
+        return similarity_search_by_vectors(
+            shard.vectorstore, vectors, k=self.k, nprobe=nprobe, ef_search=ef_search, metadata_filter=metadata_filter
+        )
+
+    async def aretrieve(self, input_data: QAToolInput) -> List:
+        """Retrieve relevant documents without blocking the event loop."""
+        # Query embedding and FAISS search are CPU-bound, run them off the loop
+        return await asyncio.to_thread(self.retrieve, input_data)
+
+    async def astream(self, prepared: PreparedPrompt) -> AsyncIterator[str]:
+        """Stream answer tokens for a prepared prompt."""
+        async for token in self.llm.astream(prepared.prompt):
+            yield token
+
+    def prepare(self, query: str, documents: List) -> PreparedPrompt:
+        """Pack the retrieved documents into the token budget and build the QA prompt."""
+        with span("prompt_build", "qa"):
+            context = self.context_builder.pack(documents)
+            prompt = self.qa_prompt.format(question=query, context=context.text)
+            prompt_tokens = self.context_builder.counter.count(prompt)
+        PROMPT_TOKENS.labels(tool="qa").observe(prompt_tokens)
+        return PreparedPrompt(
+            prompt=prompt,
+            prompt_tokens=prompt_tokens,
+            context=context
+        )
+
+    def _output(self, answer: str, documents: List, prepared: PreparedPrompt) -> QAToolOutput:
         return QAToolOutput(
-            answer=result["result"],
-            source_documents=source_docs
-        )
\ No newline at end of file
+            answer=answer,
+            source_documents=self.format_sources(documents),
+            prompt_tokens=prepared.prompt_tokens,
+            context_tokens=prepared.context.context_tokens
+        )
+
+    def _uses_default_retriever(self, input_data: QAToolInput, shard: ShardIndex) -> bool:
+        """Whether the plain k-nearest-neighbour retriever can serve this request."""
+        if input_data.nprobe is not None or input_data.ef_search is not None:
+            return False
+        if shard.hybrid_retriever is None:
+            return True
+        return (input_data.retrieval_mode or self.retrieval_mode) == "vector"
+
+    def format_sources(self, documents) -> list:
+        """Extract source document information."""
+        source_docs = []
+        for doc in documents:
+            source_docs.append({
+                "content": doc.page_content[:200] + "...",  # First 200 chars
+                "source": doc.metadata.get("source", "Unknown")
+            })
+        return source_docs
@@ -1,8 +1,23 @@
 import os
-from langchain_community.llms import Ollama
+import re
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional
 from langchain.chains import LLMChain
-from pydantic import BaseModel, Field
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pydantic import BaseModel, Field, ValidationError
+from app.utils.json_stream import JSONObjectParser, ParseCounter, extract_json
+from app.utils.llm import get_llm
+from app.utils.metrics import span
 from app.utils.prompts import SUMMARY_PROMPT
+from app.utils.tokens import TokenCounter, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# Severity levels from least to most severe; unrecognised values rank lowest
+SEVERITY_LEVELS = ["Unknown", "Low", "Medium", "High", "Critical"]
 
 class SummaryToolInput(BaseModel):
     issue_text: str = Field(description="The issue text to summarize")
@@ -13,14 +28,12 @@ class SummaryToolOutput(BaseModel):
     severity: str = Field(description="Severity assessment of the issue")
     
 class SummaryTool:
-    def __init__(self):
-        OLLAMA_API_BASE_URL = os.getenv("OLLAMA_API_BASE_URL", "http://localhost:11434")
-        
-        self.llm = Ollama(
-            base_url=OLLAMA_API_BASE_URL,
-            model="mistral:7b",  
-            temperature=0
-        )
+    def __init__(self, max_input_tokens: Optional[int] = None, chunk_tokens: Optional[int] = None,
+                 chunk_overlap: Optional[int] = None, counter: Optional[TokenCounter] = None,
+                 map_concurrency: Optional[int] = None):
+        # Shared, pooled Ollama client (see app/utils/llm.py), constrained to JSON output
+        self.llm = get_llm(format="json", num_predict=int(os.getenv("SUMMARY_NUM_PREDICT", "512")))
+        self.parse_counter = ParseCounter()
         
         # Initialize prompt for issue summarization
         self.summary_prompt = SUMMARY_PROMPT
@@ -29,26 +42,141 @@ class SummaryTool:
             llm=self.llm,
             prompt=self.summary_prompt
         )
+
+        # Inputs over max_input_tokens are split and summarized map-reduce style
+        self.counter = counter or get_token_counter()
+        self.max_input_tokens = max_input_tokens or int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", "1500"))
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens or int(os.getenv("SUMMARY_CHUNK_TOKENS", "1000")),
+            chunk_overlap=chunk_overlap if chunk_overlap is not None else int(os.getenv("SUMMARY_CHUNK_OVERLAP", "50")),
+            length_function=self.counter.count
+        )
+        # Chunk summaries in flight at once; calls past the LLM pool's own limit wait in its queue
+        # (up to max_queue), and only once that is full are they rejected with a 429
+        self.map_concurrency = map_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
         
     def run(self, input_data: SummaryToolInput) -> SummaryToolOutput:
         """Run the summary tool on the given input."""
-        issue_text = input_data.issue_text
-        result = self.summary_chain.run(issue_text=issue_text)
-        
-        # The LLM should return JSON-formatted text, parse it
-        # For robustness, adding error handling
-        import json
+        with span("summarize", "summary"):
+            chunks = self.split(input_data.issue_text)
+            if len(chunks) == 1:
+                result = self.summary_chain.run(issue_text=chunks[0])
+                return self.parse_result(result)
+
+            with ThreadPoolExecutor(max_workers=min(self.map_concurrency, len(chunks))) as executor:
+                results = list(executor.map(self._summarize_chunk, chunks))
+            return self._reduce(results)
+
+    async def arun(self, input_data: SummaryToolInput) -> SummaryToolOutput:
+        """Run the summary tool using the async LLM client."""
+        return await self._arun_chunks(self.split(input_data.issue_text))
+
+    async def _arun_chunks(self, chunks: List[str]) -> SummaryToolOutput:
+        with span("summarize", "summary"):
+            if len(chunks) == 1:
+                result = await self.summary_chain.arun(issue_text=chunks[0])
+                return self.parse_result(result)
+
+            semaphore = asyncio.Semaphore(self.map_concurrency)
+
+            async def summarize(chunk: str) -> str:
+                async with semaphore:
+                    return await self.summary_chain.arun(issue_text=chunk)
+
+            results = await asyncio.gather(*(summarize(chunk) for chunk in chunks), return_exceptions=True)
+            return self._reduce(results)
+
+    async def astream(self, input_data: SummaryToolInput) -> AsyncIterator[str]:
+        """Stream raw summary tokens; pass the joined text to parse_result."""
+        chunks = self.split(input_data.issue_text)
+        if len(chunks) > 1:
+            # Partial summaries are not useful to stream; emit the merged result at once
+            output = await self._arun_chunks(chunks)
+            yield json.dumps(output.dict())
+            return
+
+        prompt = self.summary_prompt.format(issue_text=input_data.issue_text)
+        parser = JSONObjectParser()
+        tokens = self.llm.astream(prompt)
         try:
-            summary_data = json.loads(result)
-            return SummaryToolOutput(
+            async for token in tokens:
+                yield token
+                # Stop generating once the summary object has closed
+                if parser.feed(token) is not None:
+                    break
+        finally:
+            await tokens.aclose()
+
+    def split(self, issue_text: str) -> List[str]:
+        """Return the input as one chunk, or as token-bounded chunks if it is too long."""
+        if self.counter.count(issue_text) <= self.max_input_tokens:
+            return [issue_text]
+        return self.splitter.split_text(issue_text)
+
+    def merge(self, partials: List[Optional[SummaryToolOutput]]) -> SummaryToolOutput:
+        """Reduce per-chunk summaries: dedupe issues and components, keep the highest severity."""
+        partials = [partial for partial in partials if partial is not None]
+        if not partials:
+            return self._fallback()
+
+        def dedupe(items: list) -> list:
+            seen, merged = set(), []
+            for item in items:
+                key = re.sub(r"\s+", " ", str(item)).strip().rstrip(".").lower()
+                if key and key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+            return merged
+
+        return SummaryToolOutput(
+            reported_issues=dedupe([issue for p in partials for issue in p.reported_issues]),
+            affected_components=dedupe([component for p in partials for component in p.affected_components]),
+            severity=max((p.severity for p in partials), key=self._severity_rank)
+        )
+
+    def _summarize_chunk(self, chunk: str):
+        try:
+            return self.summary_chain.run(issue_text=chunk)
+        except Exception as e:
+            return e
+
+    def _reduce(self, results: list) -> SummaryToolOutput:
+        """Merge chunk results, dropping chunks whose LLM call failed."""
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for error in errors:
+            logger.warning("Summarizing one chunk of a long report failed: %s", error)
+        return self.merge([None if isinstance(result, BaseException) else self._parse(result) for result in results])
+
+    def parse_result(self, result: str) -> SummaryToolOutput:
+        """Parse the raw LLM response into a SummaryToolOutput."""
+        return self._parse(result) or self._fallback()
+
+    def _parse(self, result: str) -> Optional[SummaryToolOutput]:
+        # The LLM should return JSON-formatted text; tolerate prose around it
+        summary_data = extract_json(result)
+        try:
+            output = SummaryToolOutput(
                 reported_issues=summary_data["reported_issues"],
                 affected_components=summary_data["affected_components"],
                 severity=summary_data["severity"]
             )
-        except json.JSONDecodeError:
-            # Fallback response if JSON parsing fails
-            return SummaryToolOutput(
-                reported_issues=["Error parsing summary"],
-                affected_components=["Unknown"],
-                severity="Unknown"
-            )
\ No newline at end of file
+        except (TypeError, KeyError, ValidationError):
+            self.parse_counter.record(False)
+            return None
+        self.parse_counter.record(True)
+        return output
+
+    def _fallback(self) -> SummaryToolOutput:
+        # Fallback response if JSON parsing fails
+        return SummaryToolOutput(
+            reported_issues=["Error parsing summary"],
+            affected_components=["Unknown"],
+            severity="Unknown"
+        )
+
+    def _severity_rank(self, severity: str) -> int:
+        levels = [level.lower() for level in SEVERITY_LEVELS]
+        severity = str(severity).strip().lower()
+        return levels.index(severity) if severity in levels else 0
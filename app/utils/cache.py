@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from app.utils.cache_backends import SQLiteBackend, get_cache_backend
+
+# Backend namespace holding cached responses
+NAMESPACE = "responses"
+
+# Request options that change the answer; the cache is keyed on the query alone
+RETRIEVAL_OPTIONS = ("nprobe", "ef_search", "retrieval_mode", "filters")
+
+def is_cacheable(request) -> bool:
+    """Whether a request uses the default retrieval settings, so its answer may be cached and shared."""
+    return all(getattr(request, option, None) is None for option in RETRIEVAL_OPTIONS)
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for exact-match cache lookups."""
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+class CacheEntry:
+    def __init__(self, query: str, vector: Optional[np.ndarray], payload: Dict[str, Any], created_at: float,
+                 version: Optional[str] = None):
+        self.query = query
+        self.vector = vector
+        self.payload = payload
+        self.created_at = created_at
+        # Index version the answer was built from
+        self.version = version
+        self.size = len(json.dumps(payload)) + len(query) + (vector.nbytes if vector is not None else 0)
+
+def encode_entry(entry: CacheEntry) -> bytes:
+    vector = base64.b64encode(entry.vector.tobytes()).decode() if entry.vector is not None else None
+    return json.dumps({"query": entry.query, "vector": vector, "payload": entry.payload, "version": entry.version}).encode()
+
+def decode_entry(value: bytes, created_at: float) -> CacheEntry:
+    data = json.loads(value)
+    vector = np.frombuffer(base64.b64decode(data["vector"]), dtype=np.float32) if data["vector"] else None
+    return CacheEntry(data["query"], vector, data["payload"], created_at, data.get("version"))
+
+class ResponseCache:
+    """LRU/TTL response cache keyed on the normalized query, then on embedding similarity.
+
+    Entries live in process memory. With a shared backend (``CACHE_BACKEND=sqlite``)
+    every write also goes to the backend, and each worker pulls the other
+    workers' writes and invalidations at most every ``sync_interval`` seconds.
+    ``path`` (or ``RESPONSE_CACHE_PATH``) stores the cache in its own SQLite
+    file so it survives restarts.
+
+    Each entry records the index ``version`` its answer was built from, and
+    only entries from the current version are served. Callers read
+    ``version`` before retrieving and pass it to ``store``, which drops
+    answers that finished after the index was swapped.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        similarity_threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+        backend=None,
+        sync_interval: Optional[float] = None
+    ):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold if similarity_threshold is not None else float(
+            os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.path = path if path is not None else os.getenv("RESPONSE_CACHE_PATH")
+        self.sync_interval = sync_interval if sync_interval is not None else float(
+            os.getenv("RESPONSE_CACHE_SYNC_SECONDS", "1"))
+        if backend is None:
+            backend = SQLiteBackend(self.path) if self.path else get_cache_backend()
+        self.backend = backend
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._synced_at = 0.0
+        self.version: Optional[str] = None
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+                         "stale_stores": 0}
+        with self._lock:
+            self._sync(force=True)
+
+    def lookup(self, query: str, vector: Optional[np.ndarray] = None) -> Tuple[Optional[Tuple[Dict[str, Any], Dict[str, Any]]], Optional[np.ndarray]]:
+        """Look up a cached response.
+
+        Returns ``(hit, vector)`` where ``hit`` is ``(payload, cache_metadata)`` or None,
+        and ``vector`` is the query embedding (if computed) so it can be reused by ``store``.
+        Pass ``vector`` when the normalized query embedding is already known.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._sync()
+            entry = self._get_live(key)
+            if entry is not None:
+                self.counters["exact_hits"] += 1
+                return (entry.payload, {"hit": True, "match": "exact", "similarity": 1.0}), entry.vector
+
+        if vector is None:
+            vector = self._embed(query)
+        if vector is not None:
+            with self._lock:
+                best_key, best_score = self._nearest(vector)
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    entry = self._get_live(best_key)
+                    if entry is not None:
+                        self.counters["semantic_hits"] += 1
+                        return (entry.payload, {"hit": True, "match": "semantic", "similarity": round(best_score, 4)}), vector
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None, vector
+
+    def store(self, query: str, payload: Dict[str, Any], vector: Optional[np.ndarray] = None,
+              version: Optional[str] = None):
+        """Insert or refresh a cached response built from index ``version``."""
+        if version != self.version:
+            with self._lock:
+                self.counters["stale_stores"] += 1
+            return
+        key = normalize_query(query)
+        if vector is None:
+            vector = self._embed(query)
+        entry = CacheEntry(key, vector, payload, time.time(), version)
+        if entry.size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._drop(key)
+            self._add(key, entry)
+            self._evict()
+            self.backend.put(NAMESPACE, key, encode_entry(entry), entry.created_at)
+
+    def invalidate(self, shared: bool = True, version: Optional[str] = None):
+        """Drop every cached response, e.g. after the vectorstore is rebuilt.
+
+        ``version`` is the index version answers are built from from now on.
+        With ``shared=False`` only this process's copy is dropped, for when
+        the worker that rebuilt the index has already cleared the backend.
+        """
+        with self._lock:
+            self.version = version
+            self._entries.clear()
+            self._bytes = 0
+            self.counters["invalidations"] += 1
+            if shared:
+                self.backend.clear(NAMESPACE)
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss counters."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "shared": self.backend.shared, **self.counters}
+
+    def _sync(self, force: bool = False):
+        """Apply entries and invalidations written by other workers; called with the lock held."""
+        now = time.time()
+        if not force and (not self.backend.shared or now - self._synced_at < self.sync_interval):
+            return
+        self._synced_at = now
+        self._cursor, cleared, rows = self.backend.changes(NAMESPACE, self._cursor)
+        if cleared:
+            self._entries.clear()
+            self._bytes = 0
+        for key, value, created_at in rows:
+            if now - created_at > self.ttl_seconds:
+                self._remove(key)
+                continue
+            self._drop(key)
+            self._add(key, decode_entry(value, created_at))
+        self._evict()
+
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _get_live(self, key: str) -> Optional[CacheEntry]:
+        """Return a non-expired entry and mark it as recently used."""
+        entry = self._entries.get(key)
+        if entry is None or entry.version != self.version:
+            # Entries from another index version stay until evicted: they may be a worker's current version
+            return None
+        if time.time() - entry.created_at > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        keys = [key for key, entry in self._entries.items() if entry.vector is not None and entry.version == self.version]
+        if not keys:
+            return None, 0.0
+        matrix = np.stack([self._entries[key].vector for key in keys])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
+
+    def _add(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._bytes += entry.size
+
+    def _drop(self, key: str):
+        """Forget an entry in this process only."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _remove(self, key: str):
+        self._drop(key)
+        self.backend.delete(NAMESPACE, key)
+
+    def _evict(self):
+        """Evict least recently used entries until within the entry and memory bounds."""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.counters["evictions"] += 1
@@ -0,0 +1,164 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Where a reader is in a namespace's change feed: (generation, last sequence number)
+Cursor = Tuple[int, int]
+Row = Tuple[str, bytes, float]
+
+class InProcessBackend:
+    """Shares nothing: each worker process keeps its caches to itself."""
+
+    shared = False
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, bytes]:
+        return {}
+
+    def put(self, namespace: str, key: str, value: bytes, created_at: Optional[float] = None):
+        pass
+
+    def delete(self, namespace: str, key: str):
+        pass
+
+    def clear(self, namespace: str):
+        pass
+
+    def trim(self, namespace: str, max_entries: int):
+        pass
+
+    def changes(self, namespace: str, cursor: Optional[Cursor] = None) -> Tuple[Cursor, bool, List[Row]]:
+        return cursor or (0, 0), False, []
+
+    def close(self):
+        pass
+
+class SQLiteBackend:
+    """Cache entries in one SQLite file that every worker reads and writes.
+
+    Each write gets a new sequence number, so ``changes`` hands a reader only
+    the entries written since its cursor instead of the whole table. Clearing
+    a namespace bumps its generation, which tells readers to drop everything
+    they hold. Connections are reopened after a fork, since SQLite handles
+    must not cross process boundaries.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        # Handles inherited from a parent process, kept open so they are never closed here
+        self._inherited = []
+        self._db()
+
+    def _db(self) -> sqlite3.Connection:
+        # Called with the lock held, or from __init__
+        if self._pid != os.getpid():
+            if self._connection is not None:
+                self._inherited.append(self._connection)
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB, created_at REAL, UNIQUE (namespace, key))"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_by_seq ON entries (namespace, seq)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS generations (namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT key, value FROM entries WHERE namespace = ? AND key IN ({placeholders})",
+                (namespace, *keys)
+            ).fetchall()
+        return dict(rows)
+
+    def put(self, namespace: str, key: str, value: bytes, created_at: Optional[float] = None):
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, created_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, created_at if created_at is not None else time.time())
+            )
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._db().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str):
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+                db.execute(
+                    "INSERT INTO generations VALUES (?, 1) "
+                    "ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1",
+                    (namespace,)
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def trim(self, namespace: str, max_entries: int):
+        """Delete the oldest writes beyond ``max_entries``."""
+        with self._lock:
+            self._db().execute(
+                "DELETE FROM entries WHERE namespace = ? AND seq <= ("
+                "SELECT seq FROM entries WHERE namespace = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (namespace, namespace, max_entries)
+            )
+
+    def changes(self, namespace: str, cursor: Optional[Cursor] = None) -> Tuple[Cursor, bool, List[Row]]:
+        """Entries written since ``cursor``, and whether the namespace was cleared in between.
+
+        Pass no cursor to read everything.
+        """
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT generation FROM generations WHERE namespace = ?", (namespace,)).fetchone()
+            generation = row[0] if row is not None else 0
+            cleared = cursor is not None and cursor[0] != generation
+            since = cursor[1] if cursor is not None and not cleared else 0
+            rows = db.execute(
+                "SELECT seq, key, value, created_at FROM entries WHERE namespace = ? AND seq > ? ORDER BY seq",
+                (namespace, since)
+            ).fetchall()
+        last = rows[-1][0] if rows else since
+        return (generation, last), cleared, [(key, value, created_at) for _, key, value, created_at in rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection, self._pid = None, None
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_cache_backend():
+    """Return the process-wide cache backend chosen by CACHE_BACKEND (``memory`` or ``sqlite``)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            kind = os.getenv("CACHE_BACKEND", "memory")
+            if kind == "sqlite":
+                _backend = SQLiteBackend(os.getenv("CACHE_SQLITE_PATH", "app/data/cache.sqlite"))
+            elif kind == "memory":
+                _backend = InProcessBackend()
+            else:
+                raise ValueError(f"Unknown CACHE_BACKEND {kind!r}, expected 'memory' or 'sqlite'")
+        return _backend
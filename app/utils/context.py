@@ -0,0 +1,137 @@
+import os
+import re
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from langchain_core.documents import Document
+from app.utils.tokens import TokenCounter, get_token_counter
+
+# Smallest leftover budget worth filling with a truncated chunk
+MIN_PARTIAL_TOKENS = 32
+# Shortest suffix/prefix match treated as chunk overlap when start offsets are unknown
+MIN_TEXT_OVERLAP = 20
+MAX_TEXT_OVERLAP = 300
+
+class PackedContext(BaseModel):
+    text: str = Field(description="Context to stuff into the prompt")
+    documents: list = Field(description="Packed documents, in rank order")
+    context_tokens: int = Field(description="Token count of the packed context")
+    duplicates_removed: int = Field(default=0, description="Chunks dropped as (near-)duplicates")
+    chunks_merged: int = Field(default=0, description="Chunks merged into an adjacent chunk")
+    chunks_dropped: int = Field(default=0, description="Chunks left out because the budget was spent")
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+class ContextBuilder:
+    """Packs retrieved chunks into a token budget for the "stuff" prompt.
+
+    Near-duplicate chunks are dropped, overlapping or adjacent chunks from
+    the same source are merged back into one passage, and packing stops
+    once the budget is spent.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, counter: Optional[TokenCounter] = None,
+                 duplicate_threshold: float = 0.9, separator: str = "\n\n"):
+        self.max_tokens = max_tokens or int(os.getenv("QA_CONTEXT_TOKENS", "1500"))
+        self.counter = counter or get_token_counter()
+        self.duplicate_threshold = duplicate_threshold
+        self.separator = separator
+
+    def pack(self, documents: List[Document]) -> PackedContext:
+        passages: List[Document] = []
+        duplicates_removed = 0
+        chunks_merged = 0
+
+        for doc in documents:
+            if self._is_duplicate(doc, passages):
+                duplicates_removed += 1
+                continue
+            for i, passage in enumerate(passages):
+                merged = self._merge(passage, doc)
+                if merged is not None:
+                    passages[i] = merged
+                    chunks_merged += 1
+                    break
+            else:
+                passages.append(doc)
+
+        packed, texts, used = [], [], 0
+        separator_tokens = self.counter.count(self.separator)
+        for passage in passages:
+            cost = self.counter.count(passage.page_content) + (separator_tokens if texts else 0)
+            if used + cost <= self.max_tokens:
+                packed.append(passage)
+                texts.append(passage.page_content)
+                used += cost
+                continue
+
+            remaining = self.max_tokens - used - (separator_tokens if texts else 0)
+            if remaining >= MIN_PARTIAL_TOKENS:
+                text = self.counter.truncate(passage.page_content, remaining)
+                packed.append(Document(page_content=text, metadata=passage.metadata, id=passage.id))
+                texts.append(text)
+            break
+
+        text = self.separator.join(texts)
+        return PackedContext(
+            text=text,
+            documents=packed,
+            context_tokens=self.counter.count(text),
+            duplicates_removed=duplicates_removed,
+            chunks_merged=chunks_merged,
+            chunks_dropped=len(passages) - len(packed)
+        )
+
+    def _is_duplicate(self, doc: Document, passages: List[Document]) -> bool:
+        content = " ".join(doc.page_content.split())
+        shingles = None
+        for passage in passages:
+            existing = " ".join(passage.page_content.split())
+            if content in existing:
+                return True
+            if shingles is None:
+                shingles = _shingles(content)
+            other = _shingles(existing)
+            if len(shingles & other) / max(1, len(shingles | other)) >= self.duplicate_threshold:
+                return True
+        return False
+
+    def _merge(self, first: Document, second: Document) -> Optional[Document]:
+        """Merge two chunks of the same source segment if they overlap or touch."""
+        if not self._same_segment(first, second):
+            return None
+
+        start_a = first.metadata.get("start_index")
+        start_b = second.metadata.get("start_index")
+        if start_a is not None and start_b is not None:
+            if start_b < start_a:
+                first, second = second, first
+                start_a, start_b = start_b, start_a
+            end_a = start_a + len(first.page_content)
+            if start_b > end_a:
+                return None
+            text = first.page_content + second.page_content[end_a - start_b:]
+            return Document(page_content=text, metadata=first.metadata, id=first.id)
+
+        # Without offsets, fall back to matching the splitter's overlap textually
+        for left, right in ((first, second), (second, first)):
+            overlap = self._text_overlap(left.page_content, right.page_content)
+            if overlap:
+                text = left.page_content + right.page_content[overlap:]
+                return Document(page_content=text, metadata=left.metadata, id=left.id)
+        return None
+
+    def _same_segment(self, first: Document, second: Document) -> bool:
+        # JSONL records and memory-mapped blocks are separate segments of one file
+        return all(
+            first.metadata.get(key) == second.metadata.get(key)
+            for key in ("source", "line", "offset")
+        ) and first.metadata.get("source") is not None
+
+    def _text_overlap(self, left: str, right: str) -> int:
+        longest = min(MAX_TEXT_OVERLAP, len(left), len(right))
+        for size in range(longest, MIN_TEXT_OVERLAP - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
@@ -0,0 +1,19 @@
+from typing import Optional
+
+class ServiceUnavailableError(Exception):
+    """The request cannot be served right now; maps to HTTP 503 with a Retry-After header."""
+    status_code = 503
+
+    def __init__(self, message: str = "", retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LLMUnavailableError(ServiceUnavailableError):
+    """The LLM backend could not serve the call; maps to HTTP 503."""
+
+class LLMQueueFullError(LLMUnavailableError):
+    """Too many calls are already waiting for a generation slot; maps to HTTP 429."""
+    status_code = 429
+
+class NotReadyError(ServiceUnavailableError):
+    """Startup has not finished loading the service's components; maps to HTTP 503."""
@@ -0,0 +1,104 @@
+import json
+import threading
+from typing import Any, Dict, Optional
+
+class JSONObjectParser:
+    """Incrementally finds the first complete top-level JSON object in streamed text.
+
+    Text before the opening brace (e.g. "Sure, here is the JSON:") is skipped,
+    and anything after the matching closing brace is ignored, so callers can
+    stop generation as soon as ``feed`` returns an object.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._scanned = 0
+        self.result: Optional[Dict[str, Any]] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.result is not None
+
+    def feed(self, text: str) -> Optional[Dict[str, Any]]:
+        """Add streamed text; return the object once it has closed."""
+        if self.complete:
+            return self.result
+        self.buffer += text
+
+        i = self._scanned
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            i += 1
+            if self._start < 0:
+                if char == "{":
+                    self._start, self._depth = i - 1, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.buffer[self._start:i]
+                    try:
+                        parsed = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        parsed = None
+                    if isinstance(parsed, dict):
+                        self.result = parsed
+                        self._scanned = i
+                        return parsed
+                    # Not valid JSON after all, look for the next object
+                    i = self._start + 1
+                    self._start = -1
+                    self._in_string = self._escaped = False
+        self._scanned = i
+        return None
+
+    @property
+    def text(self) -> str:
+        """The object's raw text once complete, else everything received so far."""
+        if self.complete:
+            return self.buffer[self._start:self._scanned]
+        return self.buffer
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """Return the first JSON object in ``text``, ignoring surrounding prose."""
+    parser = JSONObjectParser()
+    return parser.feed(text)
+
+class ParseCounter:
+    """Counts structured-output parse attempts and failures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.failed = 0
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.parsed += 1
+            else:
+                self.failed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.parsed + self.failed
+            return {
+                "parsed": self.parsed,
+                "failed": self.failed,
+                "failure_rate": round(self.failed / total, 4) if total else 0.0,
+            }
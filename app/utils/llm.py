@@ -0,0 +1,550 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field
+from app.utils.errors import LLMQueueFullError, LLMUnavailableError
+from app.utils.json_stream import JSONObjectParser
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying on another attempt or backend
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class _Backend:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.in_flight = 0
+        self.failures = 0
+
+class _Waiter:
+    """A call waiting for a generation slot, woken by the call that frees one."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> bool:
+        """Hand the slot over; False if the waiter's event loop has already closed."""
+        # Called with the pool lock held
+        if self.loop is None:
+            self.event.set()
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._resolve)
+            except RuntimeError:
+                return False
+        self.granted = True
+        return True
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class OllamaPool:
+    """Shared connection pool and admission control for every Ollama call.
+
+    At most ``max_concurrency`` generations run at once across all tools,
+    sync and async calls alike; up to ``max_queue`` more may wait for a slot, and any further call fails
+    immediately with ``LLMQueueFullError``. Calls are spread over the
+    comma-separated ``OLLAMA_API_BASE_URL`` backends by fewest in-flight
+    requests, and failed attempts are retried with jittered backoff on
+    another backend.
+    """
+
+    def __init__(self, base_urls: Optional[List[str]] = None, max_concurrency: Optional[int] = None,
+                 max_queue: Optional[int] = None, queue_timeout: Optional[float] = None,
+                 timeout: Optional[float] = None, connect_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, backoff: Optional[float] = None, transport=None):
+        if base_urls is None:
+            base_urls = os.getenv("OLLAMA_API_BASE_URL", "http://localhost:11434").split(",")
+        self.backends = [_Backend(url.strip()) for url in base_urls if url.strip()]
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("LLM_MAX_QUEUE", "32"))
+        self.queue_timeout = queue_timeout or float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+        self.timeout = httpx.Timeout(
+            timeout or float(os.getenv("LLM_TIMEOUT", "120")),
+            connect=connect_timeout or float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+        self.limits = httpx.Limits(
+            max_connections=self.max_concurrency * len(self.backends),
+            max_keepalive_connections=self.max_concurrency * len(self.backends)
+        )
+        self.transport = transport
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._active = 0
+        self._next = 0
+        self._client: Optional[httpx.Client] = None
+        # Sync and async calls wait in one queue, first come first served
+        self._waiters: "deque[_Waiter]" = deque()
+        # Async clients are bound to the loop that first uses them
+        self._loop = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._closing: set = set()
+        self.counters = {
+            "calls": 0, "retries": 0, "rejected": 0, "failed": 0,
+            "generations": 0, "tokens_generated": 0, "truncated": 0, "stopped_early": 0,
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, limits=self.limits, transport=self.transport)
+            return self._client
+
+    def _async_client_for_loop(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                stale, stale_loop = self._async_client, self._loop
+                self._loop = loop
+                self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+                if stale is not None:
+                    self._close_stale(stale, stale_loop, loop)
+            return self._async_client
+
+    def _close_stale(self, client: httpx.AsyncClient, client_loop, loop: asyncio.AbstractEventLoop):
+        """Close a client left behind by another event loop, on that loop while it still runs."""
+        if client_loop is not None and client_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._aclose_quietly(client), client_loop)
+            return
+        task = loop.create_task(self._aclose_quietly(client))
+        # Keep a reference until it finishes, the loop only holds tasks weakly
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _aclose_quietly(client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Connections from a closed loop cannot be shut down cleanly; they are dropped instead
+            logger.debug("Could not close stale async client: %s", e)
+
+    def generate(self, payload: Dict[str, Any]) -> str:
+        """Run a non-streaming generation and return the response text."""
+        with self._slot():
+            response = self._with_retries(lambda backend: self._post(backend, payload))
+        data = response.json()
+        self._record_usage(data, 0)
+        return data.get("response", "")
+
+    async def agenerate(self, payload: Dict[str, Any]) -> str:
+        """Async variant of ``generate``."""
+        client = self._async_client_for_loop()
+        async with self._aslot():
+            response = await self._awith_retries(lambda backend: self._apost(client, backend, payload))
+        data = response.json()
+        self._record_usage(data, 0)
+        return data.get("response", "")
+
+    def generate_json(self, payload: Dict[str, Any]) -> str:
+        """Stream a JSON generation and stop as soon as the first object closes.
+
+        Closing the stream makes Ollama stop generating, so trailing
+        whitespace or prose after the object is never produced.
+        """
+        parser = JSONObjectParser()
+        chunks = self.stream(payload)
+        try:
+            for chunk in chunks:
+                if parser.feed(chunk) is not None:
+                    self._count("stopped_early")
+                    break
+        finally:
+            chunks.close()
+        return parser.text
+
+    async def agenerate_json(self, payload: Dict[str, Any]) -> str:
+        """Async variant of ``generate_json``."""
+        parser = JSONObjectParser()
+        chunks = self.astream(payload)
+        try:
+            async for chunk in chunks:
+                if parser.feed(chunk) is not None:
+                    self._count("stopped_early")
+                    break
+        finally:
+            await chunks.aclose()
+        return parser.text
+
+    def stream(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """Stream generated text chunks."""
+        with self._slot():
+            failed = None
+            for attempt in range(self.max_retries + 1):
+                backend = self._acquire_backend(avoid=failed)
+                started = False
+                generated, usage = 0, None
+                try:
+                    with self.client.stream("POST", f"{backend.base_url}/api/generate",
+                                            json={**payload, "stream": True}) as response:
+                        self._check(response)
+                        for line in response.iter_lines():
+                            data = self._parse_line(line)
+                            if data is None:
+                                continue
+                            if data.get("done"):
+                                usage = data
+                            chunk = data.get("response", "")
+                            if chunk:
+                                started = True
+                                generated += 1
+                                yield chunk
+                    return
+                except (httpx.TransportError, _RetryableStatus) as e:
+                    # Text already sent to the caller cannot be taken back
+                    if started or not self._retry(attempt, backend, e):
+                        raise self._unavailable(e) from e
+                    failed = backend
+                    time.sleep(self._delay(attempt))
+                finally:
+                    self._release_backend(backend)
+                    if usage is not None or generated:
+                        self._record_usage(usage, generated)
+
+    async def astream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Async variant of ``stream``."""
+        client = self._async_client_for_loop()
+        async with self._aslot():
+            failed = None
+            for attempt in range(self.max_retries + 1):
+                backend = self._acquire_backend(avoid=failed)
+                started = False
+                generated, usage = 0, None
+                try:
+                    async with client.stream("POST", f"{backend.base_url}/api/generate",
+                                             json={**payload, "stream": True}) as response:
+                        self._check(response)
+                        async for line in response.aiter_lines():
+                            data = self._parse_line(line)
+                            if data is None:
+                                continue
+                            if data.get("done"):
+                                usage = data
+                            chunk = data.get("response", "")
+                            if chunk:
+                                started = True
+                                generated += 1
+                                yield chunk
+                    return
+                except (httpx.TransportError, _RetryableStatus) as e:
+                    if started or not self._retry(attempt, backend, e):
+                        raise self._unavailable(e) from e
+                    failed = backend
+                    await asyncio.sleep(self._delay(attempt))
+                finally:
+                    self._release_backend(backend)
+                    if usage is not None or generated:
+                        self._record_usage(usage, generated)
+
+    def stats(self) -> dict:
+        """Return in-flight, queue and retry counters."""
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self._active,
+                "waiting": self._admitted - self._active,
+                "backends": [
+                    {"url": b.base_url, "in_flight": b.in_flight, "failures": b.failures}
+                    for b in self.backends
+                ],
+                **self.counters,
+                "tokens_per_generation": round(
+                    self.counters["tokens_generated"] / self.counters["generations"], 1
+                ) if self.counters["generations"] else 0.0,
+            }
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._loop = None
+        self.close()
+
+    @contextmanager
+    def _slot(self):
+        self._admit()
+        try:
+            waiter = self._acquire()
+            if waiter is not None and not waiter.event.wait(self.queue_timeout):
+                self._abandon(waiter)
+            try:
+                yield
+            finally:
+                self._release()
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def _aslot(self):
+        self._admit()
+        try:
+            waiter = self._acquire(asyncio.get_running_loop())
+            if waiter is not None:
+                try:
+                    await asyncio.wait_for(waiter.future, timeout=self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self._abandon(waiter)
+                except asyncio.CancelledError:
+                    with self._lock:
+                        granted = waiter.granted
+                        if not granted:
+                            self._waiters.remove(waiter)
+                    if granted:
+                        self._release()
+                    raise
+            try:
+                yield
+            finally:
+                self._release()
+        finally:
+            self._leave()
+
+    def _acquire(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Take a generation slot, or return a waiter that is woken once one is handed over."""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return None
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter):
+        """Give up waiting, unless a slot was handed over in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+        raise LLMUnavailableError("Timed out waiting for an LLM slot")
+
+    def _release(self):
+        with self._lock:
+            # Hand the slot straight to the longest waiting call
+            while self._waiters:
+                if self._waiters.popleft().wake():
+                    return
+            self._active -= 1
+
+    def _admit(self):
+        """Admit a call into the running-or-waiting set, or reject it straight away."""
+        with self._lock:
+            if self._admitted >= self.max_concurrency + self.max_queue:
+                self.counters["rejected"] += 1
+                raise LLMQueueFullError("LLM request queue is full")
+            self._admitted += 1
+            self.counters["calls"] += 1
+
+    def _leave(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def _acquire_backend(self, avoid: Optional[_Backend] = None) -> _Backend:
+        with self._lock:
+            # Fewest in-flight requests first, round-robin among ties
+            start = self._next
+            self._next = (self._next + 1) % len(self.backends)
+            order = self.backends[start:] + self.backends[:start]
+            if avoid is not None and len(order) > 1:
+                # Retry somewhere other than the backend that just failed
+                order.remove(avoid)
+            backend = min(order, key=lambda b: b.in_flight)
+            backend.in_flight += 1
+            return backend
+
+    def _release_backend(self, backend: _Backend):
+        with self._lock:
+            backend.in_flight -= 1
+
+    def _post(self, backend: _Backend, payload: Dict[str, Any]) -> httpx.Response:
+        response = self.client.post(f"{backend.base_url}/api/generate", json={**payload, "stream": False})
+        self._check(response)
+        return response
+
+    async def _apost(self, client: httpx.AsyncClient, backend: _Backend, payload: Dict[str, Any]) -> httpx.Response:
+        response = await client.post(f"{backend.base_url}/api/generate", json={**payload, "stream": False})
+        self._check(response)
+        return response
+
+    def _with_retries(self, call):
+        failed = None
+        for attempt in range(self.max_retries + 1):
+            backend = self._acquire_backend(avoid=failed)
+            try:
+                return call(backend)
+            except (httpx.TransportError, _RetryableStatus) as e:
+                if not self._retry(attempt, backend, e):
+                    raise self._unavailable(e) from e
+                failed = backend
+                time.sleep(self._delay(attempt))
+            finally:
+                self._release_backend(backend)
+
+    async def _awith_retries(self, call):
+        failed = None
+        for attempt in range(self.max_retries + 1):
+            backend = self._acquire_backend(avoid=failed)
+            try:
+                return await call(backend)
+            except (httpx.TransportError, _RetryableStatus) as e:
+                if not self._retry(attempt, backend, e):
+                    raise self._unavailable(e) from e
+                failed = backend
+                await asyncio.sleep(self._delay(attempt))
+            finally:
+                self._release_backend(backend)
+
+    def _retry(self, attempt: int, backend: _Backend, error: Exception) -> bool:
+        with self._lock:
+            backend.failures += 1
+            if attempt >= self.max_retries:
+                self.counters["failed"] += 1
+                return False
+            self.counters["retries"] += 1
+        logger.warning("Ollama call to %s failed (%s), retrying", backend.base_url, error)
+        return True
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter keeps retries from piling onto the backend in lockstep
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _unavailable(self, error: Exception) -> LLMUnavailableError:
+        return LLMUnavailableError(f"LLM backend unavailable: {error}")
+
+    def _check(self, response: httpx.Response):
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise _RetryableStatus(f"HTTP {response.status_code}")
+        if response.is_error:
+            raise LLMUnavailableError(f"Ollama returned HTTP {response.status_code}")
+
+    def _parse_line(self, line: str) -> Optional[Dict[str, Any]]:
+        if not line:
+            return None
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise LLMUnavailableError(f"Ollama sent a malformed stream line: {e}") from e
+        if "error" in data:
+            raise LLMUnavailableError(f"Ollama error: {data['error']}")
+        return data
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]], streamed_chunks: int):
+        """Count tokens generated; a stream cut short reports no eval_count, so count its chunks."""
+        usage = usage or {}
+        with self._lock:
+            self.counters["generations"] += 1
+            self.counters["tokens_generated"] += usage.get("eval_count", streamed_chunks)
+            if usage.get("done_reason") == "length":
+                # Hit num_predict before the model finished
+                self.counters["truncated"] += 1
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+class _RetryableStatus(Exception):
+    pass
+
+class PooledOllama(LLM):
+    """LangChain LLM that sends Ollama generations through the shared ``OllamaPool``."""
+
+    model: str = Field(default_factory=lambda: os.getenv("OLLAMA_MODEL", "mistral:7b"))
+    temperature: float = 0
+    keep_alive: Optional[str] = Field(default_factory=lambda: os.getenv("OLLAMA_KEEP_ALIVE"))
+    format: Optional[str] = Field(default=None, description='"json" constrains output to a JSON value')
+    num_predict: Optional[int] = Field(default=None, description="Maximum tokens to generate")
+    pool: Any = Field(default=None, exclude=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "temperature": self.temperature,
+                "format": self.format, "num_predict": self.num_predict}
+
+    def _pool(self) -> OllamaPool:
+        return self.pool or get_llm_pool()
+
+    def _payload(self, prompt: str, stop: Optional[List[str]]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "prompt": prompt,
+            "options": {"temperature": self.temperature},
+        }
+        if stop:
+            payload["options"]["stop"] = stop
+        if self.num_predict:
+            payload["options"]["num_predict"] = self.num_predict
+        if self.format:
+            payload["format"] = self.format
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        if self.format == "json":
+            return self._pool().generate_json(self._payload(prompt, stop))
+        return self._pool().generate(self._payload(prompt, stop))
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        if self.format == "json":
+            return await self._pool().agenerate_json(self._payload(prompt, stop))
+        return await self._pool().agenerate(self._payload(prompt, stop))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for text in self._pool().stream(self._payload(prompt, stop)):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        async for text in self._pool().astream(self._payload(prompt, stop)):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+_llm_pool = None
+
+def get_llm_pool() -> OllamaPool:
+    """Return the process-wide Ollama connection pool."""
+    global _llm_pool
+    if _llm_pool is None:
+        _llm_pool = OllamaPool()
+    return _llm_pool
+
+def get_llm(**kwargs) -> PooledOllama:
+    """Return an LLM bound to the shared pool; kwargs override model settings."""
+    return PooledOllama(**kwargs)
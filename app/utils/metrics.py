@@ -0,0 +1,94 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+from prometheus_client import Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+STAGE_SECONDS = Histogram(
+    "assistant_stage_seconds",
+    "Time spent in each processing stage",
+    ["tool", "stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+PROMPT_TOKENS = Histogram(
+    "assistant_prompt_tokens",
+    "Tokens in prompts sent to the LLM",
+    ["tool"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192)
+)
+
+QUERY_EMBEDDING_BATCH_SIZE = Histogram(
+    "assistant_query_embedding_batch_size",
+    "Texts embedded per forward pass by the shared query embedder",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+# Per-request stage timings in milliseconds, collected only when a caller asks for them
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def span(stage: str, tool: str):
+    """Time a block into the stage histogram and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, tool, time.perf_counter() - start)
+
+def observe(stage: str, tool: str, seconds: float):
+    STAGE_SECONDS.labels(tool=tool, stage=stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        key = f"{tool}.{stage}"
+        timings[key] = round(timings.get(key, 0.0) + seconds * 1000, 3)
+
+def collect_timings() -> Dict[str, float]:
+    """Start recording stage timings for the current request and return the dict they go into.
+
+    The dict is shared with tasks and threads started afterwards from this
+    context, so spans inside ``asyncio.to_thread`` calls are included.
+    """
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+class StatsCollector:
+    """Exposes the numeric values of ``stats()`` dicts as Prometheus gauges.
+
+    Each source is a name and a callable returning a (possibly nested) dict;
+    ``{"entries": 3}`` from source ``cache`` becomes ``assistant_cache_entries``.
+    Values are read at scrape time, so nothing has to be kept in sync.
+    """
+
+    def __init__(self, sources: Dict[str, Callable[[], dict]]):
+        self.sources = sources
+
+    def collect(self):
+        for source, stats in self.sources.items():
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for name, value in self._flatten(values, f"assistant_{source}"):
+                gauge = GaugeMetricFamily(name, f"{source} stat {name}")
+                gauge.add_metric([], value)
+                yield gauge
+
+    def _flatten(self, values, prefix: str):
+        if isinstance(values, (bool, int, float)):
+            yield prefix, float(values)
+        elif isinstance(values, dict):
+            for key, value in values.items():
+                yield from self._flatten(value, f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(key))}")
+        elif isinstance(values, list):
+            for i, value in enumerate(values):
+                yield from self._flatten(value, f"{prefix}_{i}")
+
+def register_stats(sources: Dict[str, Callable[[], dict]]) -> StatsCollector:
+    """Register ``stats()`` callables with the default Prometheus registry."""
+    collector = StatsCollector(sources)
+    REGISTRY.register(collector)
+    return collector
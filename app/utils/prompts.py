@@ -69,7 +69,7 @@ Response:
 
 User Query: "Users say the dashboard doesn't update on mobile."
 Response:
-{{"tool": "summary", "reasoning": "This is an issue report needing summarization of problem and affected component.", "reformulated_query": "Summarize: Users say the dashboard doesn't update on mobile."}}
+{{"tool": "summary", "reasoning": "This is an issue report needing summarization of problem and affected component."}}
 
 User Query: "Hello, can you help me?"
 Response:
@@ -82,12 +82,12 @@ If the query doesn't match any tool, respond with "unknown".
 Think step-by-step about what the user is asking:
 1. What is the user trying to accomplish?
 2. Which tool best addresses this need?
-3. How should I reformulate the query for the selected tool?
+3. For a question, how should I reformulate it for the QA tool?
 
 Respond with JSON containing:
 - tool: "qa", "summary", or "unknown"
 - reasoning: Brief explanation of why you chose this tool
-- reformulated_query: The query reformulated for the chosen tool
+- reformulated_query: The query reformulated for the chosen tool. Leave it out for "summary"; do not repeat the issue text
 
 RESPONSE:
 """
@@ -96,4 +96,82 @@ RESPONSE:
 ROUTER_PROMPT = PromptTemplate(
     template=ROUTER_PROMPT_TEMPLATE,
     input_variables=["query"]
-)
\ No newline at end of file
+)
+
+# Single-pass router prompt that also summarizes issue reports
+ROUTE_AND_SUMMARIZE_PROMPT_TEMPLATE = """
+You are a query router and technical analyst for an internal AI assistant.
+Decide which tool should handle the query and, if it is an issue report, summarize it in the same response.
+
+Available tools:
+1. QA Tool ("qa"): Answers factual questions about bugs, features, or user feedback using internal documentation.
+2. Summary Tool ("summary"): Takes issue text and summarizes the reported issues, affected features, and severity.
+3. Unknown Tool ("unknown"): For anything that doesn't fit.
+
+USER QUERY: {query}
+
+### EXAMPLES
+
+User Query: "What are the issues reported on email notifications?"
+Response:
+{{"tool": "qa", "reasoning": "The user is asking about issues mentioned in the documentation.", "reformulated_query": "List all reported issues related to email notifications."}}
+
+User Query: "Users say the dashboard doesn't update on mobile."
+Response:
+{{"tool": "summary", "reasoning": "This is an issue report needing summarization.", "summary": {{"reported_issues": ["Dashboard does not update on mobile"], "affected_components": ["Dashboard", "Mobile app"], "severity": "Medium"}}}}
+
+User Query: "Hello, can you help me?"
+Response:
+{{"tool": "unknown", "reasoning": "This query doesn't match QA or summarization tasks.", "reformulated_query": "Hello, can you help me?"}}
+
+Respond with JSON containing:
+- tool: "qa", "summary", or "unknown"
+- reasoning: Brief explanation of why you chose this tool
+- reformulated_query: The query reformulated for the chosen tool. Leave it out for "summary"; do not repeat the issue text
+- summary: Only when tool is "summary", an object with
+  - reported_issues: [list of distinct reported issues]
+  - affected_components: [list of affected features or components]
+  - severity: "Critical", "High", "Medium" or "Low"
+
+RESPONSE:
+"""
+
+ROUTE_AND_SUMMARIZE_PROMPT = PromptTemplate(
+    template=ROUTE_AND_SUMMARIZE_PROMPT_TEMPLATE,
+    input_variables=["query"]
+)
+
+# Labelled example queries for the fast-path router classifier.
+# Keys must match the router tool names.
+ROUTER_EXAMPLES = {
+    "qa": [
+        "What are the issues reported on email notifications?",
+        "What bugs were reported in the last release?",
+        "Which features did users ask for in the feedback?",
+        "How many users complained about the login page?",
+        "What is the status of the payment integration bug?",
+        "List all known issues with the search feature.",
+        "What did users say about the new onboarding flow?",
+        "Which components are affected by the performance problems?",
+    ],
+    "summary": [
+        "Users say the dashboard doesn't update on mobile.",
+        "The app crashes when I upload a file larger than 10MB.",
+        "Login fails on Safari and users get logged out unexpectedly.",
+        "Customers report that invoices are sent twice and the totals are wrong.",
+        "After the latest update, push notifications stopped arriving on Android.",
+        "Summarize this issue: the export button does nothing and the page freezes.",
+        "Bug report: search results are empty when filters are applied.",
+        "The checkout page times out under load and payments are declined.",
+    ],
+    "unknown": [
+        "Hello, can you help me?",
+        "Hi, are you there?",
+        "Tell me a joke.",
+        "What's the weather like today?",
+        "Thanks!",
+        "Who are you?",
+        "Good morning",
+        "Write me a poem about cats.",
+    ],
+}
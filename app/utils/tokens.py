@@ -0,0 +1,58 @@
+import os
+import math
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for English text, used when tiktoken has no encoding
+CHARS_PER_TOKEN = 4
+
+class TokenCounter:
+    """Counts and truncates text in tokens using tiktoken.
+
+    tiktoken downloads its encoding files on first use; when that is not
+    possible (e.g. in an offline container) counts fall back to a
+    characters-per-token estimate instead of failing the request.
+    """
+
+    def __init__(self, encoding_name=None):
+        self.encoding_name = encoding_name or os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning("tiktoken encoding %s unavailable (%s), estimating tokens", self.encoding_name, e)
+                    self._loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:max_tokens])
+
+_token_counter = None
+
+def get_token_counter() -> TokenCounter:
+    """Return the process-wide token counter."""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter
@@ -0,0 +1,163 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from app.agents.router_agent import RouterOutput, ToolType
+from app.batch import BatchProcessor, BatchQuery, read_queries
+from app.tools.qa_tool import QAToolOutput
+from app.tools.summary_tool import SummaryToolOutput
+from app.utils.cache import ResponseCache
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def fast_route(query, vector):
+    if query.startswith("?"):
+        return None  # leave it to the LLM router
+    tool = ToolType.SUMMARY if query.startswith("bug") else ToolType.QA
+    return RouterOutput(tool=tool, reasoning="fast",
+                        reformulated_query=f"Summarize: {query}" if tool == ToolType.SUMMARY else query)
+
+class TestBatchProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = FakeEmbeddings()
+        self.embeddings.embed_documents = MagicMock(side_effect=FakeEmbeddings.embed_documents.__get__(self.embeddings))
+
+        self.router_agent = MagicMock()
+        self.router_agent.route_fast_batch.side_effect = lambda queries, vectors: [
+            fast_route(query, vector) for query, vector in zip(queries, vectors)
+        ]
+
+        async def aroute_llm(query):
+            return RouterOutput(tool=ToolType.QA, reasoning="llm", reformulated_query=f"rewritten {query}")
+        self.router_agent.aroute_llm.side_effect = aroute_llm
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def aanswer(query, documents):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return QAToolOutput(answer=f"answer to {query}", source_documents=[])
+
+        self.qa_tool = MagicMock()
+        self.qa_tool.retrieve_batch.side_effect = lambda inputs, vectors: [
+            [Document(page_content=input_data.query)] for input_data in inputs
+        ]
+        self.qa_tool.aanswer.side_effect = aanswer
+
+        async def aretrieve(input_data):
+            return [Document(page_content=input_data.query)]
+        self.qa_tool.aretrieve.side_effect = aretrieve
+
+        async def summarize(input_data):
+            return SummaryToolOutput(reported_issues=[input_data.issue_text], affected_components=[], severity="Low")
+        self.summary_tool = MagicMock()
+        self.summary_tool.arun.side_effect = summarize
+
+        self.processor = BatchProcessor(
+            self.embeddings, self.router_agent, self.qa_tool, self.summary_tool,
+            batch_size=3, concurrency=2
+        )
+
+    def run_batch(self, queries):
+        async def collect():
+            return [result async for result in self.processor.process(queries)]
+        return asyncio.run(collect())
+
+    def test_every_query_gets_a_result_with_its_id(self):
+        queries = [BatchQuery(id=f"q{i}", query=f"what is item {i}") for i in range(7)]
+        queries.append(BatchQuery(id="s", query="bug: export fails"))
+        queries.append(BatchQuery(id="l", query="? ambiguous"))
+
+        results = {result["id"]: result for result in self.run_batch(queries)}
+
+        self.assertEqual(set(results), {f"q{i}" for i in range(7)} | {"s", "l"})
+        self.assertEqual(results["q3"]["result"]["answer"], "answer to what is item 3")
+        self.assertEqual(results["s"]["tool_used"], "summary")
+        self.assertEqual(results["s"]["result"]["reported_issues"], ["bug: export fails"])
+        self.assertEqual(results["l"]["result"]["answer"], "answer to rewritten ? ambiguous")
+        self.router_agent.aroute_llm.assert_called_once_with("? ambiguous")
+
+    def test_embeds_and_searches_once_per_batch(self):
+        queries = [BatchQuery(id=i, query=f"what is item {i}") for i in range(7)]
+
+        self.run_batch(queries)
+
+        self.assertEqual(self.embeddings.embed_documents.call_count, 3)
+        self.assertEqual(self.qa_tool.retrieve_batch.call_count, 3)
+        inputs, vectors = self.qa_tool.retrieve_batch.call_args_list[0][0]
+        self.assertEqual(len(inputs), 3)
+        self.assertEqual(vectors.shape, (3, 2))
+        self.qa_tool.aretrieve.assert_not_called()
+
+    def test_llm_calls_respect_concurrency_limit(self):
+        queries = [BatchQuery(id=i, query=f"what is item {i}") for i in range(10)]
+
+        self.run_batch(queries)
+
+        self.assertEqual(self.max_in_flight, 2)
+
+    def test_failed_query_reports_error_without_stopping_batch(self):
+        original = self.qa_tool.aanswer.side_effect
+
+        async def flaky(query, documents):
+            if "item 1" in query:
+                raise RuntimeError("backend unavailable")
+            return await original(query, documents)
+        self.qa_tool.aanswer.side_effect = flaky
+
+        results = {result["id"]: result for result in self.run_batch(
+            [BatchQuery(id=i, query=f"what is item {i}") for i in range(3)]
+        )}
+
+        self.assertIn("backend unavailable", results[1]["error"])
+        self.assertIn("answer", results[2]["result"])
+
+    def test_cached_queries_skip_routing(self):
+        cache = ResponseCache(embeddings=self.embeddings, max_entries=10)
+        self.processor.response_cache = cache
+        queries = [BatchQuery(id=1, query="what is item 1")]
+
+        self.run_batch(queries)
+        results = self.run_batch(queries)
+
+        self.assertTrue(results[0]["metadata"]["cache"]["hit"])
+        self.assertEqual(self.router_agent.route_fast_batch.call_count, 2)
+        self.assertEqual(self.qa_tool.aanswer.call_count, 1)
+
+    def test_queries_with_retrieval_options_bypass_the_cache(self):
+        self.processor.response_cache = ResponseCache(embeddings=self.embeddings, max_entries=10)
+        self.run_batch([BatchQuery(id=1, query="what is item 1")])
+
+        results = self.run_batch([
+            BatchQuery(id=2, query="what is item 1", retrieval_mode="bm25"),
+            BatchQuery(id=3, query="what is item 1", nprobe=8),
+        ])
+
+        self.assertFalse(any(result["metadata"]["cache"]["hit"] for result in results))
+        self.assertEqual(self.qa_tool.aanswer.call_count, 3)
+        self.assertEqual(self.processor.response_cache.stats()["entries"], 1)
+
+class TestReadQueries(unittest.TestCase):
+
+    def test_missing_ids_default_to_line_numbers(self):
+        queries = read_queries(['{"id": "a", "query": "first"}', "", '{"query": "second"}'])
+
+        self.assertEqual([query.id for query in queries], ["a", 3])
+
+    def test_invalid_lines_are_reported(self):
+        with self.assertRaisesRegex(ValueError, "line 2"):
+            read_queries(['{"query": "ok"}', "not json"])
+        with self.assertRaisesRegex(ValueError, "empty"):
+            read_queries(['{"query": "  "}'])
+
+if __name__ == "__main__":
+    unittest.main()
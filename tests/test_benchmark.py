@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+import httpx
+from app.benchmark.corpus import generate_corpus, generate_queries
+from app.benchmark.load import percentiles, read_trace, run_load
+from app.benchmark.mock_ollama import MockOllama, start_server
+from app.utils.prompts import QA_PROMPT, ROUTE_AND_SUMMARIZE_PROMPT, ROUTER_PROMPT, SUMMARY_PROMPT
+
+class TestMockOllama(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = MockOllama(latency=0, tokens_per_second=0, answer_tokens=5)
+        self.server = start_server(self.mock)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/generate"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_router_prompt_gets_valid_route(self):
+        prompt = ROUTER_PROMPT.format(query="Users say Export crashes on Safari.")
+        response = httpx.post(self.url, json={"prompt": prompt, "stream": False}).json()
+
+        route = json.loads(response["response"])
+        self.assertEqual(route["tool"], "summary")
+        self.assertNotIn("summary", route)
+        self.assertEqual(response["eval_count"], len(response["response"].split()))
+
+    def test_combined_prompt_includes_summary(self):
+        prompt = ROUTE_AND_SUMMARIZE_PROMPT.format(query="Users say Export crashes on Safari.")
+        route = json.loads(httpx.post(self.url, json={"prompt": prompt, "stream": False}).json()["response"])
+
+        self.assertEqual(set(route["summary"]), {"reported_issues", "affected_components", "severity"})
+        self.assertIn("Export", route["summary"]["affected_components"])
+
+    def test_streamed_answer_respects_num_predict(self):
+        prompt = QA_PROMPT.format(context="ctx", question="What broke?")
+        with httpx.stream("POST", self.url, json={"prompt": prompt, "options": {"num_predict": 3}}) as response:
+            chunks = [json.loads(line) for line in response.iter_lines() if line]
+
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(chunks[-1]["done"])
+        self.assertEqual(chunks[-1]["eval_count"], 3)
+
+    def test_summary_prompt_gets_summary(self):
+        prompt = SUMMARY_PROMPT.format(issue_text="Billing page fails to load")
+        summary = json.loads(httpx.post(self.url, json={"prompt": prompt, "stream": False}).json()["response"])
+
+        self.assertEqual(summary["affected_components"], ["Billing"])
+
+class TestCorpus(unittest.TestCase):
+
+    def test_generates_requested_size_deterministically(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            paths = generate_corpus(first, documents=3, paragraphs=2, seed=1)
+            generate_corpus(second, documents=3, paragraphs=2, seed=1)
+
+            self.assertEqual(len(paths), 3)
+            with open(paths[0]) as f:
+                text = f.read()
+            with open(os.path.join(second, os.path.basename(paths[0]))) as f:
+                self.assertEqual(f.read(), text)
+            self.assertEqual(len(text.split("\n\n")), 2)
+
+    def test_queries_are_trace_records(self):
+        queries = generate_queries(5)
+        self.assertEqual([query["id"] for query in queries], list(range(5)))
+        self.assertTrue(all(query["query"] for query in queries))
+
+class TestLoad(unittest.TestCase):
+
+    def test_read_trace_accepts_backlog_records(self):
+        trace = read_trace([
+            '{"id": "q1", "query": "What broke?", "nprobe": 4}',
+            "",
+            '{"request_id": "r-2", "title": "Slow search", "body": "Search takes 10s"}',
+        ])
+
+        self.assertEqual(trace[0]["nprobe"], 4)
+        self.assertEqual(trace[1]["id"], "r-2")
+        self.assertEqual(trace[1]["query"], "Slow search\n\nSearch takes 10s")
+
+    def test_read_trace_rejects_records_without_query(self):
+        with self.assertRaisesRegex(ValueError, "line 1"):
+            read_trace(['{"id": 1}'])
+
+    def test_percentiles(self):
+        summary = percentiles(list(range(1, 101)))
+        self.assertEqual(summary["p50"], 50.5)
+        self.assertEqual(summary["max"], 100)
+        self.assertEqual(percentiles([])["p99"], 0.0)
+
+    def test_run_load_cycles_trace_and_counts_errors(self):
+        sent = []
+
+        def handler(request):
+            body = json.loads(request.content)
+            sent.append(body)
+            if body["query"] == "bad":
+                return httpx.Response(429, json={"detail": "queue full"})
+            return httpx.Response(200, json={"tool_used": "qa", "metadata": {"cache": {"hit": False}}})
+
+        async def drive():
+            transport = httpx.MockTransport(handler)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                trace = [{"id": 1, "query": "good", "extra": "x"}, {"id": 2, "query": "bad"}]
+                return await run_load(client, trace, concurrency=2, requests=4)
+
+        result = asyncio.run(drive())
+
+        self.assertEqual(len(sent), 4)
+        self.assertNotIn("extra", sent[0])
+        self.assertEqual(result["succeeded"], 2)
+        self.assertEqual(result["statuses"], {"200": 2, "429": 2})
+        self.assertEqual(result["by_tool"]["qa"]["count"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from langchain_core.documents import Document
+from app.utils.context import ContextBuilder
+from app.utils.tokens import TokenCounter
+
+# An unknown encoding makes the counter use its characters-per-token estimate
+COUNTER = TokenCounter("missing-encoding-for-tests")
+
+TEXT = "".join(f"Bug #{i}: something in component {i} is broken. " for i in range(40))
+
+def chunk(start, end, source="bugs.txt"):
+    return Document(page_content=TEXT[start:end], metadata={"source": source, "start_index": start})
+
+class TestContextBuilder(unittest.TestCase):
+
+    def test_overlapping_chunks_from_same_source_are_merged(self):
+        builder = ContextBuilder(max_tokens=10_000, counter=COUNTER)
+
+        packed = builder.pack([chunk(100, 400), chunk(300, 600)])
+
+        self.assertEqual(packed.chunks_merged, 1)
+        self.assertEqual(len(packed.documents), 1)
+        self.assertEqual(packed.text, TEXT[100:600])
+
+    def test_overlap_is_detected_textually_without_offsets(self):
+        builder = ContextBuilder(max_tokens=10_000, counter=COUNTER)
+        first = Document(page_content=TEXT[0:300], metadata={"source": "bugs.txt"})
+        second = Document(page_content=TEXT[250:500], metadata={"source": "bugs.txt"})
+
+        packed = builder.pack([second, first])
+
+        self.assertEqual(packed.text, TEXT[0:500])
+
+    def test_chunks_from_other_sources_or_far_apart_are_kept_separate(self):
+        builder = ContextBuilder(max_tokens=10_000, counter=COUNTER)
+
+        packed = builder.pack([chunk(0, 200), chunk(800, 1000), chunk(100, 300, source="other.txt")])
+
+        self.assertEqual(packed.chunks_merged, 0)
+        self.assertEqual(len(packed.documents), 3)
+
+    def test_duplicates_are_removed(self):
+        builder = ContextBuilder(max_tokens=10_000, counter=COUNTER)
+        copy = Document(page_content="  " + TEXT[0:300].upper(), metadata={"source": "copy.txt"})
+
+        packed = builder.pack([chunk(0, 300), chunk(50, 250), copy])
+
+        self.assertEqual(packed.duplicates_removed, 2)
+        self.assertEqual(len(packed.documents), 1)
+
+    def test_packing_stops_at_token_budget(self):
+        builder = ContextBuilder(max_tokens=100, counter=COUNTER)
+        documents = [
+            Document(page_content=f"Report {i}: " + TEXT[i * 300:i * 300 + 200], metadata={"source": f"doc{i}.txt"})
+            for i in range(5)
+        ]
+
+        packed = builder.pack(documents)
+
+        self.assertLessEqual(packed.context_tokens, 100)
+        self.assertEqual(len(packed.documents), 2)  # one full chunk, one truncated
+        self.assertEqual(packed.chunks_dropped, 3)
+        self.assertTrue(packed.text.startswith("Report 0:"))
+
+if __name__ == "__main__":
+    unittest.main()
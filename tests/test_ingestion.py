@@ -0,0 +1,484 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import numpy as np
+from unittest.mock import MagicMock, patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from app.data.embedding import EmbeddingPipeline, QueryEmbedder
+from app.data.index import IndexSpec, ReservoirSample
+from app.data.index_report import evaluate_specs
+from app.data.ingestion import DocumentIngestion, ShardedIngestion
+from app.data.loaders import DocumentLoader, parallel_map
+from app.data.store import SQLiteDocstore
+from app.utils.cache_backends import SQLiteBackend
+
+class TestIncrementalIngestion(unittest.TestCase):
+
+    @patch("app.data.ingestion.HuggingFaceEmbeddings")
+    def setUp(self, mock_embeddings_class):
+        mock_embeddings_class.return_value = DeterministicFakeEmbedding(size=8)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmp_dir.name, "documents")
+        os.makedirs(self.data_dir)
+        self.write("bugs.txt", "Bug #1: Login fails on Safari.")
+        self.write("feedback.txt", "Users love the new dashboard.")
+
+        self.ingestion = DocumentIngestion(
+            data_dir=self.data_dir,
+            index_path=os.path.join(self.tmp_dir.name, "faiss_index")
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, text):
+        with open(os.path.join(self.data_dir, name), "w") as f:
+            f.write(text)
+
+    def test_first_reload_builds_full_index(self):
+        vectorstore, report = self.ingestion.reload_vectorstore()
+
+        self.assertTrue(report.full_rebuild)
+        self.assertEqual(len(report.added), 2)
+        self.assertEqual(vectorstore.index.ntotal, 2)
+
+    def test_reload_without_changes_embeds_nothing(self):
+        self.ingestion.reload_vectorstore()
+
+        with patch.object(self.ingestion, "split_documents") as mock_split:
+            _, report = self.ingestion.reload_vectorstore()
+
+        mock_split.assert_not_called()
+        self.assertEqual(report.unchanged, 2)
+        self.assertEqual(report.chunks_added, 0)
+
+    def test_reload_applies_added_updated_and_removed_files(self):
+        self.ingestion.reload_vectorstore()
+        self.write("bugs.txt", "Bug #2: Export button does nothing.")
+        self.write("notes.txt", "Release notes for version 2.")
+        os.remove(os.path.join(self.data_dir, "feedback.txt"))
+
+        vectorstore, report = self.ingestion.reload_vectorstore()
+
+        self.assertFalse(report.full_rebuild)
+        self.assertEqual([os.path.basename(p) for p in report.added], ["notes.txt"])
+        self.assertEqual([os.path.basename(p) for p in report.updated], ["bugs.txt"])
+        self.assertEqual([os.path.basename(p) for p in report.removed], ["feedback.txt"])
+        contents = sorted(
+            vectorstore.docstore.search(chunk_id).page_content
+            for chunk_id in vectorstore.index_to_docstore_id.values()
+        )
+        self.assertEqual(contents, ["Bug #2: Export button does nothing.", "Release notes for version 2."])
+
+        # The saved index reflects the update
+        reloaded = self.ingestion.get_or_create_vectorstore()
+        self.assertEqual(reloaded.index.ntotal, 2)
+
+    def test_chunks_are_embedded_in_batches(self):
+        self.ingestion.batch_size = 1
+
+        original_embed = EmbeddingPipeline.embed
+        with patch.object(EmbeddingPipeline, "embed", autospec=True,
+                          side_effect=lambda pipeline, texts: original_embed(pipeline, texts)) as mock_embed:
+            vectorstore, report = self.ingestion.reload_vectorstore()
+
+        self.assertEqual(mock_embed.call_count, 2)
+        self.assertEqual(report.chunks_added, 2)
+        self.assertGreater(report.chunks_per_second, 0)
+        self.assertEqual(vectorstore.index.ntotal, 2)
+
+    def test_index_spec_is_persisted_and_change_forces_rebuild(self):
+        self.ingestion.reload_vectorstore()
+        self.assertEqual(self.ingestion.load_index_spec()["factory"], "Flat")
+
+        self.ingestion.index_spec = IndexSpec("IVF16,Flat", train_size=100)
+        vectorstore, report = self.ingestion.reload_vectorstore()
+
+        self.assertTrue(report.full_rebuild)
+        self.assertEqual(self.ingestion.load_index_spec()["factory"], "IVF16,Flat")
+        # Clamped to the size of the training sample
+        self.assertEqual(vectorstore.index.nlist, 1)
+
+    def test_training_sample_is_drawn_from_the_whole_stream(self):
+        sample = ReservoirSample(50, seed=0)
+        for start in range(0, 1000, 32):
+            sample.add(np.arange(start, min(start + 32, 1000), dtype=np.float32)[:, None])
+
+        values = sample.sample[:, 0]
+        self.assertEqual(sample.seen, 1000)
+        self.assertEqual(len(set(values)), 50)
+        self.assertGreater(values.max(), 500)
+
+    def test_hnsw_index_rebuilds_when_files_change(self):
+        self.ingestion.index_spec = IndexSpec("HNSW8")
+        self.ingestion.reload_vectorstore()
+        self.write("bugs.txt", "Bug #3: Dark mode colours are wrong.")
+
+        _, report = self.ingestion.reload_vectorstore()
+
+        self.assertTrue(report.full_rebuild)
+
+    def test_index_is_stored_without_pickle_and_loaded_lazily(self):
+        self.ingestion.reload_vectorstore()
+        files = sorted(os.listdir(self.ingestion.index_path))
+        self.assertEqual(files, ["docstore.sqlite", "index.faiss", "manifest.json"])
+
+        vectorstore = self.ingestion.get_or_create_vectorstore()
+
+        self.assertIsInstance(vectorstore.docstore, SQLiteDocstore)
+        results = vectorstore.similarity_search("Bug #1: Login fails on Safari.", k=1)
+        self.assertEqual(results[0].page_content, "Bug #1: Login fails on Safari.")
+        self.assertEqual(results[0].metadata["file_type"], "txt")
+
+    def test_signature_changes_when_another_process_saves(self):
+        self.ingestion.reload_vectorstore()
+        before = self.ingestion.signature()
+        other = DocumentIngestion(data_dir=self.data_dir, index_path=self.ingestion.index_path,
+                                  embeddings=self.ingestion.embeddings)
+        self.write("notes.txt", "Release notes for version 2.")
+
+        other.reload_vectorstore()
+
+        self.assertNotEqual(self.ingestion.signature(), before)
+        self.assertEqual(self.ingestion.load_index().index.ntotal, 3)
+
+class TestShardedIngestion(unittest.TestCase):
+
+    @patch("app.data.ingestion.HuggingFaceEmbeddings")
+    def setUp(self, mock_embeddings_class):
+        mock_embeddings_class.return_value = DeterministicFakeEmbedding(size=8)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmp_dir.name, "documents")
+        self.index_path = os.path.join(self.tmp_dir.name, "faiss_index")
+        self.write("payments/bugs.txt", "Bug #1: Refunds fail.")
+        self.write("search/bugs.txt", "Bug #2: Search is slow.")
+        self.write("readme.txt", "Shared notes.")
+        self.ingestion = ShardedIngestion(data_dir=self.data_dir, index_path=self.index_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.data_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def index_mtime(self, shard):
+        return os.stat(os.path.join(self.index_path, shard, "index.faiss")).st_mtime_ns
+
+    def test_builds_one_index_per_team_folder(self):
+        vectorstores, report = self.ingestion.reload_vectorstore()
+
+        self.assertEqual(sorted(vectorstores), ["_root", "payments", "search"])
+        self.assertEqual(len(report.added), 3)
+        chunk = vectorstores["payments"].docstore.search(vectorstores["payments"].index_to_docstore_id[0])
+        self.assertEqual(chunk.metadata["team"], "payments")
+        self.assertTrue(self.ingestion.index_exists())
+
+    def test_change_in_one_shard_leaves_the_others_untouched(self):
+        self.ingestion.reload_vectorstore()
+        search_mtime = self.index_mtime("search")
+
+        self.write("payments/bugs.txt", "Bug #1: Refunds fail twice.")
+        _, report = self.ingestion.reload_vectorstore()
+
+        self.assertEqual(report.updated, [os.path.join(self.data_dir, "payments", "bugs.txt")])
+        self.assertEqual(report.unchanged, 2)
+        self.assertEqual(self.index_mtime("search"), search_mtime)
+
+    def test_reload_can_be_limited_to_some_shards(self):
+        self.ingestion.reload_vectorstore()
+        self.write("payments/bugs.txt", "Bug #1: Refunds fail twice.")
+        self.write("search/bugs.txt", "Bug #2: Search is slower.")
+
+        vectorstores, report = self.ingestion.reload_vectorstore(shards=["search"])
+
+        self.assertEqual(report.updated, [os.path.join(self.data_dir, "search", "bugs.txt")])
+        self.assertEqual(sorted(vectorstores), ["_root", "payments", "search"])
+
+    def test_empty_and_hidden_folders_get_no_shard(self):
+        os.makedirs(os.path.join(self.data_dir, "empty_team"))
+        self.write(".git/HEAD.txt", "ref: refs/heads/main")
+        self.write("design/mockup.png", "not a document")
+
+        vectorstores, _ = self.ingestion.reload_vectorstore()
+
+        self.assertEqual(sorted(vectorstores), ["_root", "payments", "search"])
+
+    def test_team_folder_emptied_of_documents_drops_its_shard(self):
+        self.ingestion.reload_vectorstore()
+        os.remove(os.path.join(self.data_dir, "search", "bugs.txt"))
+
+        vectorstores, report = self.ingestion.reload_vectorstore()
+
+        self.assertEqual(sorted(vectorstores), ["_root", "payments"])
+        self.assertEqual(report.removed, [os.path.join(self.data_dir, "search", "bugs.txt")])
+        self.assertFalse(os.path.exists(os.path.join(self.index_path, "search")))
+
+    def test_removed_team_folder_drops_its_shard(self):
+        self.ingestion.reload_vectorstore()
+        os.remove(os.path.join(self.data_dir, "search", "bugs.txt"))
+        os.rmdir(os.path.join(self.data_dir, "search"))
+
+        vectorstores, report = self.ingestion.reload_vectorstore()
+
+        self.assertNotIn("search", vectorstores)
+        self.assertEqual(report.removed, [os.path.join(self.data_dir, "search", "bugs.txt")])
+        self.assertFalse(os.path.exists(os.path.join(self.index_path, "search")))
+
+    def test_unsupported_shard_key_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, "Cannot shard by"):
+            ShardedIngestion(data_dir=self.data_dir, index_path=self.index_path, shard_key="date")
+
+class TestIndexReport(unittest.TestCase):
+
+    def test_flat_baseline_and_hnsw_recall(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 16)).astype(np.float32)
+
+        report = evaluate_specs(vectors, vectors[:20], ["HNSW16", "IVF8,Flat"], k=3,
+                                nprobes=[8], ef_searches=[64])
+
+        self.assertEqual([row["spec"] for row in report], ["Flat", "HNSW16", "IVF8,Flat"])
+        self.assertEqual(report[1]["ef_search"], 64)
+        self.assertEqual(report[2]["nprobe"], 8)
+        # Visiting every list of an IVF index is exact
+        self.assertEqual(report[2]["recall_at_k"], 1.0)
+        self.assertGreater(report[1]["recall_at_k"], 0.9)
+
+class TestEmbeddingPipeline(unittest.TestCase):
+
+    def test_embed_returns_normalized_float32(self):
+        pipeline = EmbeddingPipeline(DeterministicFakeEmbedding(size=8), batch_size=4, workers=0)
+
+        vectors = pipeline.embed(["first chunk", "second chunk"])
+
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), [1.0, 1.0], rtol=1e-5)
+        self.assertEqual(pipeline.chunks_embedded, 2)
+
+class CountingEmbeddings:
+    """Fake embeddings that record each forward pass."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+class TestQueryEmbedder(unittest.TestCase):
+
+    def test_repeated_query_is_served_from_cache(self):
+        embeddings = CountingEmbeddings()
+        embedder = QueryEmbedder(embeddings, batch_window_ms=0)
+
+        first = embedder.embed_query("Why does  login fail?")
+        second = embedder.embed_query("Why does login\nfail?")
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(embeddings.calls), 1)
+        stats = embedder.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_concurrent_queries_share_one_forward_pass(self):
+        embeddings = CountingEmbeddings()
+        embedder = QueryEmbedder(embeddings, batch_window_ms=200)
+        barrier = threading.Barrier(6)
+        results = {}
+
+        def query(i):
+            barrier.wait()
+            results[i] = embedder.embed_query(f"query {'x' * i}")
+
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(embeddings.calls), 1)
+        self.assertEqual(sorted(len(text) for text in embeddings.calls[0]), [6, 7, 8, 9, 10, 11])
+        self.assertEqual(results[3], [9.0, 1.0])
+        self.assertEqual(embedder.stats()["max_batch_size"], 6)
+
+    def test_embed_documents_skips_cached_and_duplicate_texts(self):
+        embeddings = CountingEmbeddings()
+        embedder = QueryEmbedder(embeddings, batch_window_ms=0)
+        embedder.embed_query("a")
+
+        vectors = embedder.embed_documents(["a", "bb", "bb"])
+
+        self.assertEqual(vectors, [[1.0, 1.0], [2.0, 1.0], [2.0, 1.0]])
+        self.assertEqual(embeddings.calls[-1], ["bb"])
+
+    def test_cache_is_bounded_lru(self):
+        embeddings = CountingEmbeddings()
+        embedder = QueryEmbedder(embeddings, cache_size=2, batch_window_ms=0)
+        embedder.embed_documents(["a", "b"])
+        embedder.embed_query("a")
+        embedder.embed_query("c")
+
+        embedder.embed_query("b")
+
+        self.assertEqual(embeddings.calls[-1], ["b"])
+        self.assertEqual(embedder.stats()["entries"], 2)
+
+    def test_cache_holds_float32_arrays_and_returns_lists(self):
+        embedder = QueryEmbedder(CountingEmbeddings(), batch_window_ms=0)
+        embedder.embed_query("a")
+
+        vector = embedder.embed_query("a")
+
+        self.assertEqual(embedder._cache["a"].dtype, np.float32)
+        self.assertIsInstance(vector, list)
+        self.assertIsInstance(vector[0], float)
+
+    def test_errors_reach_every_waiting_caller(self):
+        embeddings = CountingEmbeddings()
+        embeddings.embed_documents = lambda texts: (_ for _ in ()).throw(RuntimeError("model gone"))
+        embedder = QueryEmbedder(embeddings, batch_window_ms=0)
+
+        with self.assertRaisesRegex(RuntimeError, "model gone"):
+            embedder.embed_query("a")
+
+    def test_shared_backend_embeds_each_query_once_across_workers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backend = SQLiteBackend(os.path.join(tmp_dir, "cache.sqlite"))
+            embeddings = CountingEmbeddings()
+            first = QueryEmbedder(embeddings, batch_window_ms=0, backend=backend)
+            second = QueryEmbedder(embeddings, batch_window_ms=0, backend=backend)
+
+            first.embed_query("Why does login fail?")
+            vectors = second.embed_documents(["Why does login fail?", "b"])
+
+            self.assertEqual(vectors, [[20.0, 1.0], [1.0, 1.0]])
+            self.assertEqual(embeddings.calls, [["Why does login fail?"], ["b"]])
+            self.assertEqual(second.stats()["shared_hits"], 1)
+            self.assertEqual(second.embed_query("b"), [1.0, 1.0])
+            backend.close()
+
+    def test_failing_shared_backend_does_not_block_callers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backend = SQLiteBackend(os.path.join(tmp_dir, "cache.sqlite"))
+            backend.put = MagicMock(side_effect=sqlite3.OperationalError("database is locked"))
+            embedder = QueryEmbedder(CountingEmbeddings(), batch_window_ms=0, backend=backend)
+
+            with self.assertLogs("app.data.embedding", "ERROR"):
+                self.assertEqual(embedder.embed_query("a"), [1.0, 1.0])
+                self.assertEqual(embedder.embed_documents(["bb"]), [[2.0, 1.0]])
+            self.assertEqual(embedder.embed_query("a"), [1.0, 1.0])
+            self.assertEqual(embedder._pending, {})
+            backend.close()
+
+class TestDocumentLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        os.makedirs(os.path.join(self.root, "team-a", "reports"))
+        with open(os.path.join(self.root, "notes.md"), "w") as f:
+            f.write("# Release notes")
+        with open(os.path.join(self.root, "ignored.csv"), "w") as f:
+            f.write("a,b")
+        with open(os.path.join(self.root, "team-a", "reports", "export.jsonl"), "w") as f:
+            f.write('{"id": 1, "text": "Export fails"}\n\n{"id": 2, "body": "Search is slow"}\n')
+        with open(os.path.join(self.root, "team-a", "server.log"), "w") as f:
+            f.write("".join(f"line {i}\n" for i in range(100)))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_walks_tree_and_loads_supported_formats(self):
+        loader = DocumentLoader(self.root, workers=2)
+
+        documents = list(loader.lazy_load())
+
+        contents = [doc.page_content for doc in documents]
+        self.assertIn("# Release notes", contents)
+        self.assertIn("Export fails", contents)
+        self.assertIn("Search is slow", contents)
+        self.assertFalse(any("a,b" in content for content in contents))
+
+        jsonl_doc = next(doc for doc in documents if doc.page_content == "Search is slow")
+        self.assertEqual(jsonl_doc.metadata["line"], 3)
+        self.assertEqual(jsonl_doc.metadata["file_type"], "jsonl")
+        self.assertIn("mtime", jsonl_doc.metadata)
+        self.assertIn("size", jsonl_doc.metadata)
+
+    def test_malformed_jsonl_lines_are_skipped(self):
+        path = os.path.join(self.root, "team-a", "broken.jsonl")
+        with open(path, "wb") as f:
+            f.write(b'{"text": "Login fails"}\n{"text": "cut off\n{"text": "Bad byte \xff"}\n')
+        loader = DocumentLoader(self.root, workers=1)
+
+        with self.assertLogs("app.data.loaders", "WARNING") as logs:
+            documents = loader.load_file(path)
+
+        self.assertEqual([doc.page_content for doc in documents], ["Login fails", "Bad byte \ufffd"])
+        self.assertEqual([doc.metadata["line"] for doc in documents], [1, 3])
+        self.assertIn("broken.jsonl:2", logs.output[0])
+
+    def test_records_team_component_and_date_metadata(self):
+        with open(os.path.join(self.root, "team-a", "incident.txt"), "w") as f:
+            f.write("Title: Checkout outage\nTeam: mobile\nComponent: payments-api\nDate: 2024-03-05 14:00\n\nDetails...")
+        with open(os.path.join(self.root, "team-a", "tickets.jsonl"), "w") as f:
+            f.write('{"text": "Refund stuck", "team": "billing", "date": "2024-02-01"}\n')
+        loader = DocumentLoader(self.root, workers=1)
+
+        incident = loader.load_file(os.path.join(self.root, "team-a", "incident.txt"))[0]
+        ticket = loader.load_file(os.path.join(self.root, "team-a", "tickets.jsonl"))[0]
+        notes = loader.load_file(os.path.join(self.root, "notes.md"))[0]
+
+        self.assertEqual(incident.metadata["team"], "team-a")
+        self.assertEqual(incident.metadata["component"], "payments-api")
+        self.assertEqual(incident.metadata["date"], "2024-03-05")
+        # The team always comes from the folder, which also picks the shard
+        self.assertEqual(ticket.metadata["team"], "team-a")
+        self.assertEqual(ticket.metadata["date"], "2024-02-01")
+        self.assertIsNone(notes.metadata["team"])
+        self.assertIsNone(notes.metadata["component"])
+        self.assertRegex(notes.metadata["date"], r"^\d{4}-\d{2}-\d{2}$")
+
+    def test_subdir_limits_loading_but_keeps_team(self):
+        loader = DocumentLoader(self.root, workers=1, subdir="team-a")
+
+        documents = list(loader.lazy_load())
+
+        self.assertEqual({doc.metadata["team"] for doc in documents}, {"team-a"})
+        self.assertNotIn("# Release notes", [doc.page_content for doc in documents])
+        root_only = DocumentLoader(self.root, workers=1, recursive=False)
+        self.assertEqual(list(root_only.iter_files()), [os.path.join(self.root, "notes.md")])
+
+    def test_large_files_are_memory_mapped_in_line_aligned_blocks(self):
+        loader = DocumentLoader(self.root, workers=1, mmap_threshold=10, block_size=64)
+
+        blocks = loader.load_file(os.path.join(self.root, "team-a", "server.log"))
+
+        self.assertGreater(len(blocks), 1)
+        self.assertTrue(all(block.page_content.endswith("\n") for block in blocks))
+        self.assertEqual("".join(block.page_content for block in blocks),
+                         "".join(f"line {i}\n" for i in range(100)))
+
+    def test_lazy_load_streams_large_files_outside_the_pool(self):
+        loader = DocumentLoader(self.root, workers=2, mmap_threshold=200, block_size=64)
+
+        with patch.object(loader, "load_file", wraps=loader.load_file) as load_file:
+            documents = list(loader.lazy_load())
+
+        pooled = [call.args[0] for call in load_file.call_args_list]
+        self.assertNotIn(os.path.join(self.root, "team-a", "server.log"), pooled)
+        self.assertIn(os.path.join(self.root, "notes.md"), pooled)
+        blocks = [doc for doc in documents if doc.metadata["source"].endswith("server.log")]
+        self.assertGreater(len(blocks), 1)
+        # Files still come out in walk order
+        self.assertEqual(list(dict.fromkeys(doc.metadata["source"] for doc in documents)), list(loader.iter_files()))
+
+    def test_parallel_map_preserves_order(self):
+        self.assertEqual(list(parallel_map(lambda x: x * 2, range(20), workers=4)), list(range(0, 40, 2)))
+
+if __name__ == "__main__":
+    unittest.main()
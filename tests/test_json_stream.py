@@ -0,0 +1,38 @@
+import unittest
+from app.utils.json_stream import JSONObjectParser, ParseCounter, extract_json
+
+class TestJSONObjectParser(unittest.TestCase):
+
+    def test_object_is_returned_once_it_closes(self):
+        parser = JSONObjectParser()
+
+        self.assertIsNone(parser.feed('Here is the JSON: {"tool": "qa", '))
+        self.assertIsNone(parser.feed('"reasoning": "a } inside {a string"'))
+        result = parser.feed('} and some trailing prose')
+
+        self.assertEqual(result, {"tool": "qa", "reasoning": "a } inside {a string"})
+        self.assertEqual(parser.text, '{"tool": "qa", "reasoning": "a } inside {a string"}')
+
+    def test_nested_objects_and_escaped_quotes(self):
+        text = '{"summary": {"severity": "High"}, "reasoning": "said \\"hi\\""}'
+
+        self.assertEqual(extract_json(text), {"summary": {"severity": "High"}, "reasoning": 'said "hi"'})
+
+    def test_skips_invalid_braces_before_the_object(self):
+        self.assertEqual(extract_json('Use {placeholders} like {"tool": "summary"}'), {"tool": "summary"})
+
+    def test_incomplete_or_missing_object(self):
+        self.assertIsNone(extract_json('{"tool": "qa"'))
+        self.assertIsNone(extract_json("This is not JSON"))
+
+class TestParseCounter(unittest.TestCase):
+
+    def test_failure_rate(self):
+        counter = ParseCounter()
+        for ok in (True, True, True, False):
+            counter.record(ok)
+
+        self.assertEqual(counter.stats(), {"parsed": 3, "failed": 1, "failure_rate": 0.25})
+
+if __name__ == "__main__":
+    unittest.main()
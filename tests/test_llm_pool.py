@@ -0,0 +1,208 @@
+import json
+import asyncio
+import threading
+import unittest
+import httpx
+from app.utils.llm import LLMQueueFullError, LLMUnavailableError, OllamaPool, PooledOllama
+
+def ollama_reply(text):
+    return httpx.Response(200, json={"response": text, "done": True})
+
+class TestOllamaPool(unittest.TestCase):
+
+    def make_pool(self, handler, **kwargs):
+        options = {"base_urls": ["http://a:11434", "http://b:11434"], "max_retries": 2, "backoff": 0}
+        options.update(kwargs)
+        return OllamaPool(transport=httpx.MockTransport(handler), **options)
+
+    def test_llm_sends_model_and_options_through_pool(self):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return ollama_reply("pong")
+        llm = PooledOllama(model="mistral:7b", pool=self.make_pool(handler))
+
+        self.assertEqual(llm.invoke("ping"), "pong")
+        self.assertEqual(asyncio.run(llm.ainvoke("ping")), "pong")
+        self.assertEqual(requests[0]["model"], "mistral:7b")
+        self.assertEqual(requests[0]["options"]["temperature"], 0)
+        self.assertFalse(requests[0]["stream"])
+
+    def test_failed_call_is_retried_on_another_backend(self):
+        hosts = []
+
+        def handler(request):
+            hosts.append(request.url.host)
+            if len(hosts) == 1:
+                return httpx.Response(503)
+            return ollama_reply("ok")
+        pool = self.make_pool(handler)
+
+        self.assertEqual(pool.generate({"model": "m", "prompt": "p"}), "ok")
+        self.assertNotEqual(hosts[0], hosts[1])
+        self.assertEqual(pool.stats()["retries"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        def handler(request):
+            raise httpx.ConnectError("connection refused")
+        pool = self.make_pool(handler, max_retries=1)
+
+        with self.assertRaises(LLMUnavailableError):
+            asyncio.run(pool.agenerate({"model": "m", "prompt": "p"}))
+        self.assertEqual(pool.stats()["failed"], 1)
+
+    def test_stream_yields_chunks(self):
+        def handler(request):
+            lines = [{"response": "Hel"}, {"response": "lo"}, {"response": "", "done": True}]
+            return httpx.Response(200, content="\n".join(json.dumps(line) for line in lines))
+        llm = PooledOllama(pool=self.make_pool(handler))
+
+        async def collect():
+            return [chunk async for chunk in llm.astream("hi")]
+
+        self.assertEqual(asyncio.run(collect()), ["Hel", "lo"])
+        self.assertEqual(list(llm.stream("hi")), ["Hel", "lo"])
+
+    def test_malformed_stream_line_is_reported_as_unavailable(self):
+        def handler(request):
+            return httpx.Response(200, content='{"response": "Hel"}\n{"respon')
+        pool = self.make_pool(handler)
+
+        with self.assertRaisesRegex(LLMUnavailableError, "malformed"):
+            list(pool.stream({"model": "m", "prompt": "p"}))
+        self.assertEqual(pool.stats()["in_flight"], 0)
+
+    def test_client_from_a_previous_loop_is_closed(self):
+        pool = self.make_pool(lambda request: ollama_reply("ok"))
+        payload = {"model": "m", "prompt": "p"}
+
+        async def call_and_return_client():
+            await pool.agenerate(payload)
+            return pool._async_client
+
+        first = asyncio.run(call_and_return_client())
+
+        async def call_on_new_loop():
+            second = await call_and_return_client()
+            await asyncio.sleep(0)
+            return second
+
+        second = asyncio.run(call_on_new_loop())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed)
+        self.assertFalse(second.is_closed)
+
+    def test_json_mode_stops_once_object_closes(self):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            lines = [{"response": 'Sure: {"tool": '}, {"response": '"qa"}'}, {"response": "\n\n"},
+                     {"response": "trailing", "done": True, "eval_count": 40}]
+            return httpx.Response(200, content="\n".join(json.dumps(line) for line in lines))
+        pool = self.make_pool(handler)
+        llm = PooledOllama(format="json", num_predict=64, pool=pool)
+
+        self.assertEqual(llm.invoke("route this"), '{"tool": "qa"}')
+        self.assertEqual(requests[0]["format"], "json")
+        self.assertEqual(requests[0]["options"]["num_predict"], 64)
+        stats = pool.stats()
+        self.assertEqual(stats["stopped_early"], 1)
+        self.assertEqual(stats["tokens_generated"], 2)
+
+    def test_tokens_generated_are_counted_per_call(self):
+        pool = self.make_pool(lambda request: httpx.Response(
+            200, json={"response": "ok", "done": True, "eval_count": 12, "done_reason": "length"}
+        ))
+
+        pool.generate({"model": "m", "prompt": "p"})
+        pool.generate({"model": "m", "prompt": "p"})
+
+        stats = pool.stats()
+        self.assertEqual(stats["generations"], 2)
+        self.assertEqual(stats["tokens_per_generation"], 12.0)
+        self.assertEqual(stats["truncated"], 2)
+
+    def test_full_queue_rejects_immediately(self):
+        async def scenario():
+            release = asyncio.Event()
+
+            async def handler(request):
+                await release.wait()
+                return ollama_reply("done")
+            pool = self.make_pool(handler, max_concurrency=1, max_queue=1)
+            payload = {"model": "m", "prompt": "p"}
+
+            running = asyncio.create_task(pool.agenerate(payload))
+            queued = asyncio.create_task(pool.agenerate(payload))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(LLMQueueFullError):
+                await pool.agenerate(payload)
+            self.assertEqual(pool.stats()["in_flight"], 1)
+            self.assertEqual(pool.stats()["waiting"], 1)
+
+            release.set()
+            return await asyncio.gather(running, queued), pool.stats()
+
+        results, stats = asyncio.run(scenario())
+        self.assertEqual(results, ["done", "done"])
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_sync_and_async_calls_share_one_concurrency_cap(self):
+        release, entered = threading.Event(), threading.Event()
+        active, peak = [0], [0]
+
+        def handler(request):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            entered.set()
+            release.wait(5)
+            active[0] -= 1
+            return ollama_reply("done")
+        pool = self.make_pool(handler, max_concurrency=1, queue_timeout=5)
+        payload = {"model": "m", "prompt": "p"}
+        results = []
+        sync_call = threading.Thread(target=lambda: results.append(pool.generate(payload)))
+        sync_call.start()
+        entered.wait(5)
+
+        async def scenario():
+            waiting = asyncio.create_task(pool.agenerate(payload))
+            await asyncio.sleep(0.05)
+            stats = pool.stats()
+            release.set()
+            return await waiting, stats
+
+        result, stats = asyncio.run(scenario())
+        sync_call.join(5)
+
+        self.assertEqual((stats["in_flight"], stats["waiting"]), (1, 1))
+        self.assertEqual(results + [result], ["done", "done"])
+        self.assertEqual(peak[0], 1)
+        self.assertEqual(pool.stats()["in_flight"], 0)
+
+    def test_waiting_call_times_out_and_frees_its_place(self):
+        release = threading.Event()
+
+        def handler(request):
+            release.wait(5)
+            return ollama_reply("done")
+        pool = self.make_pool(handler, max_concurrency=1, queue_timeout=0.05)
+        payload = {"model": "m", "prompt": "p"}
+        running = threading.Thread(target=pool.generate, args=(payload,))
+        running.start()
+        while pool.stats()["in_flight"] == 0:
+            threading.Event().wait(0.01)
+
+        with self.assertRaisesRegex(LLMUnavailableError, "Timed out"):
+            asyncio.run(pool.agenerate(payload))
+        release.set()
+        running.join(5)
+
+        self.assertEqual((pool.stats()["in_flight"], pool.stats()["waiting"]), (0, 0))
+        self.assertEqual(pool.generate(payload), "done")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from app.utils.metrics import STAGE_SECONDS, StatsCollector, _request_timings, collect_timings, span
+
+class TestSpans(unittest.TestCase):
+
+    def test_spans_feed_histogram_and_request_timings(self):
+        before = STAGE_SECONDS.labels(tool="test", stage="work")._sum.get()
+
+        async def handle_request():
+            timings = collect_timings()
+            with span("work", "test"):
+                await asyncio.sleep(0.01)
+
+            # Spans in worker threads land in the same request's timings
+            def in_thread():
+                with span("thread_work", "test"):
+                    pass
+            await asyncio.to_thread(in_thread)
+            return timings
+
+        timings = asyncio.run(handle_request())
+
+        self.assertGreaterEqual(timings["test.work"], 10)
+        self.assertIn("test.thread_work", timings)
+        self.assertGreater(STAGE_SECONDS.labels(tool="test", stage="work")._sum.get(), before)
+
+    def test_timings_are_not_collected_by_default(self):
+        async def handle_request():
+            with span("untimed_work", "test"):
+                pass
+            return _request_timings.get()
+
+        async def handle_requests():
+            # A concurrent request that does collect timings must not see this one's spans
+            async def timed_request():
+                timings = collect_timings()
+                await asyncio.sleep(0.01)
+                return timings
+            return await asyncio.gather(handle_request(), timed_request())
+
+        untimed, timed = asyncio.run(handle_requests())
+
+        self.assertIsNone(untimed)
+        self.assertNotIn("test.untimed_work", timed)
+
+class TestStatsCollector(unittest.TestCase):
+
+    def test_numeric_stats_become_gauges(self):
+        collector = StatsCollector({
+            "cache": lambda: {"entries": 3, "hit-rate": 0.5, "name": "lru"},
+            "llm": lambda: {"backends": [{"in_flight": 2}], "enabled": True},
+            "broken": lambda: 1 / 0,
+        })
+
+        values = {metric.name: metric.samples[0].value for metric in collector.collect()}
+
+        self.assertEqual(values, {
+            "assistant_cache_entries": 3.0,
+            "assistant_cache_hit_rate": 0.5,
+            "assistant_llm_backends_0_in_flight": 2.0,
+            "assistant_llm_enabled": 1.0,
+        })
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
+import asyncio
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from langchain_core.documents import Document
+from app.data.filters import MetadataFilter
 from app.tools.qa_tool import QATool, QAToolInput, QAToolOutput
 
 class MockRetriever:
@@ -10,31 +13,27 @@ class MockRetriever:
         return []
 
 class TestQATool(unittest.TestCase):
-    @patch("app.tools.qa_tool.Ollama")
-    @patch("app.tools.qa_tool.RetrievalQA")
-    def setUp(self, mock_retrievalqa_class, mock_ollama_class):
+    @patch("app.tools.qa_tool.get_llm")
+    def setUp(self, mock_ollama_class):
         # Mock the vectorstore and its retriever
         self.mock_vectorstore = MagicMock()
         self.mock_retriever = MagicMock()
         self.mock_vectorstore.as_retriever.return_value = self.mock_retriever
 
-        # Mock Ollama LLM and RetrievalQA
-        self.mock_qa_chain = MagicMock()
-        mock_retrievalqa_class.from_chain_type.return_value = self.mock_qa_chain
-        mock_ollama_class.return_value = MagicMock()
+        # Mock Ollama LLM
+        self.mock_llm = MagicMock()
+        mock_ollama_class.return_value = self.mock_llm
 
         # Initialize the tool
         self.qa_tool = QATool(self.mock_vectorstore)
 
     def test_run_returns_expected_output(self):
-        # Prepare mock return from qa_chain
-        self.mock_qa_chain.return_value = {
-            "result": "This is a test answer.",
-            "source_documents": [
-                MagicMock(page_content="This is the content of the doc.", metadata={"source": "Doc1"}),
-                MagicMock(page_content="Another doc content.", metadata={"source": "Doc2"})
-            ]
-        }
+        # Prepare mock retrieval and LLM responses
+        self.mock_retriever.invoke.return_value = [
+            Document(page_content="This is the content of the doc.", metadata={"source": "Doc1"}),
+            Document(page_content="Another doc content.", metadata={"source": "Doc2"})
+        ]
+        self.mock_llm.invoke.return_value = "This is a test answer."
 
         input_data = QAToolInput(query="What is the system design?")
         output = self.qa_tool.run(input_data)
@@ -47,6 +46,126 @@ class TestQATool(unittest.TestCase):
         self.assertIn("source", output.source_documents[0])
         self.assertEqual(output.source_documents[0]["source"], "Doc1")
         self.assertTrue(output.source_documents[0]["content"].startswith("This is the content"))
+        self.assertGreater(output.prompt_tokens, output.context_tokens)
+
+    def test_arun_retrieves_then_awaits_llm(self):
+        docs = [Document(page_content="Email notifications are delayed.", metadata={"source": "Doc1"})]
+        self.mock_retriever.invoke.return_value = docs
+        self.qa_tool.llm = MagicMock()
+        self.qa_tool.llm.ainvoke = AsyncMock(return_value="Async answer.")
+
+        input_data = QAToolInput(query="Which notifications are delayed?")
+        output = asyncio.run(self.qa_tool.arun(input_data))
+
+        self.assertEqual(output.answer, "Async answer.")
+        self.assertEqual(output.source_documents[0]["source"], "Doc1")
+        self.mock_retriever.invoke.assert_called_once_with("Which notifications are delayed?")
+        prompt = self.qa_tool.llm.ainvoke.call_args[0][0]
+        self.assertIn("Which notifications are delayed?", prompt)
+        self.assertIn("Email notifications are delayed.", prompt)
+
+    def test_astream_yields_llm_tokens(self):
+        docs = [Document(page_content="Search is slow.", metadata={"source": "Doc1"})]
+
+        async def fake_astream(prompt):
+            for token in ["Search ", "is ", "slow."]:
+                yield token
+
+        self.qa_tool.llm = MagicMock()
+        self.qa_tool.llm.astream = fake_astream
+        prepared = self.qa_tool.prepare("Is search slow?", docs)
+
+        async def collect():
+            return [token async for token in self.qa_tool.astream(prepared)]
+
+        self.assertEqual(asyncio.run(collect()), ["Search ", "is ", "slow."])
+        self.assertIn("Search is slow.", prepared.prompt)
+
+    @patch("app.tools.qa_tool.similarity_search")
+    def test_search_params_bypass_default_retriever(self, mock_similarity_search):
+        docs = [Document(page_content="Search is slow.", metadata={"source": "Doc1"})]
+        mock_similarity_search.return_value = docs
+
+        result = self.qa_tool.retrieve(QAToolInput(query="Is search slow?", nprobe=8))
+
+        self.assertEqual(result, docs)
+        mock_similarity_search.assert_called_once_with(
+            self.mock_vectorstore, "Is search slow?", k=3, nprobe=8, ef_search=None, metadata_filter=None
+        )
+        self.mock_retriever.invoke.assert_not_called()
+
+    def test_swap_replaces_index_without_disturbing_in_flight_retrieval(self):
+        new_vectorstore = MagicMock()
+        new_retriever = MagicMock()
+        new_vectorstore.as_retriever.return_value = new_retriever
+        new_retriever.invoke.return_value = ["new"]
+
+        def swap_mid_query(query):
+            # A reload finishes while this query is retrieving
+            self.assertEqual(self.qa_tool.swap(new_vectorstore), 2)
+            return ["old"]
+
+        self.mock_retriever.invoke.side_effect = swap_mid_query
+
+        self.assertEqual(self.qa_tool.retrieve(QAToolInput(query="What broke?")), ["old"])
+        self.assertEqual(self.qa_tool.retrieve(QAToolInput(query="What broke?")), ["new"])
+        self.assertEqual(self.qa_tool.version, 2)
+        self.assertIs(self.qa_tool.vectorstore, new_vectorstore)
+
+class TestShardedQATool(unittest.TestCase):
+    @patch("app.tools.qa_tool.get_llm")
+    def setUp(self, mock_get_llm):
+        self.stores = {}
+        for team in ("payments", "search"):
+            store = MagicMock()
+            store.as_retriever.return_value.invoke.return_value = [
+                Document(page_content=f"{team} doc {i}", metadata={"team": team}, id=f"{team}-{i}")
+                for i in range(3)
+            ]
+            self.stores[team] = store
+        self.qa_tool = QATool(self.stores, shard_key="team")
+
+    def retriever(self, team):
+        return self.stores[team].as_retriever.return_value
+
+    def test_team_filter_searches_only_its_shard(self):
+        docs = self.qa_tool.retrieve(QAToolInput(query="Why do refunds fail?", filters=MetadataFilter(team="payments")))
+
+        self.assertEqual([doc.id for doc in docs], ["payments-0", "payments-1", "payments-2"])
+        self.retriever("search").invoke.assert_not_called()
+
+    def test_unknown_team_returns_nothing(self):
+        docs = self.qa_tool.retrieve(QAToolInput(query="Anything?", filters=MetadataFilter(team="mobile")))
+
+        self.assertEqual(docs, [])
+
+    @patch("app.tools.qa_tool.similarity_search")
+    def test_other_filters_are_applied_within_each_shard(self, mock_similarity_search):
+        mock_similarity_search.return_value = []
+        metadata_filter = MetadataFilter(team="search", component="indexer")
+
+        self.qa_tool.retrieve(QAToolInput(query="Is search slow?", filters=metadata_filter))
+
+        mock_similarity_search.assert_called_once_with(
+            self.stores["search"], "Is search slow?", k=3, nprobe=None, ef_search=None,
+            metadata_filter=MetadataFilter(component="indexer")
+        )
+
+    @patch("app.tools.qa_tool.similarity_search_by_vectors")
+    def test_unscoped_query_merges_every_shard_by_score(self, mock_search):
+        scores = {"payments": [0.9, 0.4, 0.1], "search": [0.8, 0.7, 0.2]}
+        hits = {}
+        for team, store in self.stores.items():
+            store.embedding_function.embed_query.return_value = [0.1, 0.2]
+            hits[id(store)] = list(zip(self.retriever(team).invoke.return_value, scores[team]))
+        mock_search.side_effect = lambda store, vectors, **kwargs: [hits[id(store)]]
+
+        docs = self.qa_tool.retrieve(QAToolInput(query="What is broken?"))
+
+        self.assertEqual([doc.id for doc in docs], ["payments-0", "search-0", "search-1"])
+        self.assertTrue(all(call.kwargs["with_scores"] for call in mock_search.call_args_list))
+        self.assertIsNone(self.qa_tool.vectorstore)
+        self.assertEqual(len(self.qa_tool.index.shards), 2)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import threading
+import unittest
+from app.data.ingestion import IngestionReport
+from app.data.reload import IndexWatcher, ReloadManager, interprocess_lock
+
+class BlockingIngestion:
+    """Reloads that wait for the test to release them, one event per call."""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.releases = [threading.Event() for _ in range(5)]
+        self.fail = False
+
+    def reload_vectorstore(self, progress=None):
+        call = self.calls
+        self.calls += 1
+        progress.stage, progress.files_total = "embedding", 3
+        self.started.set()
+        self.releases[call].wait(5)
+        if self.fail:
+            raise RuntimeError("disk full")
+        return f"store-{call}", IngestionReport(added=["a.txt"], chunks_added=2)
+
+class TestReloadManager(unittest.TestCase):
+
+    def setUp(self):
+        self.ingestion = BlockingIngestion()
+        self.swapped = []
+        self.manager = ReloadManager(self.ingestion, self.on_reload)
+        self.addCleanup(lambda: [event.set() for event in self.ingestion.releases])
+
+    def on_reload(self, vectorstore, report):
+        self.swapped.append(vectorstore)
+        return len(self.swapped) + 1
+
+    def test_job_reports_progress_then_result(self):
+        job = self.manager.request()
+        self.ingestion.started.wait(5)
+
+        running = self.manager.get(job.job_id)
+        self.assertEqual(running.status, "running")
+        self.assertEqual(running.progress["stage"], "embedding")
+        self.assertEqual(running.progress["files_total"], 3)
+
+        self.ingestion.releases[0].set()
+        done = self.manager.wait(job.job_id, timeout=5)
+
+        self.assertEqual(done.status, "succeeded")
+        self.assertEqual(done.version, 2)
+        self.assertEqual(done.report.chunks_added, 2)
+        self.assertEqual(done.progress["stage"], "done")
+        self.assertEqual(self.swapped, ["store-0"])
+
+    def test_requests_during_a_reload_coalesce_into_one_follow_up(self):
+        first = self.manager.request()
+        self.ingestion.started.wait(5)
+        second = self.manager.request()
+        third = self.manager.request()
+
+        self.assertNotEqual(first.job_id, second.job_id)
+        self.assertEqual(second.job_id, third.job_id)
+        self.assertEqual(third.requests, 2)
+        self.assertEqual(self.manager.get(second.job_id).status, "queued")
+
+        self.ingestion.releases[0].set()
+        self.ingestion.releases[1].set()
+        self.assertEqual(self.manager.wait(second.job_id, timeout=5).status, "succeeded")
+        self.assertEqual(self.ingestion.calls, 2)
+        self.assertEqual(self.swapped, ["store-0", "store-1"])
+
+    def test_failed_reload_keeps_current_index(self):
+        self.ingestion.fail = True
+        self.ingestion.releases[0].set()
+
+        job = self.manager.wait(self.manager.request().job_id, timeout=5)
+
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "RuntimeError: disk full")
+        self.assertEqual(self.swapped, [])
+        self.assertEqual(self.manager.stats()["failed"], 1)
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.manager.get("missing"))
+
+class TestInterprocessLock(unittest.TestCase):
+
+    def test_loads_wait_for_a_save_in_progress(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, ".reload.lock")
+            events = []
+
+            def load():
+                with interprocess_lock(path, shared=True):
+                    events.append("load")
+
+            with interprocess_lock(path):
+                reader = threading.Thread(target=load)
+                reader.start()
+                reader.join(0.2)
+                events.append("saved")
+            reader.join(5)
+
+            self.assertEqual(events, ["saved", "load"])
+
+    def test_loads_do_not_wait_for_each_other(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, ".reload.lock")
+            with interprocess_lock(path, shared=True):
+                loaded = threading.Event()
+
+                def load():
+                    with interprocess_lock(path, shared=True):
+                        loaded.set()
+
+                threading.Thread(target=load).start()
+                self.assertTrue(loaded.wait(5))
+
+class SavedIndex:
+    """Stands in for the index another worker saves to disk."""
+
+    def __init__(self):
+        self.version = 1
+
+    def signature(self):
+        return ("manifest", self.version)
+
+class TestIndexWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.ingestion = SavedIndex()
+        self.loads = []
+        self.accept = True
+        self.watcher = IndexWatcher(self.ingestion, self.on_change, interval=0)
+
+    def on_change(self):
+        self.loads.append(self.ingestion.version)
+        return self.accept
+
+    def test_loads_index_saved_by_another_worker_once(self):
+        self.assertFalse(self.watcher.check())
+        self.ingestion.version = 2
+
+        self.assertTrue(self.watcher.check())
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(self.loads, [2])
+        self.assertEqual(self.watcher.stats()["reloads"], 1)
+
+    def test_declined_change_is_retried(self):
+        self.ingestion.version, self.accept = 2, False
+        self.assertFalse(self.watcher.check())
+
+        self.accept = True
+        self.assertTrue(self.watcher.check())
+        self.assertEqual(self.loads, [2, 2])
+
+    def test_own_reload_is_not_loaded_again(self):
+        self.ingestion.version = 2
+        self.watcher.sync()
+
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(self.loads, [])
+
+    def test_polls_in_background(self):
+        watcher = IndexWatcher(self.ingestion, self.on_change, interval=0.01)
+        self.ingestion.version = 2
+        watcher.start()
+        watcher.start()
+        for _ in range(500):
+            if self.loads:
+                break
+            threading.Event().wait(0.01)
+        watcher.stop()
+
+        self.assertEqual(self.loads, [2])
+        self.assertFalse(watcher.stats()["running"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from app.utils.cache import ResponseCache, normalize_query
+from app.utils.cache_backends import SQLiteBackend
+
+class FakeEmbeddings:
+    """Maps known queries to fixed vectors."""
+    VECTORS = {
+        "what are the login issues?": [1.0, 0.0, 0.0],
+        "which login issues were reported?": [0.98, 0.2, 0.0],
+        "how do i export a report?": [0.0, 0.0, 1.0],
+    }
+
+    def embed_query(self, text):
+        return self.VECTORS.get(text.lower(), [0.0, 1.0, 0.0])
+
+PAYLOAD = {"result": {"answer": "Login fails on Safari."}, "tool_used": "qa", "reasoning": "test"}
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(
+            embeddings=FakeEmbeddings(),
+            similarity_threshold=0.95,
+            max_entries=10,
+            max_bytes=1024 * 1024,
+            ttl_seconds=60,
+            path=""
+        )
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  What are   the LOGIN issues?? "), "what are the login issues")
+
+    def test_exact_hit_after_normalization(self):
+        self.cache.store("What are the login issues?", PAYLOAD)
+
+        hit, _ = self.cache.lookup("what are the   login issues")
+
+        self.assertEqual(hit[0], PAYLOAD)
+        self.assertEqual(hit[1]["match"], "exact")
+
+    def test_semantic_hit_above_threshold(self):
+        self.cache.store("What are the login issues?", PAYLOAD)
+
+        hit, vector = self.cache.lookup("Which login issues were reported?")
+
+        self.assertIsNotNone(vector)
+        self.assertEqual(hit[1]["match"], "semantic")
+        self.assertGreaterEqual(hit[1]["similarity"], 0.95)
+
+    def test_miss_below_threshold(self):
+        self.cache.store("What are the login issues?", PAYLOAD)
+
+        hit, _ = self.cache.lookup("How do I export a report?")
+
+        self.assertIsNone(hit)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_ttl_expiry(self):
+        with patch("app.utils.cache.time.time", return_value=1000.0):
+            self.cache.store("What are the login issues?", PAYLOAD)
+        with patch("app.utils.cache.time.time", return_value=1061.0):
+            hit, _ = self.cache.lookup("What are the login issues?")
+
+        self.assertIsNone(hit)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_lru_eviction_by_entry_count(self):
+        self.cache.max_entries = 2
+        self.cache.store("first", PAYLOAD)
+        self.cache.store("second", PAYLOAD)
+        self.cache.lookup("first")  # "second" becomes least recently used
+        self.cache.store("third", PAYLOAD)
+
+        self.assertEqual(self.cache.lookup("first")[0][1]["match"], "exact")
+        self.assertNotIn("second", self.cache._entries)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_invalidate_clears_entries(self):
+        self.cache.store("What are the login issues?", PAYLOAD)
+        self.cache.invalidate()
+
+        hit, _ = self.cache.lookup("What are the login issues?")
+
+        self.assertIsNone(hit)
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+    def test_answer_from_before_an_index_swap_is_not_stored(self):
+        version = self.cache.version
+        self.cache.invalidate(version="v2")
+
+        self.cache.store("What are the login issues?", PAYLOAD, version=version)
+        hit, _ = self.cache.lookup("What are the login issues?")
+
+        self.assertIsNone(hit)
+        self.assertEqual(self.cache.stats()["stale_stores"], 1)
+
+    def test_disk_store_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.sqlite")
+            cache = ResponseCache(embeddings=FakeEmbeddings(), ttl_seconds=60, path=path)
+            cache.store("What are the login issues?", PAYLOAD)
+
+            restarted = ResponseCache(embeddings=FakeEmbeddings(), ttl_seconds=60, path=path)
+            hit, _ = restarted.lookup("Which login issues were reported?")
+
+            self.assertEqual(hit[0], PAYLOAD)
+            cache.backend.close()
+            restarted.backend.close()
+
+class TestSharedResponseCache(unittest.TestCase):
+    """Two caches on one SQLite backend, standing in for two worker processes."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = SQLiteBackend(os.path.join(self.tmp_dir.name, "cache.sqlite"))
+        self.first, self.second = (
+            ResponseCache(embeddings=FakeEmbeddings(), ttl_seconds=60, backend=self.backend, sync_interval=0)
+            for _ in range(2)
+        )
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp_dir.cleanup()
+
+    def test_entry_stored_by_one_worker_hits_in_another(self):
+        self.first.store("What are the login issues?", PAYLOAD)
+
+        hit, _ = self.second.lookup("Which login issues were reported?")
+
+        self.assertEqual(hit[0], PAYLOAD)
+        self.assertTrue(self.second.stats()["shared"])
+
+    def test_invalidate_reaches_every_worker(self):
+        self.first.store("What are the login issues?", PAYLOAD)
+        self.second.lookup("What are the login issues?")
+
+        self.first.invalidate()
+        hit, _ = self.second.lookup("What are the login issues?")
+
+        self.assertIsNone(hit)
+
+    def test_entries_from_another_index_version_are_not_served(self):
+        self.first.version = self.second.version = "v1"
+        self.second.invalidate(version="v2")
+        # The first worker has not picked up the new index yet
+        self.first.store("What are the login issues?", PAYLOAD, version="v1")
+
+        hit, _ = self.second.lookup("What are the login issues?")
+        self.assertIsNone(hit)
+
+        self.first.invalidate(shared=False, version="v2")
+        hit, _ = self.first.lookup("Which login issues were reported?")
+        self.assertIsNone(hit)
+
+    def test_change_feed_returns_only_new_entries(self):
+        self.backend.put("ns", "a", b"1")
+        cursor, cleared, rows = self.backend.changes("ns")
+        self.backend.put("ns", "b", b"2")
+
+        cursor, cleared, rows = self.backend.changes("ns", cursor)
+        self.assertFalse(cleared)
+        self.assertEqual([row[:2] for row in rows], [("b", b"2")])
+
+        self.backend.clear("ns")
+        self.backend.put("ns", "c", b"3")
+        _, cleared, rows = self.backend.changes("ns", cursor)
+        self.assertTrue(cleared)
+        self.assertEqual([row[:2] for row in rows], [("c", b"3")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from unittest.mock import MagicMock
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from app.data.filters import MetadataFilter
+from app.data.index import IndexSpec, create_vectorstore, similarity_search
+from app.data.retrieval import HybridRetriever, reciprocal_rank_fusion
+from app.data.retrieval_report import evaluate_modes
+from app.data.store import load_vectorstore, save_vectorstore
+
+CHUNKS = [
+    "Bug #12: Export to CSV fails with ERR-1042 for large reports.",
+    "Bug #13: The dashboard is slow to load on mobile devices.",
+    "Feedback: users want dark mode in the settings page.",
+    "Bug #14: auth_service drops sessions after a deploy.",
+]
+
+class TestReciprocalRankFusion(unittest.TestCase):
+
+    def test_ids_ranked_high_in_both_lists_win(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "a"]])
+
+        self.assertEqual(fused[:2], ["b", "a"])
+        self.assertEqual(set(fused), {"a", "b", "c", "d"})
+
+class TestHybridRetriever(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        embeddings = DeterministicFakeEmbedding(size=8)
+        vectors = np.asarray(embeddings.embed_documents(CHUNKS), dtype=np.float32)
+        vectorstore = create_vectorstore(IndexSpec("Flat").create(vectors), embeddings)
+        vectorstore.add_texts(CHUNKS, metadatas=[{"source": f"doc{i}"} for i in range(4)],
+                              ids=[f"chunk-{i}" for i in range(4)])
+        save_vectorstore(vectorstore, self.tmp_dir.name)
+        self.vectorstore = load_vectorstore(self.tmp_dir.name, embeddings)
+        self.retriever = HybridRetriever(self.vectorstore, k=2, fetch_k=4)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_supports_saved_vectorstore(self):
+        self.assertTrue(HybridRetriever.supports(self.vectorstore))
+        self.assertFalse(HybridRetriever.supports(MagicMock()))
+
+    def test_keyword_mode_matches_error_codes_and_identifiers(self):
+        self.assertEqual(self.retriever.retrieve("What is ERR-1042?", mode="bm25")[0].id, "chunk-0")
+        self.assertEqual(self.retriever.retrieve("auth_service problems", mode="bm25")[0].id, "chunk-3")
+
+    def test_hybrid_mode_includes_exact_keyword_match(self):
+        documents = self.retriever.retrieve("ERR-1042", mode="hybrid")
+
+        self.assertEqual(len(documents), 2)
+        self.assertIn("chunk-0", [doc.id for doc in documents])
+
+    def test_rerank_mode_uses_reranker(self):
+        reranker = MagicMock()
+        reranker.rerank.side_effect = lambda query, documents, k: documents[::-1][:k]
+        self.retriever.reranker = reranker
+
+        documents = self.retriever.retrieve("ERR-1042", mode="rerank")
+
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(len(reranker.rerank.call_args[0][1]), 4)
+
+    def test_batch_retrieval_matches_single_queries(self):
+        queries = ["ERR-1042", "dark mode settings", "auth_service sessions"]
+        embeddings = self.vectorstore.embedding_function
+        vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+
+        for mode in ("vector", "bm25", "hybrid"):
+            batched = self.retriever.retrieve_batch(queries, vectors, mode=mode)
+            single = [self.retriever.retrieve(query, mode=mode) for query in queries]
+            self.assertEqual([[doc.id for doc in docs] for docs in batched],
+                             [[doc.id for doc in docs] for docs in single])
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.retriever.retrieve("ERR-1042", mode="fuzzy")
+
+    def test_report_covers_each_mode(self):
+        report = evaluate_modes(self.retriever, [{"query": "ERR-1042", "expected": ["ERR-1042"]}],
+                                modes=["vector", "bm25", "hybrid"])
+
+        self.assertEqual([row["mode"] for row in report], ["vector", "bm25", "hybrid"])
+        self.assertEqual(report[1]["hit_rate_at_k"], 1.0)
+        self.assertEqual(report[1]["mrr"], 1.0)
+
+class TestMetadataFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        metadatas = [
+            {"source": "payments/export.txt", "team": "payments", "component": "export", "date": "2024-01-10"},
+            {"source": "web/dashboard.txt", "team": "web", "component": "dashboard", "date": "2024-02-10"},
+            {"source": "web/settings.txt", "team": "web", "component": "settings", "date": "2024-03-10"},
+            {"source": "platform/auth.txt", "team": "platform", "component": "Auth", "date": "2024-04-10"},
+        ]
+        vectors = np.asarray(self.embeddings.embed_documents(CHUNKS), dtype=np.float32)
+        self.in_memory = create_vectorstore(IndexSpec("Flat").create(vectors), self.embeddings)
+        self.in_memory.add_texts(CHUNKS, metadatas=metadatas, ids=[f"chunk-{i}" for i in range(4)])
+        save_vectorstore(self.in_memory, self.tmp_dir.name)
+        self.vectorstore = load_vectorstore(self.tmp_dir.name, self.embeddings)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_sql_and_python_matching_agree(self):
+        filters = [
+            MetadataFilter(team="web"),
+            MetadataFilter(component="auth"),
+            MetadataFilter(source="web/"),
+            MetadataFilter(date_from="2024-02-01", date_to="2024-03-31"),
+            MetadataFilter(team="web", date_to="2024-02-28"),
+        ]
+        for metadata_filter in filters:
+            sql = self.vectorstore.docstore.chunks.positions(metadata_filter).tolist()
+            python = [i for i in range(4) if metadata_filter.matches(self.in_memory.docstore.search(f"chunk-{i}").metadata)]
+            self.assertEqual(sql, python, metadata_filter)
+
+    def test_filter_is_applied_inside_the_search(self):
+        # Even a chunk outside the unfiltered top k comes back when it is the only match
+        query = CHUNKS[0]
+        unfiltered = [doc.id for doc in similarity_search(self.vectorstore, query, k=1)]
+        self.assertEqual(unfiltered, ["chunk-0"])
+
+        for vectorstore in (self.vectorstore, self.in_memory):
+            documents = similarity_search(vectorstore, query, k=3, metadata_filter=MetadataFilter(team="web"))
+            self.assertEqual(sorted(doc.id for doc in documents), ["chunk-1", "chunk-2"])
+
+    def test_no_match_returns_nothing(self):
+        documents = similarity_search(self.vectorstore, "dark mode", k=3, metadata_filter=MetadataFilter(team="mobile"))
+
+        self.assertEqual(documents, [])
+
+    def test_hybrid_retrieval_filters_keyword_hits(self):
+        retriever = HybridRetriever(self.vectorstore, k=2, fetch_k=4)
+
+        keyword = retriever.retrieve("ERR-1042 auth_service", mode="bm25", metadata_filter=MetadataFilter(team="platform"))
+        hybrid = retriever.retrieve("ERR-1042", mode="hybrid", metadata_filter=MetadataFilter(team="web"))
+
+        self.assertEqual([doc.id for doc in keyword], ["chunk-3"])
+        self.assertEqual({doc.metadata["team"] for doc in hybrid}, {"web"})
+
+if __name__ == "__main__":
+    unittest.main()
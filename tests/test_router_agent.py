@@ -1,10 +1,27 @@
+import asyncio
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from app.agents.router_agent import RouterAgent, RouterInput, RouterOutput, ToolType
+from app.utils.prompts import ROUTER_PROMPT, ROUTE_AND_SUMMARIZE_PROMPT
+
+class KeywordEmbeddings:
+    """Deterministic embeddings: one dimension per keyword group."""
+    GROUPS = [
+        ("what", "which", "how", "list", "?"),
+        ("crash", "fails", "bug", "doesn't", "stopped", "users say", "report", "summarize", "times out"),
+        ("hello", "hi", "thanks", "joke", "weather", "poem", "who are you", "morning"),
+    ]
+
+    def embed_query(self, text):
+        text = text.lower()
+        return [float(sum(word in text for word in group)) + 0.01 for group in self.GROUPS]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
 
 class TestRouterAgent(unittest.TestCase):
 
-    @patch("app.agents.router_agent.Ollama")
+    @patch("app.agents.router_agent.get_llm")
     @patch("app.agents.router_agent.LLMChain")
     def setUp(self, mock_llmchain_class, mock_ollama_class):
         # Mock LLMChain and Ollama
@@ -49,6 +66,17 @@ class TestRouterAgent(unittest.TestCase):
         self.assertEqual(output.tool, ToolType.SUMMARY)
         self.assertIn("user-submitted", output.reasoning)
 
+    def test_summary_route_keeps_the_original_report(self):
+        self.mock_chain.run.return_value = '{"tool": "summary", "reasoning": "Issue report", "reformulated_query": "Summarize: dashboard"}'
+
+        output = self.router_agent.route(RouterInput(query="The dashboard fails to load on Safari."))
+
+        self.assertEqual(output.reformulated_query, "Summarize: The dashboard fails to load on Safari.")
+
+    def test_summary_prompts_do_not_ask_for_the_report_back(self):
+        for prompt in (ROUTER_PROMPT, ROUTE_AND_SUMMARIZE_PROMPT):
+            self.assertNotIn('"reformulated_query": "Summarize:', prompt.template)
+
     def test_route_unknown_tool(self):
         mock_response = """
         {
@@ -92,5 +120,122 @@ class TestRouterAgent(unittest.TestCase):
         self.assertEqual(output.tool, ToolType.UNKNOWN)
         self.assertEqual(output.reformulated_query, "Check this query")
 
+    def test_route_tolerates_preamble_and_counts_parse_failures(self):
+        self.mock_chain.run.return_value = 'Sure! {"tool": "qa", "reasoning": "Docs question", "reformulated_query": "q"} Hope this helps.'
+        output = self.router_agent.route(RouterInput(query="What are the known login issues?"))
+        self.assertEqual(output.tool, ToolType.QA)
+
+        self.mock_chain.run.return_value = "I cannot decide."
+        self.router_agent.route(RouterInput(query="What are the known login issues?"))
+
+        self.assertEqual(self.router_agent.stats()["parsing"], {"parsed": 1, "failed": 1, "failure_rate": 0.5})
+
+    def test_aroute_uses_async_chain(self):
+        mock_response = """
+        {
+            "tool": "qa",
+            "reasoning": "The user is asking about documented issues.",
+            "reformulated_query": "List all reported issues related to email notifications."
+        }
+        """
+        self.mock_chain.arun = AsyncMock(return_value=mock_response)
+
+        input_data = RouterInput(query="What are the email notification issues?")
+        output = asyncio.run(self.router_agent.aroute(input_data))
+
+        self.assertEqual(output.tool, ToolType.QA)
+        self.mock_chain.arun.assert_awaited_once_with(query="What are the email notification issues?")
+        self.mock_chain.run.assert_not_called()
+
+class TestRouterFastPath(unittest.TestCase):
+
+    @patch("app.agents.router_agent.get_llm")
+    @patch("app.agents.router_agent.LLMChain")
+    def setUp(self, mock_llmchain_class, mock_ollama_class):
+        self.mock_chain = MagicMock()
+        mock_llmchain_class.return_value = self.mock_chain
+        mock_ollama_class.return_value = MagicMock()
+
+        self.router_agent = RouterAgent(embeddings=KeywordEmbeddings(), fast_path_threshold=0.2)
+
+    def test_confident_query_skips_llm(self):
+        output = self.router_agent.route(RouterInput(query="The app crashes and login fails"))
+
+        self.assertEqual(output.tool, ToolType.SUMMARY)
+        self.assertEqual(output.reformulated_query, "Summarize: The app crashes and login fails")
+        self.mock_chain.run.assert_not_called()
+        self.assertEqual(self.router_agent.path_counts["fast_path"], 1)
+        self.assertEqual(self.router_agent.path_counts["fast_path_summary"], 1)
+
+    def test_ambiguous_query_falls_back_to_llm(self):
+        self.mock_chain.run.return_value = '{"tool": "qa", "reasoning": "LLM decided", "reformulated_query": "q"}'
+
+        output = self.router_agent.route(RouterInput(query="Tell me about the release"))
+
+        self.assertEqual(output.tool, ToolType.QA)
+        self.assertEqual(output.reasoning, "LLM decided")
+        self.mock_chain.run.assert_called_once()
+        self.assertEqual(self.router_agent.stats()["paths"], {"fast_path_miss": 1, "llm": 1})
+
+    def test_aroute_fast_path(self):
+        self.mock_chain.arun = AsyncMock()
+
+        output = asyncio.run(self.router_agent.aroute(RouterInput(query="Hello, thanks!")))
+
+        self.assertEqual(output.tool, ToolType.UNKNOWN)
+        self.assertEqual(output.reformulated_query, "Hello, thanks!")
+        self.mock_chain.arun.assert_not_awaited()
+
+class TestRouterCombinedSummary(unittest.TestCase):
+
+    @patch("app.agents.router_agent.get_llm")
+    @patch("app.agents.router_agent.LLMChain")
+    def setUp(self, mock_llmchain_class, mock_ollama_class):
+        self.router_chain = MagicMock()
+        self.combined_chain = MagicMock()
+        mock_llmchain_class.side_effect = lambda llm, prompt: (
+            self.combined_chain if "summary:" in prompt.template else self.router_chain
+        )
+        mock_ollama_class.return_value = MagicMock()
+
+        self.router_agent = RouterAgent(combined_summary=True)
+
+    def test_summary_is_returned_from_one_generation(self):
+        self.combined_chain.arun = AsyncMock(return_value="""
+        {"tool": "summary", "reasoning": "Issue report", "reformulated_query": "Summarize: export is broken",
+         "summary": {"reported_issues": ["Export fails"], "affected_components": ["Export"], "severity": "High"}}
+        """)
+        self.router_chain.arun = AsyncMock()
+
+        output = asyncio.run(self.router_agent.aroute(RouterInput(query="Export is broken")))
+
+        self.assertEqual(output.tool, ToolType.SUMMARY)
+        self.assertEqual(output.summary.severity, "High")
+        self.router_chain.arun.assert_not_awaited()
+        self.assertEqual(self.router_agent.path_counts["combined"], 1)
+
+    def test_invalid_summary_keeps_route_without_summary(self):
+        self.combined_chain.run.return_value = """
+        {"tool": "summary", "reasoning": "Issue report", "reformulated_query": "Summarize: export is broken",
+         "summary": {"reported_issues": "Export fails"}}
+        """
+
+        output = self.router_agent.route(RouterInput(query="Export is broken"))
+
+        self.assertEqual(output.tool, ToolType.SUMMARY)
+        self.assertIsNone(output.summary)
+        self.router_chain.run.assert_not_called()
+        self.assertEqual(self.router_agent.path_counts["combined_summary_invalid"], 1)
+
+    def test_unparseable_response_falls_back_to_two_step_router(self):
+        self.combined_chain.run.return_value = "Sure! Here is the routing decision."
+        self.router_chain.run.return_value = '{"tool": "qa", "reasoning": "LLM decided", "reformulated_query": "q"}'
+
+        output = self.router_agent.route(RouterInput(query="What broke in the release?"))
+
+        self.assertEqual(output.tool, ToolType.QA)
+        self.assertIsNone(output.summary)
+        self.assertEqual(self.router_agent.stats()["paths"], {"combined_fallback": 1, "llm": 1})
+
 if __name__ == "__main__":
     unittest.main()
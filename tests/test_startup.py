@@ -0,0 +1,115 @@
+import threading
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import app.main as main
+from app.startup import Startup
+from app.utils.errors import NotReadyError
+
+class TestStartup(unittest.TestCase):
+
+    def test_records_each_step_and_becomes_ready(self):
+        def build(startup):
+            with startup.step("embeddings"):
+                pass
+            with startup.step("load_index"):
+                pass
+
+        startup = Startup(build, retry_after=3)
+        with self.assertRaises(NotReadyError):
+            startup.require()
+
+        startup.run()
+
+        stats = startup.stats()
+        self.assertTrue(startup.ready)
+        self.assertEqual(list(stats["components"]), ["embeddings", "load_index"])
+        self.assertIsNone(stats["current_step"])
+        startup.require()
+
+    def test_failure_is_reported_with_the_failing_step(self):
+        def build(startup):
+            with startup.step("build_index"):
+                raise RuntimeError("no documents")
+
+        startup = Startup(build)
+        startup.run()
+
+        self.assertTrue(startup.failed)
+        self.assertEqual(startup.error, "build_index: RuntimeError: no documents")
+        with self.assertRaisesRegex(NotReadyError, "Startup failed"):
+            startup.require()
+
+    def test_background_start_does_not_block(self):
+        release = threading.Event()
+
+        def build(startup):
+            with startup.step("build_index"):
+                release.wait(5)
+
+        startup = Startup(build)
+        startup.start()
+        self.assertEqual(startup.stats()["current_step"], "build_index")
+        self.assertFalse(startup.ready)
+
+        release.set()
+        self.assertTrue(startup.wait(5))
+
+    def test_start_after_preloaded_run_does_nothing(self):
+        builds = []
+        startup = Startup(lambda startup: builds.append(1))
+        startup.run()
+
+        startup.start()
+
+        self.assertTrue(startup.ready)
+        self.assertEqual(builds, [1])
+
+class TestAppStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+
+        def build(startup):
+            with startup.step("build_index"):
+                self.release.wait(5)
+
+        self.startup = Startup(build, retry_after=7)
+        patcher = patch.object(main, "startup", self.startup)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def test_query_returns_503_until_ready(self):
+        with TestClient(main.app) as client:
+            response = client.post("/query", json={"query": "What broke?"})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "7")
+            self.assertIn("build_index", response.json()["detail"])
+
+            self.assertEqual(client.get("/health").status_code, 200)
+            ready = client.get("/health/ready")
+            self.assertEqual(ready.status_code, 503)
+            self.assertEqual(ready.json()["state"], "starting")
+
+            self.release.set()
+            self.startup.wait(5)
+            ready = client.get("/health/ready")
+            self.assertEqual(ready.status_code, 200)
+            self.assertIn("build_index", ready.json()["components"])
+
+    def test_liveness_fails_after_failed_startup(self):
+        def build(startup):
+            with startup.step("embeddings"):
+                raise OSError("model not found")
+
+        with patch.object(main, "startup", Startup(build)):
+            with TestClient(main.app) as client:
+                main.startup.wait(5)
+                response = client.get("/health")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("model not found", response.json()["error"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,14 @@
+import json
+import asyncio
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from app.tools.summary_tool import SummaryTool, SummaryToolInput, SummaryToolOutput
+from app.utils.tokens import TokenCounter
+from app.utils.errors import LLMQueueFullError
 
 class TestSummaryTool(unittest.TestCase):
 
-    @patch("app.tools.summary_tool.Ollama")
+    @patch("app.tools.summary_tool.get_llm")
     @patch("app.tools.summary_tool.LLMChain")
     def setUp(self, mock_llmchain_class, mock_ollama_class):
         # Mock the LLM and LLMChain
@@ -46,5 +50,136 @@ class TestSummaryTool(unittest.TestCase):
         self.assertEqual(output.reported_issues, ["Error parsing summary"])
         self.assertEqual(output.affected_components, ["Unknown"])
 
+    def test_run_tolerates_prose_around_json(self):
+        self.mock_chain.run.return_value = (
+            'Here is the summary:\n{"reported_issues": ["Export fails"], '
+            '"affected_components": ["Export"], "severity": "High"}\nLet me know if you need more.'
+        )
+
+        output = self.summary_tool.run(SummaryToolInput(issue_text="Export fails."))
+
+        self.assertEqual(output.reported_issues, ["Export fails"])
+        self.assertEqual(self.summary_tool.parse_counter.stats()["failed"], 0)
+
+    def test_arun_uses_async_chain(self):
+        mock_result = """
+        {
+            "reported_issues": ["Dashboard does not update"],
+            "affected_components": ["Dashboard"],
+            "severity": "Medium"
+        }
+        """
+        self.mock_chain.arun = AsyncMock(return_value=mock_result)
+
+        input_data = SummaryToolInput(issue_text="The dashboard doesn't update on mobile.")
+        output = asyncio.run(self.summary_tool.arun(input_data))
+
+        self.assertEqual(output.severity, "Medium")
+        self.assertEqual(output.affected_components, ["Dashboard"])
+        self.mock_chain.run.assert_not_called()
+
+class TestSummaryMapReduce(unittest.TestCase):
+
+    @patch("app.tools.summary_tool.get_llm")
+    @patch("app.tools.summary_tool.LLMChain")
+    def setUp(self, mock_llmchain_class, mock_ollama_class):
+        self.mock_chain = MagicMock()
+        mock_llmchain_class.return_value = self.mock_chain
+        mock_ollama_class.return_value = MagicMock()
+
+        # ~4 characters per token without a tiktoken encoding
+        self.summary_tool = SummaryTool(
+            max_input_tokens=50, chunk_tokens=40, chunk_overlap=0,
+            counter=TokenCounter("missing-encoding-for-tests")
+        )
+        self.partials = {
+            "login": '{"reported_issues": ["Login fails"], "affected_components": ["Auth"], "severity": "Medium"}',
+            "export": '{"reported_issues": ["Export crashes", "login fails."], "affected_components": ["Export", "auth"], "severity": "Critical"}',
+            "search": '{"reported_issues": ["Search is slow"], "affected_components": ["Search"], "severity": "Low"}',
+        }
+
+    def chunk_result(self, issue_text):
+        for keyword, result in self.partials.items():
+            if keyword in issue_text:
+                return result
+        return "not json"
+
+    def long_report(self):
+        return "\n\n".join(
+            f"Report about {keyword}: " + "users describe the problem in detail. " * 3
+            for keyword in self.partials
+        )
+
+    def test_short_input_uses_single_call(self):
+        self.mock_chain.run.return_value = self.partials["login"]
+
+        output = self.summary_tool.run(SummaryToolInput(issue_text="Login fails on Safari."))
+
+        self.mock_chain.run.assert_called_once_with(issue_text="Login fails on Safari.")
+        self.assertEqual(output.severity, "Medium")
+
+    def test_long_input_is_summarized_per_chunk_and_merged(self):
+        calls = []
+
+        async def summarize(issue_text):
+            calls.append(issue_text)
+            await asyncio.sleep(0.01)
+            return self.chunk_result(issue_text)
+        self.mock_chain.arun = AsyncMock(side_effect=summarize)
+
+        output = asyncio.run(self.summary_tool.arun(SummaryToolInput(issue_text=self.long_report())))
+
+        self.assertGreaterEqual(len(calls), 3)
+        self.assertEqual(output.reported_issues, ["Login fails", "Export crashes", "Search is slow"])
+        self.assertEqual(output.affected_components, ["Auth", "Export", "Search"])
+        self.assertEqual(output.severity, "Critical")
+
+    def test_astream_splits_long_input_once(self):
+        self.mock_chain.arun = AsyncMock(side_effect=lambda issue_text: self.chunk_result(issue_text))
+
+        async def collect():
+            with patch.object(self.summary_tool, "split", wraps=self.summary_tool.split) as split:
+                tokens = [token async for token in self.summary_tool.astream(SummaryToolInput(issue_text=self.long_report()))]
+            return tokens, split.call_count
+
+        tokens, splits = asyncio.run(collect())
+
+        self.assertEqual(splits, 1)
+        self.assertEqual(json.loads("".join(tokens))["severity"], "Critical")
+
+    def test_sync_map_reduce_skips_unparseable_chunks(self):
+        self.partials.pop("search")
+        self.mock_chain.run.side_effect = lambda issue_text: self.chunk_result(issue_text)
+
+        output = self.summary_tool.run(SummaryToolInput(issue_text=self.long_report()))
+
+        self.assertEqual(output.reported_issues, ["Login fails", "Export crashes"])
+        self.assertEqual(output.severity, "Critical")
+
+    def test_map_is_bounded_and_survives_failed_chunks(self):
+        self.summary_tool.map_concurrency = 2
+        in_flight, peak = [0], [0]
+
+        async def summarize(issue_text):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            if "search" in issue_text:
+                raise LLMQueueFullError("LLM queue is full")
+            return self.chunk_result(issue_text)
+        self.mock_chain.arun = AsyncMock(side_effect=summarize)
+
+        output = asyncio.run(self.summary_tool.arun(SummaryToolInput(issue_text=self.long_report())))
+
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(output.reported_issues, ["Login fails", "Export crashes"])
+
+    def test_map_raises_when_every_chunk_fails(self):
+        self.mock_chain.run.side_effect = LLMQueueFullError("LLM queue is full")
+
+        with self.assertRaises(LLMQueueFullError):
+            self.summary_tool.run(SummaryToolInput(issue_text=self.long_report()))
+
 if __name__ == "__main__":
     unittest.main()